@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+测量`from subtools.ass import Ass`的导入时间
+
+使用`python -X importtime`在子进程中多次导入，取subtools.ass累计时间的
+中位数，与预算进行比较；同时检查网络、XML以及编码检测相关的依赖没有在
+导入时被加载。超出预算或者加载了这些依赖时，返回非0的退出码。
+
+使用方法：
+python benchmarks/import_time.py [-n 次数] [--budget 毫秒]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGET_MS = 30.0  # 导入时间预算（毫秒）
+# 只有在假名标注、编码检测时才需要的依赖
+LAZY_MODULES = ("requests", "xmltodict", "chardet", "urllib.request", "asyncio")
+
+STATEMENT = ("import sys; from subtools.ass import Ass; "
+             "print(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,))
+
+
+def measure():
+    """导入一次，返回subtools.ass的累计导入时间（微秒）、各模块自身时间以及被加载的依赖"""
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", STATEMENT],
+                         cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True, check=True)
+    total = None
+    self_times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        name = name.strip()
+        self_times[name] = int(self_us)
+        if name == "subtools.ass":
+            total = int(cumulative_us)
+    loaded = [m for m in res.stdout.strip().split(",") if m]
+    return total, self_times, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量subtools.ass的导入时间")
+    parser.add_argument("-n", type=int, default=10, help="测量次数")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help="导入时间预算（毫秒）")
+    args = parser.parse_args()
+
+    # 预先导入一次，生成.pyc文件
+    measure()
+    totals = []
+    self_times = {}
+    loaded = []
+    for _ in range(args.n):
+        total, self_times, loaded = measure()
+        totals.append(total / 1000)
+
+    median = statistics.median(totals)
+    print("from subtools.ass import Ass: median %.2fms, min %.2fms, max %.2fms (n=%d, budget %.2fms)"
+          % (median, min(totals), max(totals), args.n, args.budget))
+    print("slowest modules (self time, last run):")
+    for name, us in sorted(self_times.items(), key=lambda item: -item[1])[:8]:
+        print("  %8.2fms  %s" % (us / 1000, name))
+
+    failed = False
+    if loaded:
+        print("FAIL: lazily imported dependencies were loaded: %s" % ", ".join(loaded))
+        failed = True
+    if median > args.budget:
+        print("FAIL: import time exceeds budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+测量解析后每条event占用的内存
+
+分别使用intern="off"、"document"、"process"解析字幕，只保留解析得到的
+[Events]内容，使用tracemalloc统计其占用的内存，换算为每条event的字节数。
+每次测量都在新的子进程中进行，避免进程级符号表互相影响。
+
+使用方法：
+python benchmarks/memory.py [字幕文件 ...]
+"""
+
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILES = ("test/11.ass", "test/Macross Ai Oboete Imasu Ka.ass")
+MODES = ("off", "document", "process")
+
+
+def measure_events(path, intern):
+    """解析字幕，返回[Events]内容占用的字节数以及event数（在当前进程中进行）"""
+    sys.path.insert(0, ROOT)
+    from subtools.ass import Ass
+
+    gc.collect()
+    tracemalloc.start()
+    ass = Ass(intern=intern)
+    ass.from_file(path)
+    ass.parse_all()
+    events = ass.text_dict["Events"]
+    del ass
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, len(events["order"])
+
+
+def measure(path, intern):
+    """在子进程中测量一次"""
+    res = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", intern, path],
+                         cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    size, count = res.stdout.split()
+    return int(size), int(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量解析后每条event占用的内存")
+    parser.add_argument("files", nargs="*", default=FILES, help="字幕文件")
+    parser.add_argument("--child", metavar="INTERN", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print("%d %d" % measure_events(args.files[0], args.child))
+        return 0
+
+    for path in args.files:
+        print(path)
+        base = None
+        for intern in MODES:
+            size, count = measure(path, intern)
+            per_event = size / max(count, 1)
+            base = base or per_event
+            print("  intern=%-8s %6d events  %8.1f KiB  %7.1f bytes/event  (%+.1f%%)"
+                  % (intern, count, size / 1024, per_event, (per_event / base - 1) * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
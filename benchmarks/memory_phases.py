@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+按阶段测量解析字幕时占用的内存
+
+依次执行from_file、__split、parse_all、as_str、as_json，使用tracemalloc
+统计每个阶段的峰值（相对阶段开始时）以及阶段结束后仍然保留的字节数，
+并换算为每条event的字节数。
+
+__split在from_file中已经执行过一次，这里释放行列表后重新执行并单独统计，
+因此from_file的结果中也包含了行列表。as_str、as_json的保留字节数为生成的
+字符串本身。测量前会先完整执行一次，延迟导入的模块以及缓存不计入结果。
+
+测量的文件为test/下的全部.ass文件，以及将test/11.ass的event重复多次生成
+的文件（--scales）。每个文件在新的子进程中测量，避免缓存、符号表互相影响。
+
+与基准（默认为benchmarks/memory_baseline.json）比较，任何一项超出基准
+--tolerance（默认10%）并且超出64KiB时返回非0的退出码。
+
+使用方法：
+python benchmarks/memory_phases.py [--scales 4 16] [--save] [字幕文件 ...]
+"""
+
+import argparse
+import gc
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE = os.path.join(ROOT, "benchmarks", "memory_baseline.json")
+SCALE_SOURCE = "test/11.ass"
+SCALES = (4,)
+PHASES = ("from_file", "__split", "parse_all", "as_str", "as_json")
+TOLERANCE = 0.10
+NOISE_BYTES = 64 * 1024  # 小于该值的增长视为噪声
+
+
+def measure_phases(path):
+    """在当前进程中测量，返回各阶段的(峰值, 保留字节数)以及event数"""
+    sys.path.insert(0, ROOT)
+    from subtools.ass import Ass
+
+    results = {}
+
+    def run(name, func):
+        gc.collect()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        value = func()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        results[name] = (peak - start, current - start)
+        return value
+
+    # 先完整执行一次，延迟导入的模块（如chardet）以及正则表达式的缓存不计入测量结果
+    ass = Ass()
+    ass.from_file(path)
+    ass.parse_all()
+    ass.as_str()
+    ass.as_json()
+    del ass
+
+    tracemalloc.start()
+    ass = Ass()
+    run("from_file", lambda: ass.from_file(path))
+    ass._Ass__text_list = None
+    run("__split", ass._Ass__split)
+    run("parse_all", ass.parse_all)
+    text = run("as_str", ass.as_str)
+    del text
+    data = run("as_json", ass.as_json)
+    del data
+    tracemalloc.stop()
+    return results, ass.event_line_num if ass.events else 0
+
+
+def make_scaled(path, scale, directory):
+    """将path中的event重复scale次（每次平移到上一次的结束之后），生成新的文件"""
+    sys.path.insert(0, ROOT)
+    from subtools.ass import Ass
+    from subtools.utils.times import str2cs, cs2str
+
+    ass = Ass()
+    ass.from_file(path)
+    ass.parse_all()
+    events = [ass.event_[uid] for uid in ass.event_uid]
+    length = max(str2cs(event["End"]) for event in events) + 100
+    lines = ass.as_textlines()[:-len(events)]
+    for num in range(scale):
+        for event in events:
+            event = dict(event, Start=cs2str(str2cs(event["Start"]) + num * length),
+                         End=cs2str(str2cs(event["End"]) + num * length))
+            lines.append(ass.rev_event_line(event))
+    out_path = os.path.join(directory, "%s x%d.ass" % (os.path.splitext(os.path.basename(path))[0], scale))
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return out_path
+
+
+def measure(path):
+    """在子进程中测量一次，失败时返回None"""
+    res = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", path],
+                         cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if res.returncode != 0:
+        print("  error: %s" % (res.stderr.strip().splitlines() or ["?"])[-1])
+        return None
+    return json.loads(res.stdout)
+
+
+def compare(label, result, baseline, tolerance):
+    """与基准比较，返回超出基准的项目"""
+    regressions = []
+    base = baseline.get(label)
+    if not base:
+        return regressions
+    for phase in PHASES:
+        for num, metric in enumerate(("peak", "retained")):
+            old, new = base["phases"][phase][num], result["phases"][phase][num]
+            if new > old * (1 + tolerance) and new - old > NOISE_BYTES:
+                regressions.append("%s %s %s: %.1f KiB -> %.1f KiB (%+.1f%%)"
+                                   % (label, phase, metric, old / 1024, new / 1024, (new / max(old, 1) - 1) * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按阶段测量解析字幕时占用的内存")
+    parser.add_argument("files", nargs="*", help="字幕文件（默认：test/*.ass）")
+    parser.add_argument("--scales", type=int, nargs="*", default=SCALES,
+                        help="将%s重复的倍数（默认：%s）" % (SCALE_SOURCE, " ".join(map(str, SCALES))))
+    parser.add_argument("--baseline", default=BASELINE, help="基准文件")
+    parser.add_argument("--save", action="store_true", help="将结果保存为基准")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="允许超出基准的比例")
+    parser.add_argument("--child", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        phases, events = measure_phases(args.child)
+        print(json.dumps({"phases": phases, "events": events}))
+        return 0
+
+    files = args.files or sorted(os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "test", "*.ass")))
+    temp_dir = tempfile.TemporaryDirectory()
+    paths = [(path, path) for path in files]
+    for scale in args.scales:
+        scaled = make_scaled(os.path.join(ROOT, SCALE_SOURCE), scale, temp_dir.name)
+        paths.append(("%s x%d" % (SCALE_SOURCE, scale), scaled))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    with temp_dir:
+        for label, path in paths:
+            print(label)
+            result = measure(path)
+            if result is None:
+                continue
+            results[label] = result
+            events = max(result["events"], 1)
+            print("  %-10s %12s %12s %10s %10s" % ("phase", "peak KiB", "retained KiB", "peak/ev", "kept/ev"))
+            for phase in PHASES:
+                peak, retained = result["phases"][phase]
+                print("  %-10s %12.1f %12.1f %10.1f %10.1f"
+                      % (phase, peak / 1024, retained / 1024, peak / events, retained / events))
+            total = sum(result["phases"][phase][1] for phase in ("from_file", "parse_all"))
+            print("  %d events, document retains %.1f KiB (%.1f bytes/event)"
+                  % (result["events"], total / 1024, total / events))
+            regressions.extend(compare(label, result, baseline, args.tolerance))
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("\nbaseline saved: %s" % args.baseline)
+    elif not baseline:
+        print("\nno baseline found, use --save to create one")
+    for message in regressions:
+        print("FAIL: %s" % message)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
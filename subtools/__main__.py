@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+import sys
+from .cli import main
+
+sys.exit(main())
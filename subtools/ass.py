@@ -5,12 +5,16 @@
 import re
 import json
 import pickle
+from types import MappingProxyType
 from . import exceptions
-from .parselib import AssParse
+from .parselib import AssParse, PROCESS_SYMBOLS
 from .subase import Sub
 from .utils import rubi
+from .utils import tokenizer
 from .utils import data as data_utils
 from .utils import validators
+from .utils.offsets import LineIndex
+from .utils.times import str2cs
 
 
 VERSION = (0, 1, 1)
@@ -28,8 +32,19 @@ class Ass(Sub):
     __version = "v4.00+"
     VERSION = __version__  # 解析器版本
 
-    def __init__(self):
+    def __init__(self, zero_copy=False, intern="document"):
+        """
+        :param zero_copy: 是否使用零拷贝模式。零拷贝模式下只保留self.text，
+            解析得到的event、style只保存该行在self.text中的偏移量，读取字
+            段时才生成字符串，适合只读的大文件。详见utils.offsets。
+        :param intern: event中Style、Name、Layer等重复字段值的复用范围，
+            document（同一文档内复用）、process（整个进程内复用，使用
+            sys.intern）或者off（不复用）。零拷贝模式下不生效。
+        """
         super(Ass, self).__init__()
+        self.zero_copy = zero_copy
+        self.intern = intern
+        self.__symbols = {}  # 文档级的符号表
         # 整个内容的字典
         self.text_dict = {
             self.__script_header: None,
@@ -41,11 +56,18 @@ class Ass(Sub):
             "version": self.VERSION,
         }
         self.__text_list = []  # 文本列表
+        self.__token_cache = tokenizer.TokenCache()  # event Text解析结果的缓存
+        self.__layout_resolver = None  # event排版的缓存（layout.LayoutResolver），第一次使用时生成
+        self.diagnostics = None  # 最近一次解析的诊断信息（validators.Diagnostics）
 
     def reset(self):
         """重置数据"""
         self.text = ''
         self.__text_list = []
+        self.__token_cache.invalidate()
+        self.__layout_resolver = None
+        self.__symbols = {}
+        self.diagnostics = None
         self.text_dict = {
             self.__script_header: None,
             self.__garbage_header: None,
@@ -78,12 +100,12 @@ class Ass(Sub):
     @property
     def default_script_order(self):
         """字幕默认脚本标题顺序（list）"""
-        return AssParse.SCRIPT_DEFAULT_ORDER
+        return AssParse.SCRIPT_SCHEMA.order
 
     @property
     def default_garbage_order(self):
         """字幕默认非重要脚本标题顺序（list）"""
-        return AssParse.GARBAGE_DEFAULT_ORDER
+        return AssParse.SCRIPT_SCHEMA.order
 
     @property
     def style_format(self):
@@ -140,13 +162,18 @@ class Ass(Sub):
         """解析器当前版本号"""
         return self.VERSION
 
+    @property
+    def frozen(self):
+        """是否是只读的快照"""
+        return isinstance(self.text_dict, MappingProxyType)
+
     def from_file(self, path, encoding="utf-8", format=None, *args, **kwargs):
         """从文件中读取字幕内容"""
         self.text = data_utils.from_file(path, encoding)
         # 清理文件bom
         self.text = data_utils.clear_bom(self.text)
         # 验证字幕类型
-        self.__format_validator()
+        self.__format_validator(format)
         self.__split()
 
     def from_str(self, text, format=None, *args, **kwargs):
@@ -154,7 +181,7 @@ class Ass(Sub):
         # 清理文件bom
         self.text = data_utils.clear_bom(text)
         # 验证字幕类型
-        self.__format_validator()
+        self.__format_validator(format)
         self.__split()
 
     def from_bytes(self, content, encoding="utf-8", format=None, *args, **kwargs):
@@ -163,7 +190,7 @@ class Ass(Sub):
         # 清理文件bom
         self.text = data_utils.clear_bom(self.text)
         # 验证字幕类型
-        self.__format_validator()
+        self.__format_validator(format)
         self.__split()
 
     def from_json(self, data, *args, **kwargs):
@@ -174,8 +201,33 @@ class Ass(Sub):
         """导入pickle数据"""
         self.text_dict = pickle.loads(data)
 
-    def parse_all(self, *args, **kwargs):
-        """解析全部"""
+    def from_records(self, records, header=None, *args, **kwargs):
+        """
+        导入列形式的event（见records.Records），不经过文本
+
+        :param records: Records
+        :param header: 提供头部内容的Ass实例，为None时使用当前字幕已解析的头部内容，
+                       没有时使用默认的头部内容
+        """
+        from . import records as records_utils
+        if header is None and self.styles:
+            header = self
+        records_utils.from_records(records, header, ass=self)
+
+    def parse_all(self, validate="off", limit=1000, jobs=None, *args, **kwargs):
+        """
+        解析全部
+
+        validate为lenient或strict时，会在解析的同一次遍历中收集诊断信息
+        （行号、标题、字段、原因），结果保存在self.diagnostics中；strict
+        模式下存在错误时触发AssValidationError。内容由SSA、SRT转换而来时，
+        行号对应转换后的ASS内容。
+
+        :param validate: 验证级别，off|lenient|strict
+        :param limit: 最多保存的诊断信息条数
+        :param jobs: 解析event时使用的进程数，为None时根据event行数自动选择，见AssParse.event
+        """
+        report = self.__new_report(validate, limit)
         head_act_dict = {
             self.__script_header: AssParse.script,
             self.__garbage_header: AssParse.garbage,
@@ -187,39 +239,86 @@ class Ass(Sub):
         while True:
             ts = self.__get_start_index(start_index)
             if not ts: break  # 如果找不到标题，说明已经全部解析完毕
-            self.text_dict[ts[0]], start_index = head_act_dict[ts[0]](self.__text_list, ts[1])
-
-    def parse_script(self, *args, **kwargs):
-        """解析Script Info"""
+            if ts[0] == self.__event_header:
+                self.text_dict[ts[0]], start_index = AssParse.event(
+                    self.__text_list, ts[1], report=report, style_names=self.__defined_styles(report),
+                    symbols=self.__symbol_table(), jobs=jobs)
+            else:
+                self.text_dict[ts[0]], start_index = head_act_dict[ts[0]](self.__text_list, ts[1], report=report)
+        self.__check_report(report)
+
+    async def afrom_file(self, path, encoding="utf-8", format=None, executor=None, *args, **kwargs):
+        """从文件中读取字幕内容（异步），读取文件以及检测编码在executor中进行"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(executor, data_utils.from_file, path, encoding)
+        self.from_str(text, format)
+
+    async def aparse_all(self, executor=None, validate="off", limit=1000, *args, **kwargs):
+        """
+        解析全部（异步），validate和limit的含义与parse_all相同
+
+        解析在executor中进行，executor可以是ProcessPoolExecutor，这时只
+        会在进程之间传递文本内容和解析结果（包括诊断信息）。零拷贝模式下
+        event、style在进程之间传递时会转换为普通的dict，只有在线程中解析
+        时才会保存为OffsetRecord。
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        text_dict, report = await loop.run_in_executor(executor, parse_text, self.text, validate, limit,
+                                                       self.zero_copy, self.intern)
+        for title in (self.__script_header, self.__garbage_header, self.__style_header, self.__event_header):
+            if text_dict[title] is not None:
+                self.text_dict[title] = text_dict[title]
+        self.__check_report(report)
+
+    def parse_script(self, validate="off", limit=1000, *args, **kwargs):
+        """解析Script Info，validate和limit的含义与parse_all相同"""
         # 获取起始下标
         ts = self.__get_start_index(obj_title=self.__script_header)
         if not ts: return
 
-        self.text_dict[self.__script_header], end_index = AssParse.script(self.__text_list, ts[1])
+        report = self.__new_report(validate, limit)
+        self.text_dict[self.__script_header], end_index = AssParse.script(self.__text_list, ts[1], report=report)
+        self.__check_report(report)
         return end_index
 
-    def parse_garbages(self, *args, **kwargs):
-        """解析garbages"""
+    def parse_garbages(self, validate="off", limit=1000, *args, **kwargs):
+        """解析garbages，validate和limit的含义与parse_all相同"""
         ts = self.__get_start_index(obj_title=self.__garbage_header)
         if not ts: return
 
-        self.text_dict[self.__garbage_header], end_index = AssParse.garbage(self.__text_list, ts[1])
+        report = self.__new_report(validate, limit)
+        self.text_dict[self.__garbage_header], end_index = AssParse.garbage(self.__text_list, ts[1], report=report)
+        self.__check_report(report)
         return end_index
 
-    def parse_style(self, *args, **kwargs):
-        """解析style"""
+    def parse_style(self, validate="off", limit=1000, *args, **kwargs):
+        """解析style，validate和limit的含义与parse_all相同"""
         ts = self.__get_start_index(obj_title=self.__style_header)
         if not ts: return
 
-        self.text_dict[self.__style_header], end_index = AssParse.style(self.__text_list, ts[1])
+        report = self.__new_report(validate, limit)
+        self.text_dict[self.__style_header], end_index = AssParse.style(self.__text_list, ts[1], report=report)
+        self.__check_report(report)
         return end_index
 
-    def parse_event(self, *args, **kwargs):
-        """解析event"""
+    def parse_event(self, validate="off", limit=1000, jobs=None, *args, **kwargs):
+        """
+        解析event，validate、limit和jobs的含义与parse_all相同
+
+        如果已经解析了style，验证时还会检查event使用的样式是否存在。
+        """
         ts = self.__get_start_index(obj_title=self.__event_header)
         if not ts: return
 
-        self.text_dict[self.__event_header], end_index = AssParse.event(self.__text_list, ts[1])
+        report = self.__new_report(validate, limit)
+        self.text_dict[self.__event_header], end_index = AssParse.event(
+            self.__text_list, ts[1], report=report, style_names=self.__defined_styles(report),
+            symbols=self.__symbol_table(), jobs=jobs)
+        self.__check_report(report)
         return end_index
 
     def furigana(self, style_name, appid=None, garde=1, *args, **kwargs):
@@ -232,14 +331,186 @@ class Ass(Sub):
         rubi.furigana(ass=self, appid=appid, style_name=style_name, garde=garde)
         pass
 
+    def diff(self, other, *args, **kwargs):
+        """生成从当前字幕到other的补丁（dict）"""
+        from .utils import diff as diff_utils
+        return diff_utils.diff(self, other)
+
+    def apply_patch(self, patch, verify=True, *args, **kwargs):
+        """应用diff生成的补丁"""
+        from .utils import diff as diff_utils
+        diff_utils.patch(self, patch, verify)
+
+    def snapshot(self, *args, **kwargs):
+        """
+        生成只读的快照（见utils.frozen）
+
+        快照与当前字幕共用全部字符串，只复制容器。多个线程可以不加锁地同时
+        读取快照、生成文本（包括as_str(furigana=True)），当前字幕之后的修改
+        也不会影响快照。修改快照时会抛出TypeError。
+        """
+        from .utils import frozen
+        snapshot = Ass(self.zero_copy, self.intern)
+        snapshot.text = self.text
+        snapshot.text_dict = frozen.freeze(self.text_dict)
+        snapshot.__text_list = self.__text_list
+        snapshot.diagnostics = self.diagnostics
+        return snapshot
+
+    def thaw(self, *args, **kwargs):
+        """由快照（或者普通字幕）生成可以修改的副本，同样只复制容器"""
+        from .utils import frozen
+        ass = Ass(self.zero_copy, self.intern)
+        ass.text = self.text
+        ass.text_dict = frozen.thaw(self.text_dict)
+        ass.__text_list = self.__text_list
+        return ass
+
+    async def afurigana(self, style_name, appid=None, garde=1, session=None, concurrency=4, *args, **kwargs):
+        """
+        进行假名标注（异步）
+
+        :param session: aiohttp.ClientSession，为None时自动处理
+        :param concurrency: 同时请求yahoo API的最大数量
+        """
+        # 验证是否存在已经解析完成的style和event内容
+        if not self.styles or not self.events:
+            raise exceptions.NoExists("无法进行假名标注，原因：没有找到styles和events")
+        # 验证目标样式
+        style_name = validators.style_name_validator(style_name, self.style_names)
+        await rubi.afurigana(ass=self, appid=appid, style_name=style_name, grade=garde,
+                             session=session, concurrency=concurrency)
+
+    def event_tokens(self, uid, field="Text", *args, **kwargs):
+        """
+        获取event Text解析后的token列表
+
+        结果会按uid缓存，Text被修改后读取时会自动重新解析。
+
+        :param uid: event uid
+        :param field: 需要解析的字段，Text或者furigana
+        :return: token元组，见utils.tokenizer
+        """
+        return self.__token_cache.get((uid, field), self.event_[uid][field])
+
+    def plain_texts(self, uids=None, field="Text", drawing=False, *args, **kwargs):
+        """
+        批量获取去除特效标签后的纯文本
+
+        :param uids: event uid列表，为None时处理全部event
+        :param field: 需要解析的字段，Text或者furigana
+        :param drawing: 是否保留绘图指令
+        :return: uid与纯文本的字典（按event顺序）
+        """
+        uids = self.event_uid if uids is None else uids
+        return {uid: tokenizer.plain_text(self.event_tokens(uid, field), drawing)
+                for uid in uids if field in self.event_[uid]}
+
+    def karaoke_timings(self, uids=None, field="Text", *args, **kwargs):
+        """
+        批量获取每个音节的卡拉OK时间
+
+        :param uids: event uid列表，为None时处理全部event
+        :param field: 需要解析的字段，Text或者furigana
+        :return: uid与音节列表的字典，音节为(开始时间, 结束时间, 标签名, 文本)，
+                 时间为厘秒，只包含存在卡拉OK标签的event
+        """
+        uids = self.event_uid if uids is None else uids
+        timings = {}
+        for uid in uids:
+            if field not in self.event_[uid]:
+                continue
+            syllables = tokenizer.karaoke(self.event_tokens(uid, field))
+            if not syllables:
+                continue
+            start = str2cs(self.event_[uid]["Start"])
+            timings[uid] = [(start + offset, start + offset + duration, name, text)
+                            for offset, duration, name, text in syllables]
+        return timings
+
+    def font_usage(self, formats=("Dialogue",), *args, **kwargs):
+        """
+        统计字幕使用的字体以及字符（用于字体子集化），只扫描一遍event
+
+        样式按\\fn、\\b、\\i、\\r覆盖后计入，绘图指令不计入。
+
+        :param formats: 统计的event类型，为None时统计全部
+        :return: {字体名: {(粗体, 斜体): 码位集合}}
+        """
+        if not self.styles or not self.events:
+            raise exceptions.NoExists("没有找到styles和events")
+        from . import fonts
+        return fonts.font_usage(self, formats)
+
+    def layout(self, uids=None, numpy=None, *args, **kwargs):
+        """
+        批量计算event的实际排版（对齐方式、边距、字号以及定位点），见layout模块
+
+        结果会按uid缓存，样式、分辨率或者event被修改后读取时会自动重新计算。
+
+        :param uids: event uid列表，为None时处理全部event
+        :param numpy: 是否使用NumPy，为None时如果可以导入NumPy则使用
+        :return: layout.Layout
+        """
+        if not self.styles or not self.events:
+            raise exceptions.NoExists("没有找到styles和events")
+        if self.__layout_resolver is None:
+            from .layout import LayoutResolver
+            self.__layout_resolver = LayoutResolver()
+        return self.__layout_resolver.resolve(self, uids, numpy)
+
     def as_json(self, *args, **kwargs):
         """返回json序列号数据"""
-        return json.dumps(self.text_dict)
+        # 零拷贝模式下的event、style不是dict，序列化时进行转换
+        return json.dumps(self.text_dict, default=dict)
+
+    def iter_json(self, chunk_size=64 * 1024, *args, **kwargs):
+        """流式返回json序列化数据，拼接后与as_json相同，见export.iter_json"""
+        from . import export
+        return export.iter_json(self.text_dict, chunk_size=chunk_size)
+
+    def iter_json_page(self, page=0, size=100, start=None, end=None, index=None, chunk_size=64 * 1024,
+                       *args, **kwargs):
+        """
+        分页流式返回json序列化数据，见export.iter_page
+
+        :param page: 页码（从0开始）
+        :param size: 每页的event数
+        :param start: 按时间范围选择时的开始时间（厘秒）
+        :param end: 按时间范围选择时的结束时间（厘秒）
+        :param index: 按时间范围选择时使用的export.EventIndex，为None时临时生成
+        """
+        if not self.events:
+            raise exceptions.NoExists("没有找到events")
+        from . import export
+        return export.iter_page(self, page, size, start, end, index, chunk_size)
 
     def as_pickle(self, *args, **kwargs):
         """返回pickle序列号数据"""
+        if self.frozen:
+            from .utils import frozen
+            return pickle.dumps(frozen.thaw(self.text_dict))
         return pickle.dumps(self.text_dict)
 
+    def as_records(self, numpy=None, *args, **kwargs):
+        """
+        以列的形式导出event（见records.Records）
+
+        已经解析了event时使用解析结果，否则直接从Events的文本行生成，不会生成
+        每条event的dict。
+
+        :param numpy: 是否使用NumPy，为None时如果可以导入NumPy则使用
+        :return: Records
+        """
+        from . import records as records_utils
+        if self.events:
+            return records_utils.from_events(
+                self.event_format, (self.event_[uid] for uid in self.event_uid), numpy)
+        ts = self.__get_start_index(obj_title=self.__event_header)
+        if not ts:
+            raise exceptions.NoExists("没有找到events")
+        return records_utils.from_lines(self.__text_list, ts[1], numpy)
+
     def as_str(self, furigana=False, *args, **kwargs):
         """返回str字幕内容"""
         return "\n".join(self.as_textlines(furigana))
@@ -265,23 +536,24 @@ class Ass(Sub):
         return self.as_str().encode(encoding)
 
     def save2file(self, path, furigana=False, encoding="utf-8", *args, **kwargs):
-        """保存到文件中"""
-        with open(path, 'w', encoding=encoding) as f:
+        """保存到文件中，扩展名为.gz、.bz2、.xz时保存为压缩格式"""
+        with data_utils.open_write(path, encoding) as f:
             f.write(self.as_str(furigana))
 
+    async def asave2file(self, path, furigana=False, encoding="utf-8", executor=None, *args, **kwargs):
+        """保存到文件中（异步），反解析以及写入文件在executor中进行"""
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, functools.partial(self.save2file, path, furigana, encoding))
+
     def rev_script_lines(self):
         """对script info进行逆向解析"""
         textlines = []
         if self.scripts:
             textlines.append("[%s]" % self.__script_header)
-
-            for key in AssParse.SCRIPT_DEFAULT_ORDER:
-                if key in self.scripts:
-                    if key == ";":
-                        textlines.extend(
-                            ["; %s" % value for value in self.scripts[";"]["value"]])
-                    else:
-                        textlines.append("%s: %s" % (key, self.scripts[key]["value"]))
+            textlines.extend(AssParse.SCRIPT_SCHEMA.serialize(self.scripts))
         return textlines
 
     def rev_garbage_lines(self):
@@ -289,13 +561,7 @@ class Ass(Sub):
         textlines = []
         if self.garbages:
             textlines.append("[%s]" % self.__garbage_header)
-
-            for key in self.default_garbage_order:
-                if key in self.garbages:
-                    if key == ";":
-                        textlines.append("; %s" % self.garbages[key]["value"])
-                    else:
-                        textlines.append("%s: %s" % (key, self.garbages[key]["value"]))
+            textlines.extend(AssParse.SCRIPT_SCHEMA.serialize(self.garbages))
         return textlines
 
     def rev_style_lines(self):
@@ -305,9 +571,8 @@ class Ass(Sub):
             textlines.append("[%s]" % self.__style_header)
             textlines.append("Format: %s" % ", ".join(self.style_format))
 
-            for uid in self.style_uid:
-                tmp = ",".join([self.style_[uid][k] for k in self.style_format])
-                textlines.append("Style: %s" % tmp)
+            serialize = AssParse.STYLE_SCHEMA.serializer(self.style_format)
+            textlines.extend(serialize(self.style_[uid]) for uid in self.style_uid)
         return textlines
 
     def rev_event_lines(self, furigana=False):
@@ -318,33 +583,61 @@ class Ass(Sub):
         textlines.append("[%s]" % self.__event_header)
         textlines.append("Format: %s" % ", ".join(self.event_format))
 
-        # 检查是否生成furigana格式的文本内容
-        if furigana and self.is_furigana:
-            self.event_format[-1] = "furigana"
-
         if self.events:
-            tmp = self.text_dict[self.__event_header]
-            for uid in self.event_uid:
-                txt = ",".join([self.event_[uid][k] for k in self.event_format[:-1]])
-                if furigana and "furigana" in self.event_[uid]:
-                    txt = "%s,%s" % (txt, self.event_[uid]["furigana"])
-                else:
-                    txt = "%s,%s" % (txt, self.event_[uid]["Text"])
-
-                textlines.append("%s: %s" % (self.event_[uid]["Format"], txt))
-
-        if furigana and self.is_furigana:
-            self.event_format[-1] = "Text"
+            serialize = AssParse.EVENT_SCHEMA.serializer(self.event_format)
+            replace = "furigana" if furigana else None
+            textlines.extend(serialize(self.event_[uid], replace) for uid in self.event_uid)
         return textlines
 
-    def __format_validator(self, *args, **kwargs):
-        """验证字幕内容是否是合法的ASS格式"""
+    def rev_event_line(self, event, furigana=False):
+        """对单条event进行逆向解析"""
+        return AssParse.EVENT_SCHEMA.serializer(self.event_format)(event, "furigana" if furigana else None)
+
+    def __format_validator(self, format=None, *args, **kwargs):
+        """
+        验证字幕内容是否是合法的ASS格式
+
+        format为SSA、SRT（或者format为None，但内容被识别为这两种格式）时，
+        会先将内容转换为ASS格式。
+        """
+        format = (format or validators.get_format(self.text) or "ASS").upper()
+        if format in ("SSA", "SRT"):
+            from . import convert
+            self.text = convert.to_ass_text(self.text, format)
         if not validators.ass_vali(self.text):
             raise exceptions.SubFormatError("非ASS字幕格式内容")
 
+    def __new_report(self, validate="off", limit=1000):
+        """根据验证级别创建诊断信息收集器，off时返回None"""
+        if validate == "off":
+            return None
+        return validators.Diagnostics(validate, limit)
+
+    def __check_report(self, report):
+        """保存诊断信息，strict模式下存在错误时触发异常"""
+        self.diagnostics = report
+        if report is not None and report.level == "strict":
+            report.check()
+
+    def __defined_styles(self, report):
+        """验证event时使用的样式名集合，不验证或者没有解析style时为None"""
+        if report is None or not self.styles:
+            return None
+        return set(self.style_names)
+
+    def __symbol_table(self):
+        """解析event时使用的符号表"""
+        if self.intern == "document":
+            return self.__symbols
+        elif self.intern == "process":
+            return PROCESS_SYMBOLS
+        elif self.intern == "off":
+            return None
+        raise ValueError("未知的复用范围：%s" % self.intern)
+
     def __split(self, *args, **kwargs):
-        """将text转换为列表"""
-        self.__text_list = self.text.splitlines()
+        """将text转换为列表，零拷贝模式下只保存每行的偏移量"""
+        self.__text_list = LineIndex(self.text) if self.zero_copy else self.text.splitlines()
 
     def __get_start_index(self, start_index=0, obj_title=None, *args, **kwargs):
         """获取内容的起始下标"""
@@ -361,4 +654,21 @@ class Ass(Sub):
                 if re_res:
                     title = re_res.groupdict().get("title")
                     if title in self.text_dict:
-                        return title, num + 1
\ No newline at end of file
+                        return title, num + 1
+
+
+def parse_text(text, validate="off", limit=1000, zero_copy=False, intern="document", *args, **kwargs):
+    """
+    解析字幕文本（用于在executor中进行解析）
+
+    strict模式下存在错误时不在这里触发异常，由调用方检查诊断信息。
+
+    :return: (text_dict, 诊断信息)
+    """
+    ass = Ass(zero_copy, intern)
+    ass.from_str(text)
+    try:
+        ass.parse_all(validate, limit)
+    except exceptions.AssValidationError:
+        pass
+    return ass.text_dict, ass.diagnostics
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+命令行工具
+
+python -m subtools parse    [--validate strict] 文件...
+python -m subtools convert  --to srt [-o 目录] 文件...
+python -m subtools retime   --offset 1.5 [--scale 25/23.976] [--in-place] 文件...
+python -m subtools furigana --appid ID --style 样式名 文件...
+python -m subtools stats    文件...
+python -m subtools qc       [--flash-frames 3] [--gap-frames 3] 文件...
+
+文件可以是文件路径、通配符（支持**）或者目录（递归查找.ass、.ssa、.srt
+文件，以及它们的.gz、.bz2、.xz压缩文件）。使用--jobs N时在N个进程中
+并行处理。每个文件处理完成后输出该文件的耗时以及吞吐量，最后输出汇总
+结果。
+
+输出文件先写入同目录下的临时文件，完成后再替换目标文件，中途失败或者
+被中断时不会留下不完整的文件。
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from fractions import Fraction
+from .utils.data import split_compression
+
+EXTENSIONS = {".ass": "ASS", ".ssa": "SSA", ".srt": "SRT"}
+
+
+def expand_inputs(patterns, *args, **kwargs):
+    """
+    将文件路径、通配符、目录展开为文件列表（去重，保持顺序）
+
+    :param patterns: 文件路径、通配符或者目录的列表
+    :return: 文件路径列表
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if os.path.splitext(split_compression(name)[0])[1].lower() in EXTENSIONS)
+        elif glob.has_magic(pattern):
+            paths.extend(path for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path))
+        else:
+            paths.append(pattern)
+    seen = set()
+    return [path for path in paths if not (path in seen or seen.add(path))]
+
+
+def guess_format(path):
+    """根据扩展名获取字幕格式（忽略压缩扩展名），未知的扩展名视为ASS"""
+    return EXTENSIONS.get(os.path.splitext(split_compression(path)[0])[1].lower(), "ASS")
+
+
+def output_path(path, options, ext=None):
+    """
+    获取输出文件路径
+
+    --in-place时为输入文件本身；否则为--out-dir（默认为输入文件所在目录）下的
+    文件名 + --suffix + 扩展名，输入文件是压缩文件时输出文件使用相同的压缩格式。
+    """
+    if options.get("in_place"):
+        return path
+    name, compression = split_compression(os.path.basename(path))
+    stem, old_ext = os.path.splitext(name)
+    directory = options.get("out_dir") or os.path.dirname(path)
+    return os.path.join(directory, stem + (options.get("suffix") or "") + (ext or old_ext) + compression)
+
+
+##############################
+# 各子命令对单个文件的处理
+# 在工作进程中执行，返回结果信息（dict）
+##############################
+
+def _parse(path, options):
+    from .ass import Ass
+
+    ass = Ass(intern="process")
+    ass.from_file(path, options["encoding"])
+    ass.parse_all(validate=options["validate"])
+    info = {"events": ass.event_line_num if ass.events else 0}
+    if ass.diagnostics is not None:
+        info["ok"] = ass.diagnostics.ok
+        info["messages"] = ["line %s [%s] %s.%s: %s" % (item["line"], item["level"], item["section"],
+                                                        item["field"], item["reason"])
+                            for item in ass.diagnostics]
+    return info
+
+
+def _convert(path, options):
+    from .convert import convert
+    from .utils.data import atomic_open
+
+    dst_format = options["to"].upper()
+    out_path = output_path(path, dict(options, in_place=False), "." + dst_format.lower())
+    with atomic_open(out_path, options["out_encoding"]) as f:
+        count = convert(path, f, options["from"] or guess_format(path), dst_format, options["encoding"])
+    return {"events": count, "output": out_path}
+
+
+def _retime(path, options):
+    from .convert import retime
+    from .utils.data import atomic_open
+
+    out_path = output_path(path, options)
+    src_format = options["from"] or guess_format(path)
+    dst_format = guess_format(out_path) if src_format != "SSA" else "ASS"
+    with atomic_open(out_path, options["out_encoding"]) as f:
+        count = retime(path, f, options["offset"], options["scale"], src_format, dst_format, options["encoding"])
+    return {"events": count, "output": out_path}
+
+
+def _furigana(path, options):
+    from .ass import Ass
+    from .utils.data import atomic_open
+
+    ass = Ass()
+    ass.from_file(path, options["encoding"])
+    ass.parse_all()
+    ass.furigana(options["style"], options["appid"], options["grade"])
+    out_path = output_path(path, options, ".ass")
+    with atomic_open(out_path, options["out_encoding"]) as f:
+        f.write(ass.as_str(furigana=True))
+    return {"events": ass.event_line_num, "output": out_path}
+
+
+def _stats(path, options):
+    from . import convert
+    from .utils.times import str2cs
+
+    styles = {}
+    info = {"events": 0, "dialogues": 0, "comments": 0, "chars": 0, "duration": 0}
+    with convert.READERS[options["from"] or guess_format(path)](path, options["encoding"]) as reader:
+        for event in reader:
+            info["events"] += 1
+            if event["Format"] == "Dialogue":
+                info["dialogues"] += 1
+            elif event["Format"] == "Comment":
+                info["comments"] += 1
+            info["chars"] += len(event["Text"])
+            info["duration"] = max(info["duration"], str2cs(event["End"]))
+            styles[event["Style"]] = styles.get(event["Style"], 0) + 1
+    info["styles"] = styles
+    info["messages"] = ["%s: %d" % (name, count)
+                        for name, count in sorted(styles.items(), key=lambda item: -item[1])]
+    return info
+
+
+def _qc(path, options):
+    from . import convert
+    from . import qc
+
+    fps = options["fps"]
+    count = [0]
+
+    def numbered(reader):
+        # 流式读取时使用event的序号（从1开始）标识event
+        for num, event in enumerate(reader, start=1):
+            count[0] = num
+            yield num, event
+
+    with convert.READERS[options["from"] or guess_format(path)](path, options["encoding"]) as reader:
+        findings = qc.find_issues(numbered(reader),
+                                  qc.frames2cs(options["flash_frames"], fps),
+                                  qc.frames2cs(options["gap_frames"], fps),
+                                  None if options["all_formats"] else ("Dialogue",))
+    counts = {}
+    for finding in findings:
+        counts[finding["type"]] = counts.get(finding["type"], 0) + 1
+    return {"events": count[0], "ok": not findings,
+            "findings": counts, "messages": [qc.as_text(finding) for finding in findings]}
+
+
+COMMANDS = {
+    "parse": _parse,
+    "convert": _convert,
+    "retime": _retime,
+    "furigana": _furigana,
+    "stats": _stats,
+    "qc": _qc,
+}
+
+
+def run_file(command, path, options):
+    """处理单个文件，返回结果信息，出错时包含error"""
+    size = os.path.getsize(path) if os.path.isfile(path) else 0
+    start = time.perf_counter()
+    try:
+        info = COMMANDS[command](path, options)
+    except Exception as e:
+        info = {"events": 0, "ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+    info["path"] = path
+    info["seconds"] = time.perf_counter() - start
+    info["bytes"] = size
+    return info
+
+
+def run(command, paths, options, jobs=1, report=None, *args, **kwargs):
+    """
+    处理全部文件
+
+    :param command: 子命令
+    :param paths: 文件路径列表
+    :param options: 子命令的参数（dict）
+    :param jobs: 进程数，为1时在当前进程中处理
+    :param report: 每个文件处理完成后调用的函数，参数为结果信息
+    :return: 全部文件的结果信息（按完成的顺序）
+    """
+    results = []
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            results.append(run_file(command, path, options))
+            report and report(results[-1])
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(min(jobs, len(paths))) as executor:
+        futures = [executor.submit(run_file, command, path, options) for path in paths]
+        for future in as_completed(futures):
+            results.append(future.result())
+            report and report(results[-1])
+    return results
+
+
+def _throughput(events, size, seconds):
+    seconds = max(seconds, 1e-9)
+    return "%8d events %9.1f KiB %9.1f ms  %10.0f events/s %7.2f MiB/s" % (
+        events, size / 1024, seconds * 1000, events / seconds, size / 1048576 / seconds)
+
+
+def _print_result(info, verbose=False):
+    status = "FAIL" if info.get("error") or info.get("ok") is False else "ok"
+    print("%-4s %s" % (status, info["path"]))
+    print("     %s" % _throughput(info["events"], info["bytes"], info["seconds"]))
+    if info.get("error"):
+        print("     %s" % info["error"])
+    if info.get("output"):
+        print("     -> %s" % info["output"])
+    messages = info.get("messages") or []
+    for message in messages if verbose else messages[:10]:
+        print("     %s" % message)
+    if not verbose and len(messages) > 10:
+        print("     ...（另有%d条，使用-v显示全部）" % (len(messages) - 10))
+
+
+def _parse_scale(value):
+    """缩放比例，可以写成分数，如25/23.976"""
+    if "/" in value:
+        numerator, denominator = value.split("/", 1)
+        return float(Fraction(numerator) / Fraction(denominator))
+    return float(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m subtools", description="字幕批处理工具")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", nargs="+", metavar="FILE", help="文件、通配符或者目录")
+    common.add_argument("-j", "--jobs", type=int, default=1, help="并行的进程数（默认：1，0表示CPU数）")
+    common.add_argument("--encoding", default="utf-8", help="输入文件编码（无法解码时自动检测）")
+    common.add_argument("-v", "--verbose", action="store_true", help="显示全部信息")
+    common.add_argument("-q", "--quiet", action="store_true", help="只显示失败的文件以及汇总结果")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("-o", "--out-dir", help="输出目录（默认：输入文件所在目录）")
+    output.add_argument("--suffix", help="输出文件名的后缀")
+    output.add_argument("--out-encoding", default="utf-8", help="输出文件编码")
+    source = argparse.ArgumentParser(add_help=False)
+    source.add_argument("--from", dest="from", type=str.upper, choices=("ASS", "SSA", "SRT"),
+                        help="输入格式（默认：根据扩展名判断）")
+
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+    p = sub.add_parser("parse", parents=[common], help="解析并验证字幕")
+    p.add_argument("--validate", default="lenient", choices=("off", "lenient", "strict"))
+    p = sub.add_parser("convert", parents=[common, output, source], help="转换字幕格式")
+    p.add_argument("--to", type=str.upper, default="ASS", choices=("ASS", "SRT"), help="输出格式")
+    p = sub.add_parser("retime", parents=[common, output, source], help="平移、缩放字幕时间")
+    p.add_argument("--offset", type=float, default=0, help="平移的秒数，可以为负数")
+    p.add_argument("--scale", type=_parse_scale, default=1.0, help="缩放比例，如25/23.976")
+    p.add_argument("--in-place", action="store_true", help="直接修改输入文件")
+    p = sub.add_parser("furigana", parents=[common, output], help="进行假名标注")
+    p.add_argument("--appid", required=True, help="雅虎appid")
+    p.add_argument("--style", action="append", required=True, help="目标样式名，可以指定多次")
+    p.add_argument("--grade", type=int, default=1, help="注音等级(1-8)")
+    p.add_argument("--in-place", action="store_true", help="直接修改输入文件")
+    sub.add_parser("stats", parents=[common, source], help="统计字幕信息")
+    p = sub.add_parser("qc", parents=[common, source], help="检查同样式、同图层event的重叠、闪烁以及过短的间隔")
+    p.add_argument("--fps", type=_parse_scale, default=24000 / 1001, help="帧率（默认：24000/1001）")
+    p.add_argument("--flash-frames", type=int, default=0, help="持续时间短于该帧数的event视为闪烁（默认：不检查）")
+    p.add_argument("--gap-frames", type=int, default=0, help="短于该帧数的间隔视为过短（默认：不检查）")
+    p.add_argument("--all-formats", action="store_true", help="同时检查Comment")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = vars(args).copy()
+    command = options.pop("command")
+    paths = expand_inputs(options.pop("inputs"))
+    jobs = options.pop("jobs") or os.cpu_count() or 1
+    verbose, quiet = options.pop("verbose"), options.pop("quiet")
+    if "offset" in options:
+        options["offset"] = int(round(options["offset"] * 100))
+    if command in ("retime", "furigana") and not (options["in_place"] or options["suffix"] or options["out_dir"]):
+        options["suffix"] = "." + command
+    if not paths:
+        print("没有找到字幕文件", file=sys.stderr)
+        return 2
+
+    def report(info):
+        if not quiet or info.get("error") or info.get("ok") is False:
+            _print_result(info, verbose)
+
+    start = time.perf_counter()
+    results = run(command, paths, options, jobs, report)
+    seconds = time.perf_counter() - start
+
+    failed = sum(1 for info in results if info.get("error") or info.get("ok") is False)
+    print("\n%d files, %d failed, %d jobs" % (len(results), failed, jobs))
+    print("     %s" % _throughput(sum(info["events"] for info in results),
+                                  sum(info["bytes"] for info in results), seconds))
+    return 1 if failed else 0
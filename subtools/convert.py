@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+字幕格式转换
+
+转换以流的方式进行：Reader逐行读取并解析输入，Writer逐条写入输出，不
+会生成中间的text_dict。输入输出都可以是文件路径或者文本流。
+"""
+
+import io
+from . import exceptions
+from .stream import AssReader, SsaReader, SrtReader, AssWriter, SrtWriter
+from .utils.times import str2cs, cs2str
+
+READERS = {
+    "ASS": AssReader,
+    "SSA": SsaReader,
+    "SRT": SrtReader,
+}
+
+
+def convert(src, dst, src_format, dst_format="ASS", encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    转换字幕格式
+
+    :param src: 输入文件路径或者文本流
+    :param dst: 输出文件路径或者文本流
+    :param src_format: 输入格式（ASS|SSA|SRT）
+    :param dst_format: 输出格式（ASS|SRT）
+    :param encoding: 输入文件编码
+    :param out_encoding: 输出文件编码
+    :param args:
+    :param kwargs:
+    :return: 写入的event数量
+    """
+    return _write(src, dst, src_format, dst_format, encoding, out_encoding, iter)
+
+
+def retime(src, dst, offset=0, scale=1.0, src_format="ASS", dst_format=None,
+           encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    调整字幕时间（流式进行）
+
+    新的时间为：原时间 * scale + offset，小于0时为0。
+
+    :param src: 输入文件路径或者文本流
+    :param dst: 输出文件路径或者文本流
+    :param offset: 平移的厘秒数，可以为负数
+    :param scale: 缩放比例，如帧率从25转换为23.976时为25 / 23.976
+    :param src_format: 输入格式（ASS|SSA|SRT）
+    :param dst_format: 输出格式（ASS|SRT），为None时与输入格式相同（SSA输出为ASS）
+    :param encoding: 输入文件编码
+    :param out_encoding: 输出文件编码
+    :return: 写入的event数量
+    """
+    src_format = src_format.upper()
+    if dst_format is None:
+        dst_format = "SRT" if src_format == "SRT" else "ASS"
+
+    def shift(value):
+        return cs2str(round(str2cs(value) * scale) + offset)
+
+    def events(reader):
+        for event in reader:
+            event["Start"] = shift(event["Start"])
+            event["End"] = shift(event["End"])
+            yield event
+
+    return _write(src, dst, src_format, dst_format, encoding, out_encoding, events)
+
+
+def srt2ass(src, dst, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """SRT转换为ASS"""
+    return convert(src, dst, "SRT", "ASS", encoding, out_encoding)
+
+
+def ssa2ass(src, dst, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """SSA转换为ASS"""
+    return convert(src, dst, "SSA", "ASS", encoding, out_encoding)
+
+
+def ass2srt(src, dst, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """ASS转换为SRT（只包含Dialogue）"""
+    return convert(src, dst, "ASS", "SRT", encoding, out_encoding)
+
+
+def _write(src, dst, src_format, dst_format, encoding, out_encoding, events):
+    """读取src，将events(reader)返回的event逐条写入dst，返回写入的event数量"""
+    src_format, dst_format = src_format.upper(), dst_format.upper()
+    if src_format not in READERS or dst_format not in ("ASS", "SRT"):
+        raise exceptions.SubFormatError("不支持从%s转换为%s" % (src_format, dst_format))
+
+    count = 0
+    with READERS[src_format](src, encoding) as reader:
+        if dst_format == "ASS":
+            writer = AssWriter(dst, reader.header, encoding=out_encoding)
+        else:
+            writer = SrtWriter(dst, encoding=out_encoding)
+        with writer:
+            for event in events(reader):
+                writer.write_event(event)
+                count += 1
+    return count
+
+
+def to_ass_text(text, src_format, *args, **kwargs):
+    """将SSA、SRT字幕文本转换为ASS字幕文本"""
+    output = io.StringIO()
+    convert(io.StringIO(text), output, src_format, "ASS")
+    return output.getvalue()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+常驻的解析守护进程以及客户端
+
+守护进程在本地Unix socket上监听，任务交给预先启动的工作进程处理。工作
+进程启动时会导入subtools并编译常用的正则表达式，之后一直保留（包括各
+Schema缓存的正则表达式以及进程级的符号表），每个任务不需要再承担启动
+解释器、导入模块以及编译正则表达式的开销。
+
+协议：每条消息为一行json。客户端发送一条请求：
+{"op": "parse", "path": "/abs/a.ass", ...}
+守护进程返回若干条{"data": "..."}（文本结果分块返回），最后返回
+{"done": {...}}或者{"error": "...", "type": "AssParseError"}。
+
+支持的任务：
+ping                    返回守护进程信息
+parse                   解析（并验证）字幕，返回各部分数量以及诊断信息
+convert                 转换字幕格式
+dump                    解析后重新生成字幕文本
+furigana                进行假名标注
+shutdown                关闭守护进程
+
+使用方法：
+python -m subtools.daemon serve [--jobs N]
+python -m subtools.daemon parse a.ass b.ass
+python -m subtools.daemon convert a.srt a.ass --from srt
+python -m subtools.daemon dump a.ass [-o out.ass]
+
+客户端只依赖标准库中的socket和json，不会导入解析相关的模块。
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from . import exceptions
+
+CHUNK_SIZE = 64 * 1024  # 文本结果每块的字符数
+
+
+def default_socket_path():
+    """默认的socket路径，优先使用XDG_RUNTIME_DIR"""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, "subtools-%d.sock" % os.getuid())
+
+
+##############################
+# 工作进程中执行的任务
+##############################
+
+def _warm_up():
+    """工作进程的初始化：导入模块并编译默认格式的正则表达式"""
+    from .ass import Ass
+    from .stream import DEFAULT_HEADER
+    from . import convert  # noqa: F401
+
+    ass = Ass()
+    ass.from_str(DEFAULT_HEADER + "\n[Events]\nFormat: Layer, Start, End, Style, Name, "
+                 "MarginL, MarginR, MarginV, Effect, Text\n")
+    ass.parse_all()
+
+
+def _load(params):
+    """读取字幕，工作进程中的字幕共用进程级的符号表"""
+    from .ass import Ass
+
+    ass = Ass(intern="process")
+    ass.from_file(params["path"], params.get("encoding", "utf-8"), params.get("format"))
+    return ass
+
+
+def _job_parse(params):
+    ass = _load(params)
+    ass.parse_all(validate=params.get("validate", "lenient"), limit=params.get("limit", 1000))
+    diagnostics = ass.diagnostics
+    return None, {
+        "path": params["path"],
+        "styles": len(ass.style_uid or ()),
+        "events": ass.event_line_num if ass.events else 0,
+        "ok": diagnostics.ok if diagnostics is not None else True,
+        "diagnostics": list(diagnostics) if diagnostics is not None else [],
+    }
+
+
+def _job_convert(params):
+    import io
+    from . import convert
+
+    output = params.get("dst") or io.StringIO()
+    count = convert.convert(params["src"], output, params.get("from", "ASS"), params.get("to", "ASS"),
+                            params.get("encoding", "utf-8"), params.get("out_encoding", "utf-8"))
+    text = None if params.get("dst") else output.getvalue()
+    return text, {"events": count}
+
+
+def _job_dump(params):
+    ass = _load(params)
+    ass.parse_all()
+    return _output(ass, params, params.get("furigana", False))
+
+
+def _job_furigana(params):
+    ass = _load(params)
+    ass.parse_all()
+    ass.furigana(params["style"], params.get("appid"), params.get("grade", 1))
+    return _output(ass, params, True)
+
+
+def _output(ass, params, furigana):
+    """有输出路径时写入文件，否则返回文本"""
+    if params.get("output"):
+        ass.save2file(params["output"], furigana, params.get("out_encoding", "utf-8"))
+        return None, {"events": ass.event_line_num}
+    return ass.as_str(furigana), {"events": ass.event_line_num}
+
+
+JOBS = {
+    "parse": _job_parse,
+    "convert": _job_convert,
+    "dump": _job_dump,
+    "furigana": _job_furigana,
+}
+
+
+def _run_job(op, params):
+    """在工作进程中执行任务，异常转换为(错误类型, 错误信息)返回，避免pickle自定义异常"""
+    try:
+        return True, JOBS[op](params)
+    except Exception as e:
+        return False, (type(e).__name__, str(e))
+
+
+##############################
+# 守护进程
+##############################
+
+class Daemon(object):
+    """在Unix socket上监听，并将任务交给常驻的工作进程"""
+    def __init__(self, path=None, jobs=None, *args, **kwargs):
+        """
+        :param path: socket路径，为None时使用default_socket_path()
+        :param jobs: 工作进程数，为None时使用CPU数
+        """
+        self.path = path or default_socket_path()
+        self.jobs = jobs or os.cpu_count() or 1
+        self.executor = None
+        self.server = None
+
+    def serve_forever(self):
+        """启动工作进程并开始监听，直到收到shutdown请求"""
+        import socketserver
+        from concurrent.futures import ProcessPoolExecutor
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    daemon.handle(self.rfile, self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已经断开连接
+                    pass
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        self.__remove_stale_socket()
+        self.executor = ProcessPoolExecutor(self.jobs, initializer=_warm_up)
+        # 提前启动全部工作进程，第一个任务不需要等待预热
+        for future in [self.executor.submit(os.getpid) for _ in range(self.jobs)]:
+            future.result()
+        old_umask = os.umask(0o177)  # socket只允许当前用户访问
+        try:
+            self.server = Server(self.path, Handler)
+        finally:
+            os.umask(old_umask)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.executor.shutdown()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def handle(self, rfile, wfile):
+        """处理一条请求"""
+        def send(message):
+            wfile.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        line = rfile.readline()
+        if not line.strip():
+            # 只建立连接而没有发送请求（如检查守护进程是否在运行）
+            return
+        try:
+            request = json.loads(line.decode("utf-8"))
+            op = request.pop("op", None)
+        except ValueError as e:
+            send({"error": "请求格式错误：%s" % e, "type": "ValueError"})
+            return
+
+        if op == "ping":
+            send({"done": {"pid": os.getpid(), "jobs": self.jobs}})
+            return
+        if op == "shutdown":
+            send({"done": {}})
+            import threading
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if op not in JOBS:
+            send({"error": "未知的任务：%s" % op, "type": "ValueError"})
+            return
+
+        ok, result = self.executor.submit(_run_job, op, request).result()
+        if not ok:
+            send({"error": result[1], "type": result[0]})
+            return
+        text, info = result
+        if text is not None:
+            for start in range(0, len(text), CHUNK_SIZE):
+                send({"data": text[start:start + CHUNK_SIZE]})
+        send({"done": info})
+
+    def __remove_stale_socket(self):
+        """删除上次未正常退出时遗留的socket，socket仍在使用时抛出DaemonError"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise exceptions.DaemonError("守护进程已经在运行：%s" % self.path)
+
+
+##############################
+# 客户端
+##############################
+
+class Client(object):
+    """守护进程的客户端，每次请求使用一个新的连接"""
+    PATH_KEYS = ("path", "src", "dst", "output")  # 需要转换为绝对路径的参数
+
+    def __init__(self, path=None, timeout=None, *args, **kwargs):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+
+    def stream(self, op, **params):
+        """
+        发送请求，逐块返回文本结果
+
+        :return: 生成器，返回全部文本块后，生成器的返回值（StopIteration.value）为任务信息
+        """
+        for key in self.PATH_KEYS:
+            if params.get(key):
+                params[key] = os.path.abspath(params[key])
+        params["op"] = op
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                raise exceptions.DaemonError("无法连接守护进程（%s）：%s" % (self.path, e))
+            sock.sendall(json.dumps(params).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as rfile:
+                for line in rfile:
+                    message = json.loads(line.decode("utf-8"))
+                    if "data" in message:
+                        yield message["data"]
+                    elif "done" in message:
+                        return message["done"]
+                    else:
+                        raise exceptions.DaemonError("%s: %s" % (message.get("type"), message.get("error")))
+            raise exceptions.DaemonError("守护进程意外关闭了连接")
+        finally:
+            sock.close()
+
+    def call(self, op, **params):
+        """
+        发送请求并等待结果
+
+        :return: (文本结果或者None, 任务信息)
+        """
+        chunks = []
+        gen = self.stream(op, **params)
+        while True:
+            try:
+                chunks.append(next(gen))
+            except StopIteration as e:
+                return ("".join(chunks) if chunks else None), e.value
+
+    def ping(self):
+        return self.call("ping")[1]
+
+    def shutdown(self):
+        return self.call("shutdown")[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m subtools.daemon", description="subtools守护进程")
+    parser.add_argument("--socket", help="socket路径（默认：%s）" % default_socket_path())
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+
+    p = sub.add_parser("serve", help="启动守护进程")
+    p.add_argument("-j", "--jobs", type=int, help="工作进程数")
+    sub.add_parser("ping", help="检查守护进程是否在运行")
+    sub.add_parser("stop", help="关闭守护进程")
+    p = sub.add_parser("parse", help="解析并验证字幕")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--validate", default="lenient", choices=("off", "lenient", "strict"))
+    p.add_argument("--encoding", default="utf-8")
+    p = sub.add_parser("convert", help="转换字幕格式")
+    p.add_argument("src")
+    p.add_argument("dst", nargs="?", help="输出路径，省略时输出到标准输出")
+    p.add_argument("--from", dest="src_format", default="ASS")
+    p.add_argument("--to", dest="dst_format", default="ASS")
+    p.add_argument("--encoding", default="utf-8")
+    p = sub.add_parser("dump", help="解析后重新生成字幕")
+    p.add_argument("path")
+    p.add_argument("-o", "--output", help="输出路径，省略时输出到标准输出")
+    p.add_argument("--furigana", action="store_true")
+    p.add_argument("--encoding", default="utf-8")
+    p = sub.add_parser("furigana", help="进行假名标注")
+    p.add_argument("path")
+    p.add_argument("style", nargs="+", help="目标样式名")
+    p.add_argument("--appid", required=True)
+    p.add_argument("--grade", type=int, default=1)
+    p.add_argument("-o", "--output", help="输出路径，省略时输出到标准输出")
+    p.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args(argv)
+
+    client = Client(args.socket)
+    try:
+        if args.command == "serve":
+            Daemon(args.socket, args.jobs).serve_forever()
+        elif args.command == "ping":
+            print(json.dumps(client.ping()))
+        elif args.command == "stop":
+            client.shutdown()
+        elif args.command == "parse":
+            status = 0
+            for path in args.files:
+                info = client.call("parse", path=path, validate=args.validate, encoding=args.encoding)[1]
+                print("%s: %d styles, %d events" % (path, info["styles"], info["events"]))
+                for item in info["diagnostics"]:
+                    print("  line %s [%s] %s.%s: %s" % (item["line"], item["level"], item["section"],
+                                                        item["field"], item["reason"]))
+                if not info["ok"]:
+                    status = 1
+            return status
+        else:
+            if args.command == "convert":
+                gen = client.stream("convert", src=args.src, dst=args.dst, encoding=args.encoding,
+                                    **{"from": args.src_format, "to": args.dst_format})
+            else:
+                params = {"path": args.path, "output": args.output, "encoding": args.encoding}
+                if args.command == "dump":
+                    params["furigana"] = args.furigana
+                else:
+                    params.update(style=args.style, appid=args.appid, grade=args.grade)
+                gen = client.stream(args.command, **params)
+            for chunk in gen:
+                sys.stdout.write(chunk)
+    except exceptions.DaemonError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+查找、删除重复的event
+
+每条event只计算一次指纹：开始时间、结束时间、样式以及规范化后的文本的
+blake2b摘要。规范化会去除特效块，将\\N、\\n、\\h视为空格，并合并连续的空白，
+因此只有特效标签或者空白不同的event也会被视为重复。决定位置的标签（\\pos、
+\\move、\\org、\\clip、\\iclip以及\\an、\\a）会保留在指纹中，逐字排版的特效
+（只有\\pos等不同）不会被视为重复。
+
+指纹保存在dict中，查找单个字幕或者一批字幕中的重复event都只需要扫描一遍，
+不需要两两比较。DuplicateIndex只保存指纹以及第一次出现的位置，可以在多个
+字幕之间共用。
+"""
+
+import hashlib
+import re
+from .utils.times import str2cs
+from .utils.tokenizer import BLOCK_RE
+
+LINE_BREAK_RE = re.compile(r"\\[Nnh]")
+# 决定位置的标签，规范化时保留
+POSITION_TAG_RE = re.compile(r"\\(?:pos|move|org|i?clip)\([^)]*\)|\\an?\d+")
+
+
+def normalize_text(text):
+    """去除特效块（保留决定位置的标签），合并空白"""
+    plain = " ".join(LINE_BREAK_RE.sub(" ", BLOCK_RE.sub("", text)).split())
+    if "{" not in text:
+        return plain
+    tags = "".join("".join(POSITION_TAG_RE.findall(re_res.group())) for re_res in BLOCK_RE.finditer(text))
+    return "%s\x00%s" % (tags.replace(" ", ""), plain) if tags else plain
+
+
+def fingerprint(event, normalize=True):
+    """
+    计算event的指纹
+
+    :param event: event（dict）
+    :param normalize: 是否规范化文本，为False时只有完全相同的文本才视为重复
+    :return: 指纹（bytes）
+    """
+    text = normalize_text(event["Text"]) if normalize else event["Text"]
+    key = "%d\x00%d\x00%s\x00%s" % (str2cs(event["Start"]), str2cs(event["End"]), event["Style"], text)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class DuplicateIndex(object):
+    """
+    指纹与第一次出现的位置的索引
+
+    index = DuplicateIndex()
+    first = index.add(("a.ass", uid), event)  # 重复时返回第一次出现的位置，否则返回None
+    """
+    def __init__(self, normalize=True, formats=("Dialogue",), *args, **kwargs):
+        """
+        :param normalize: 是否规范化文本
+        :param formats: 检查的event类型，为None时检查全部
+        """
+        self.normalize = normalize
+        self.formats = formats
+        self.__first = {}
+
+    def __len__(self):
+        return len(self.__first)
+
+    def add(self, key, event):
+        """
+        添加event
+
+        :param key: 用于标识event的位置，如uid或者(文件, uid)
+        :return: 重复时返回第一次出现的位置，否则返回None（不检查的event类型也返回None）
+        """
+        if self.formats is not None and event["Format"] not in self.formats:
+            return None
+        digest = fingerprint(event, self.normalize)
+        first = self.__first.get(digest)
+        if first is None:
+            self.__first[digest] = key
+        return first
+
+
+def find_duplicates(ass, normalize=True, formats=("Dialogue",), index=None, *args, **kwargs):
+    """
+    查找重复的event
+
+    :param ass: 已经解析了event的Ass实例
+    :param normalize: 是否规范化文本
+    :param formats: 检查的event类型，为None时检查全部
+    :param index: 共用的DuplicateIndex，用于在多个字幕之间查找，为None时只在当前字幕中查找
+    :return: {重复event的uid: 第一次出现的位置}（按event顺序）
+    """
+    if index is None:
+        index = DuplicateIndex(normalize, formats)
+    duplicates = {}
+    for uid in ass.event_uid:
+        first = index.add(uid, ass.event_[uid])
+        if first is not None:
+            duplicates[uid] = first
+    return duplicates
+
+
+def find_duplicates_across(docs, normalize=True, formats=("Dialogue",), *args, **kwargs):
+    """
+    在一批字幕中查找重复的event，先出现的event视为原始event
+
+    :param docs: Ass实例的列表
+    :return: [((字幕下标, uid), (字幕下标, uid)), ...]，依次为重复的event以及第一次出现的位置
+    """
+    index = DuplicateIndex(normalize, formats)
+    duplicates = []
+    for num, ass in enumerate(docs):
+        for uid in ass.event_uid:
+            key = (num, uid)
+            first = index.add(key, ass.event_[uid])
+            if first is not None:
+                duplicates.append((key, first))
+    return duplicates
+
+
+def remove_duplicates(ass, normalize=True, formats=("Dialogue",), index=None, *args, **kwargs):
+    """
+    删除重复的event，保留第一次出现的event，其余event的顺序不变
+
+    传入共用的DuplicateIndex时，依次处理多个字幕会删除与之前字幕重复的event。
+
+    :return: 删除的event的uid列表
+    """
+    duplicates = find_duplicates(ass, normalize, formats, index)
+    if duplicates:
+        event_body = ass.events
+        event_body["order"] = [uid for uid in event_body["order"] if uid not in duplicates]
+        for uid in duplicates:
+            del event_body["event"][uid]
+    return list(duplicates)
@@ -28,3 +28,17 @@ class NoExists(PySubError):
 class RequestError(PySubError):
     """请求错误"""
     pass
+
+class PatchError(PySubError):
+    """应用补丁时发生错误"""
+    pass
+
+class AssValidationError(AssParseError):
+    """验证Ass内容时发现错误"""
+    def __init__(self, message, diagnostics=None):
+        super(AssValidationError, self).__init__(message)
+        self.diagnostics = diagnostics
+
+class DaemonError(PySubError):
+    """守护进程返回错误或者无法连接"""
+    pass
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+流式、分页导出json
+
+iter_json逐个event序列化，按chunk_size拼接后依次返回，拼接起来的结果与
+Ass.as_json完全相同，不会一次生成整个字符串。
+
+分页导出时，头部内容（Events以外的部分）完整输出，Events只包含选中的
+event，order为选中event的uid（按字幕中的顺序），并在最后加上分页信息：
+"page": {"offset": 第一条event的位置, "count": 本页event数, "total": event总数}
+
+按位置分页直接对order切片，不会访问之前的event；按时间范围分页使用
+EventIndex（按开始时间排序的索引，生成一次后可以重复使用，修改event后
+需要重新生成）。
+"""
+
+import json
+from bisect import bisect_left
+from .utils.times import str2cs
+
+CHUNK_SIZE = 64 * 1024  # 每次返回的字符数（近似值）
+ORDER_SLICE = 1024  # 序列化order时每次处理的uid数
+
+# 零拷贝模式下的event、style以及快照中的只读dict不是dict，序列化时进行转换；
+# 复用同一个encoder，避免每次json.dumps都重新创建
+_dumps = json.JSONEncoder(default=dict).encode
+
+
+def iter_json(text_dict, uids=None, page=None, chunk_size=CHUNK_SIZE, *args, **kwargs):
+    """
+    流式序列化text_dict
+
+    :param text_dict: Ass.text_dict
+    :param uids: 只输出这些event（list），为None时输出全部
+    :param page: 分页信息（dict），不为None时作为"page"加在最后
+    :param chunk_size: 每次返回的字符数（近似值）
+    :return: json字符串片段的迭代器
+    """
+    parts = []
+    size = 0
+    for key, section in _iter_parts(text_dict, uids, page):
+        parts.append(key)
+        parts.append(section)
+        size += len(key) + len(section)
+        if size >= chunk_size:
+            yield "".join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield "".join(parts)
+
+
+def _iter_parts(text_dict, uids, page):
+    """依次返回(分隔符以及键, 值)"""
+    items = list(text_dict.items())
+    if page is not None:
+        items.append(("page", page))
+    if not items:
+        yield "{", "}"
+        return
+    for num, (key, value) in enumerate(items):
+        prefix = "%s%s: " % ("{" if num == 0 else ", ", _dumps(key))
+        if key == "Events" and value:
+            yield from _iter_events(prefix, value, uids)
+        else:
+            yield prefix, _dumps(value)
+    yield "", "}"
+
+
+def _iter_events(prefix, event_body, uids):
+    """逐个event序列化Events部分"""
+    events = event_body["event"]
+    for num, (key, value) in enumerate(event_body.items()):
+        head = "%s%s%s: " % (prefix if num == 0 else "", "{" if num == 0 else ", ", _dumps(key))
+        if key == "event":
+            selected = event_body["order"] if uids is None else uids
+            if not selected:
+                yield head, "{}"
+                continue
+            for index, uid in enumerate(selected):
+                yield "%s%s: " % (head + "{" if index == 0 else ", ", _dumps(uid)), _dumps(events[uid])
+            yield "", "}"
+        elif key == "order":
+            yield from _iter_list(head, event_body["order"] if uids is None else uids)
+        else:
+            yield head, _dumps(value)
+    yield "", "}"
+
+
+def _iter_list(head, values):
+    """分段序列化uid列表"""
+    if not values:
+        yield head, "[]"
+        return
+    for num in range(0, len(values), ORDER_SLICE):
+        yield (head + "[" if num == 0 else ", "), _dumps(values[num:num + ORDER_SLICE])[1:-1]
+    yield "", "]"
+
+
+class EventIndex(object):
+    """
+    按开始时间排序的event索引，用于按时间范围查找event
+
+    index = EventIndex(ass)
+    offset, uids = index.time_range(0, 6000)  # 0:00:00.00-0:01:00.00之间显示的event
+    """
+    def __init__(self, ass, *args, **kwargs):
+        """
+        :param ass: 已经解析了event的Ass实例
+        """
+        self.order = ass.event_uid
+        events = ass.event_
+        items = sorted((str2cs(events[uid]["Start"]), str2cs(events[uid]["End"]), pos)
+                       for pos, uid in enumerate(self.order))
+        self.starts = [item[0] for item in items]
+        self.ends = [item[1] for item in items]
+        self.positions = [item[2] for item in items]
+        # 最长的持续时间，用于确定可能与时间范围重叠的event
+        self.max_duration = max((end - start for start, end, _ in items), default=0)
+
+    def __len__(self):
+        return len(self.order)
+
+    def slice(self, start=0, stop=None):
+        """按位置获取event的uid"""
+        return self.order[start:stop]
+
+    def time_range(self, start, end):
+        """
+        获取与时间范围重叠（开始时间早于end，并且结束时间晚于start或者开始时间
+        不早于start）的event
+
+        :param start: 开始时间（厘秒）
+        :param end: 结束时间（厘秒）
+        :return: (第一条event的位置, uid列表)，按字幕中的顺序
+        """
+        lower = bisect_left(self.starts, start - self.max_duration)
+        upper = bisect_left(self.starts, end)
+        positions = sorted(self.positions[num] for num in range(lower, upper)
+                           if self.ends[num] > start or self.starts[num] >= start)
+        return (positions[0] if positions else 0), [self.order[pos] for pos in positions]
+
+
+def iter_page(ass, page=0, size=100, start=None, end=None, index=None, chunk_size=CHUNK_SIZE,
+              *args, **kwargs):
+    """
+    分页导出json
+
+    指定了start、end时按时间范围选择event，否则按位置选择第page页（从0开始）。
+
+    :param ass: 已经解析了event的Ass实例
+    :param page: 页码
+    :param size: 每页的event数
+    :param start: 开始时间（厘秒）
+    :param end: 结束时间（厘秒）
+    :param index: 按时间选择时使用的EventIndex，为None时临时生成
+    :param chunk_size: 每次返回的字符数（近似值）
+    :return: json字符串片段的迭代器
+    """
+    order = ass.event_uid
+    if start is not None or end is not None:
+        if index is None:
+            index = EventIndex(ass)
+        start = 0 if start is None else start
+        end = float("inf") if end is None else end
+        offset, uids = index.time_range(start, end)
+    else:
+        if page < 0 or size <= 0:
+            raise ValueError("不合法的分页：page=%s, size=%s" % (page, size))
+        offset = page * size
+        uids = order[offset:offset + size]
+    info = {"offset": offset, "count": len(uids), "total": len(order)}
+    return iter_json(ass.text_dict, uids, info, chunk_size)
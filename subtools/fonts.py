@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+统计字幕实际使用的字体以及字符（用于字体子集化）
+
+只扫描一遍event：样式对应的(字体, 粗体, 斜体)预先计算并缓存，Text使用
+Ass.event_tokens缓存的token，按顺序处理特效块中的\\fn、\\b、\\i、\\r以及
+\\p（绘图指令不计入字符）。没有特效块的Text直接整体加入字符集合。
+
+结果为：{字体名: {(粗体, 斜体): 码位集合}}
+字体名去除了竖排字体的@前缀；\\h计为不换行空格（U+00A0），\\N不计入。
+"""
+
+from .utils import tokenizer
+
+NBSP = "\u00a0"
+
+
+def is_bold(value):
+    """样式或者\\b的粗体值：-1、1为粗体，其余数字视为字重，不小于700为粗体"""
+    value = value.strip()
+    if value in ("-1", "1"):
+        return True
+    return value.isdigit() and int(value) >= 700
+
+
+def is_italic(value):
+    """样式或者\\i的斜体值"""
+    return value.strip() not in ("", "0")
+
+
+def font_name(name):
+    """去除竖排字体的@前缀"""
+    return name.strip().lstrip("@")
+
+
+def clean_text(text):
+    """将Text中的转义字符转换为实际显示的字符"""
+    if "\\" not in text:
+        return text
+    return text.replace("\\N", "").replace("\\n", " ").replace("\\h", NBSP)
+
+
+class FontCollector(object):
+    """逐条添加event，统计各字体使用的字符"""
+    def __init__(self, ass, *args, **kwargs):
+        """
+        :param ass: 已经解析了style的Ass实例
+        """
+        self.ass = ass
+        self.__styles = {}  # 样式名与(字体, 粗体, 斜体)
+        for uid in ass.style_uid or ():
+            style = ass.style_[uid]
+            self.__styles[style["Name"]] = (font_name(style["Fontname"]), is_bold(style["Bold"]),
+                                            is_italic(style["Italic"]))
+        # 未定义的样式与libass一样使用Default
+        self.__default = self.__styles.get("Default") or next(iter(self.__styles.values()), None)
+        self.__chars = {}  # (字体, 粗体, 斜体)与字符集合
+
+    def chars(self, font, bold, italic):
+        """获取(字体, 粗体, 斜体)对应的字符集合"""
+        key = (font, bold, italic)
+        chars = self.__chars.get(key)
+        if chars is None:
+            chars = self.__chars[key] = set()
+        return chars
+
+    def add(self, event, tokens=None):
+        """
+        添加一条event
+
+        :param event: event（dict）
+        :param tokens: Text的token，为None时重新解析
+        """
+        text = event["Text"]
+        base = self.__styles.get(event["Style"], self.__default)
+        if base is None:
+            return
+        if "{" not in text:
+            self.chars(*base).update(clean_text(text))
+            return
+
+        font, bold, italic = base
+        drawing = False
+        for token in tokens if tokens is not None else tokenizer.tokenize(text):
+            if token[0] == tokenizer.TEXT:
+                if not drawing:
+                    self.chars(font, bold, italic).update(clean_text(token[1]))
+                continue
+            for name, arg in token[2]:
+                value = arg[0] if arg else ""
+                if name == "fn":
+                    font = font_name(value) if value.strip() else base[0]
+                elif name == "b":
+                    bold = is_bold(value) if value else base[1]
+                elif name == "i":
+                    italic = is_italic(value) if value else base[2]
+                elif name == "r":
+                    style = self.__styles.get(value.strip(), base) if value.strip() else base
+                    font, bold, italic = style
+                elif name == "p":
+                    drawing = value.strip() not in ("", "0")
+
+    def result(self):
+        """{字体名: {(粗体, 斜体): 码位集合}}"""
+        usage = {}
+        for (font, bold, italic), chars in self.__chars.items():
+            if chars:
+                usage.setdefault(font, {})[(bold, italic)] = set(map(ord, chars))
+        return usage
+
+
+def font_usage(ass, formats=("Dialogue",), *args, **kwargs):
+    """
+    统计字幕使用的字体以及字符
+
+    :param ass: 已经解析了style和event的Ass实例
+    :param formats: 统计的event类型，为None时统计全部
+    :return: {字体名: {(粗体, 斜体): 码位集合}}
+    """
+    collector = FontCollector(ass)
+    for uid in ass.event_uid:
+        event = ass.event_[uid]
+        if formats is not None and event["Format"] not in formats:
+            continue
+        text = event["Text"]
+        collector.add(event, ass.event_tokens(uid) if "{" in text else None)
+    return collector.result()
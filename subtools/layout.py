@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+批量计算event的实际排版：对齐方式、边距、字号以及定位点
+
+规则：
+1. event的MarginL、MarginR、MarginV不为0时覆盖样式的边距；
+2. 特效标签中第一个\\an（或者\\a）覆盖样式的对齐方式，第一个\\pos（或者
+   \\move的起点）决定定位点；
+3. 字号为第一段文本处生效的字号（样式的Fontsize，之后被\\fs、\\r覆盖）；
+4. 没有\\pos时，定位点根据对齐方式以及边距在PlayResX、PlayResY的范围内计算，
+   与libass相同：左对齐为MarginL，右对齐为PlayResX - MarginR，居中为左右边距
+   之间的中点；底部对齐为PlayResY - MarginV，顶部对齐为MarginV，垂直居中为
+   PlayResY / 2。
+
+样式只计算一次，每条event只需要几次dict查找；特效块只提取上述标签，不会
+完整解析整个Text（\\t的括号嵌套超过两层时除外）。结果为列的形式（见Layout），
+安装了NumPy时每列为numpy数组，否则为array.array。
+
+LayoutResolver会按uid缓存每条event的计算结果，读取时比较样式、边距以及
+Text，样式、Script Info的分辨率或者event被修改后会自动重新计算，不需要手
+动使缓存失效。
+"""
+
+import re
+from array import array
+from .records import load_numpy
+from .stream import SSA_ALIGNMENT
+from .utils import tokenizer
+
+COLUMNS = ("Alignment", "MarginL", "MarginR", "MarginV", "Fontsize", "X", "Y", "Positioned")
+TYPECODES = ("b", "q", "q", "q", "d", "d", "d", "b")
+LAYOUT_TAGS = ("an", "a", "pos", "move", "fs", "r")
+# \t(...)，括号内最多嵌套两层（如\t(\clip(...))）
+ANIMATION_RE = re.compile(r"\\t\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)")
+DEFAULT_STYLE = (2, 10, 10, 10, 20.0)  # 没有样式时使用的(对齐方式, 左、右、垂直边距, 字号)
+
+
+def play_res(ass):
+    """
+    获取字幕的分辨率，与libass相同：都没有时为384x288，只有一项时按4:3计算
+    （1280与1024互相对应）
+
+    :return: (PlayResX, PlayResY)
+    """
+    def value(key):
+        item = (ass.scripts or {}).get(key)
+        try:
+            return int(item["value"]) if item else 0
+        except ValueError:
+            return 0
+
+    x, y = value("PlayResX"), value("PlayResY")
+    if not x and not y:
+        return 384, 288
+    if not x:
+        x = 1280 if y == 1024 else y * 4 // 3
+    elif not y:
+        y = 1024 if x == 1280 else x * 3 // 4
+    return x, y
+
+
+def layout_tags(block):
+    """
+    提取特效块（不包含花括号）中与排版有关的标签，标签名的匹配规则与
+    tokenizer.parse_tags相同
+
+    :return: [(标签名, 参数元组), ...]
+    """
+    if "\\t(" in block:
+        # \t内的标签不影响排版，去除后按普通特效块处理；括号不匹配时完整解析
+        block = ANIMATION_RE.sub("", block)
+        if "\\t(" in block:
+            return [tag for tag in tokenizer.parse_tags(block) if tag[0] in LAYOUT_TAGS]
+    tags = []
+    for piece in block.split("\\")[1:]:
+        first = piece[:1]
+        if first == "p" or first == "m":
+            name = "pos" if piece.startswith("pos") else "move" if piece.startswith("move") else None
+            if name is not None:
+                arg = piece[len(name):]
+                if arg.startswith("("):
+                    tags.append((name, tokenizer.split_args(arg[1:-1] if arg.endswith(")") else arg[1:])))
+                else:
+                    tags.append((name, (arg,) if arg else ()))
+        elif first == "a":
+            if piece.startswith("an"):
+                tags.append(("an", (piece[2:],) if piece[2:] else ()))
+            elif not piece.startswith("alpha"):
+                tags.append(("a", (piece[1:],) if piece[1:] else ()))
+        elif first == "f":
+            if piece.startswith("fs") and not piece.startswith(("fscx", "fscy", "fsp")):
+                tags.append(("fs", (piece[2:],) if piece[2:] else ()))
+        elif first == "r":
+            tags.append(("r", (piece[1:],) if piece[1:] else ()))
+    return tags
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _alignment(value):
+    """样式的对齐方式，不合法时为2（底部居中）"""
+    value = _int(value, 2)
+    return value if 1 <= value <= 9 else 2
+
+
+class Layout(object):
+    """
+    列形式的排版结果
+
+    layout["X"]为定位点的x坐标列，layout.uids为对应的event uid。
+    """
+    def __init__(self, uids, columns, play_res):
+        self.uids = uids  # event uid列表
+        self.columns = columns  # 列名与列的dict
+        self.play_res = play_res  # (PlayResX, PlayResY)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def row(self, num):
+        """获取第num条event的排版（dict）"""
+        row = {key: self.columns[key][num] for key in COLUMNS}
+        row["Positioned"] = bool(row["Positioned"])
+        return row
+
+
+class LayoutResolver(object):
+    """
+    批量计算event的排版，并按uid缓存结果
+
+    resolver = LayoutResolver()
+    layout = resolver.resolve(ass)
+    """
+    def __init__(self):
+        self.__key = None  # 样式以及分辨率，与缓存的计算结果对应
+        self.__styles = {}  # 样式名与(对齐方式, 左、右、垂直边距, 字号)
+        self.__default = DEFAULT_STYLE
+        self.__play_res = (384, 288)
+        self.__rows = {}  # uid与(样式、边距、Text, 排版结果)
+
+    def invalidate(self):
+        """清除缓存"""
+        self.__key = None
+        self.__rows = {}
+
+    def resolve(self, ass, uids=None, numpy=None):
+        """
+        计算event的排版
+
+        :param ass: 已经解析了style和event的Ass实例
+        :param uids: event uid列表，为None时处理全部event
+        :param numpy: 是否使用NumPy，为None时如果可以导入NumPy则使用
+        :return: Layout
+        """
+        self.__update_styles(ass)
+        np = load_numpy(numpy)
+        events = ass.event_
+        if uids is None:
+            # 处理全部event时丢弃已经删除的event的缓存
+            uids = list(ass.event_uid)
+            old_rows, rows = self.__rows, {}
+        else:
+            uids = list(uids)
+            old_rows = rows = self.__rows
+
+        columns = [array(code) for code in TYPECODES]
+        appenders = [column.append for column in columns]
+        for uid in uids:
+            event = events[uid]
+            key = (event["Style"], event.get("MarginL"), event.get("MarginR"), event.get("MarginV"), event["Text"])
+            entry = old_rows.get(uid)
+            if entry is None or entry[0] != key:
+                entry = (key, self.__resolve(key))
+            rows[uid] = entry
+            for append, value in zip(appenders, entry[1]):
+                append(value)
+        self.__rows = rows
+
+        if np is not None:
+            columns = [np.asarray(column) for column in columns]
+        return Layout(uids, dict(zip(COLUMNS, columns)), self.__play_res)
+
+    def __update_styles(self, ass):
+        """样式或者分辨率改变时重新生成样式表，并清除缓存"""
+        key = (play_res(ass),) + tuple(
+            (style["Name"], style["Alignment"], style["MarginL"], style["MarginR"], style["MarginV"], style["Fontsize"])
+            for style in map(ass.style_.__getitem__, ass.style_uid or ()))
+        if key == self.__key:
+            return
+        self.__key = key
+        self.__play_res = key[0]
+        self.__styles = {name: (_alignment(alignment), _int(left, 0), _int(right, 0), _int(vertical, 0),
+                                _float(size, DEFAULT_STYLE[4]))
+                         for name, alignment, left, right, vertical, size in key[1:]}
+        # 未定义的样式与libass一样使用Default
+        self.__default = self.__styles.get("Default") or next(iter(self.__styles.values()), DEFAULT_STYLE)
+        self.__rows = {}
+
+    def __resolve(self, key):
+        """计算单条event的排版"""
+        style = self.__styles.get(key[0], self.__default)
+        alignment, size = style[0], style[4]
+        left, right, vertical = [_int(value, 0) or default for value, default in zip(key[1:4], style[1:4])]
+
+        pos = None
+        aligned = False  # 是否已经出现\an、\a
+        started = False  # 是否已经出现文本，之后的\fs不影响字号
+        text, end = key[4], 0
+        for re_res in (tokenizer.BLOCK_RE.finditer(text) if "{" in text else ()):
+            if re_res.start() > end:
+                started = True
+            end = re_res.end()
+            for name, args in layout_tags(re_res.group()[1:-1]):
+                if name == "an" and not aligned and args:
+                    value = _int(args[0], 0)
+                    if 1 <= value <= 9:
+                        alignment, aligned = value, True
+                elif name == "a" and not aligned and args:
+                    value = SSA_ALIGNMENT.get(args[0])
+                    if value:
+                        alignment, aligned = int(value), True
+                elif name in ("pos", "move") and pos is None and len(args) >= 2:
+                    x, y = _float(args[0], None), _float(args[1], None)
+                    if x is not None and y is not None:
+                        pos = (x, y)
+                elif name == "fs" and not started:
+                    size = _float(args[0], size) if args else style[4]
+                elif name == "r" and not started:
+                    size = self.__styles.get(args[0], style)[4] if args else style[4]
+
+        if pos is not None:
+            return alignment, left, right, vertical, size, pos[0], pos[1], 1
+        width, height = self.__play_res
+        column = (alignment - 1) % 3  # 0左 1中 2右
+        row = (alignment - 1) // 3  # 0下 1中 2上
+        x = (left, (width + left - right) / 2, width - right)[column]
+        y = (height - vertical, height / 2, vertical)[row]
+        return alignment, left, right, vertical, size, float(x), float(y), 0
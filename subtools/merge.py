@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+合并与分割ASS字幕
+
+合并时会调和各字幕的[V4+ Styles]，样式名冲突时自动重命名，并使用基于
+堆的k路归并，按开始时间交错各字幕的事件，逐条写入到输出文件中。
+
+分割时只遍历一次事件，按样式或者时间范围写入到多个输出文件中。
+"""
+
+import copy
+import heapq
+import uuid
+from . import exceptions
+from .stream import AssReader, AssWriter
+from .utils.times import str2cs
+
+
+def merge_styles(headers, *args, **kwargs):
+    """
+    合并多个字幕的样式
+
+    以第一个字幕的样式为基础，依次加入其它字幕的样式。样式名相同且内容
+    相同时只保留一个；样式名相同但内容不同时，将后者重命名为"样式名_n"。
+
+    :param headers: Ass实例列表（至少需要解析完成styles）
+    :param args:
+    :param kwargs:
+    :return: 合并后的style内容，以及每个字幕的样式重命名字典（列表）
+    """
+    style_body = copy.deepcopy(headers[0].styles)
+    formats = style_body["format"]
+    # 样式名对应的样式内容（不包含Name）
+    defined = {}
+    for uid in style_body["order"]:
+        style = style_body["style"][uid]
+        defined.setdefault(style["Name"], tuple(style[k] for k in formats if k != "Name"))
+
+    renames = [{}]
+    for header in headers[1:]:
+        rename = {}
+        for uid in header.style_uid:
+            style = header.style_[uid]
+            name = style["Name"]
+            if name in rename:
+                continue
+            try:
+                value = tuple(style[k] for k in formats if k != "Name")
+            except KeyError:
+                raise exceptions.AssParseError("合并样式时发生错误。"
+                                               "原因：样式%s的Format与第一个字幕不一致。" % name)
+
+            new_name, num = name, 1
+            while new_name in defined and defined[new_name] != value:
+                num += 1
+                new_name = "%s_%d" % (name, num)
+            if new_name != name:
+                rename[name] = new_name
+            if new_name in defined:
+                continue
+
+            defined[new_name] = value
+            # 生成uid，并验证uid是否唯一
+            while True:
+                new_uid = uuid.uuid4().hex[-6:]
+                if new_uid not in style_body["style"]: break
+            style_body["order"].append(new_uid)
+            style_body["style"][new_uid] = {k: style[k] for k in formats}
+            style_body["style"][new_uid]["Name"] = new_name
+            style_body["style_name"].append(new_name)
+        renames.append(rename)
+    return style_body, renames
+
+
+def merge(paths, out_path, presorted=False, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    合并多个ASS字幕文件
+
+    Script Info与Garbage使用第一个字幕的内容，样式通过merge_styles合并，
+    事件按开始时间进行k路归并，开始时间相同时保持输入的先后顺序。
+
+    如果各字幕的事件已经按开始时间排序，可以指定presorted=True，这时会
+    完全以流的方式处理，同一时刻每个输入只有一条事件在内存中；否则会先
+    读取每个字幕的事件行（未解析的文本）并排序。
+
+    :param paths: 输入文件路径列表
+    :param out_path: 输出文件路径
+    :param presorted: 输入的事件是否已经按开始时间排序
+    :param encoding: 输入文件编码
+    :param out_encoding: 输出文件编码
+    :param args:
+    :param kwargs:
+    :return: 写入的事件数
+    """
+    readers = []
+    try:
+        for path in paths:
+            readers.append(AssReader(path, encoding))
+        if not readers:
+            raise exceptions.NoExists("没有需要合并的字幕")
+
+        header = readers[0].header
+        header.text_dict["V4+ Styles"], renames = merge_styles([reader.header for reader in readers])
+        streams = [_event_stream(reader, rename, header.event_format, presorted)
+                   for reader, rename in zip(readers, renames)]
+
+        count = 0
+        with AssWriter(out_path, header, encoding=out_encoding) as writer:
+            for event in heapq.merge(*streams, key=lambda event: str2cs(event["Start"])):
+                writer.write_event(event)
+                count += 1
+        return count
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def split(path, route, make_path, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    单次遍历字幕事件，将其分割到多个文件中
+
+    每个输出文件都包含完整的头部内容，在第一次写入某个分组时才会创建对
+    应的文件。
+
+    :param path: 输入文件路径
+    :param route: 接收event，返回该event所属分组key的可迭代对象（可以为空）
+    :param make_path: 接收分组key，返回输出文件路径
+    :param encoding: 输入文件编码
+    :param out_encoding: 输出文件编码
+    :param args:
+    :param kwargs:
+    :return: 分组key与输出文件路径的字典
+    """
+    writers = {}
+    try:
+        with AssReader(path, encoding) as reader:
+            for event in reader:
+                for key in route(event):
+                    if key not in writers:
+                        writers[key] = AssWriter(make_path(key), reader.header, encoding=out_encoding)
+                    writers[key].write_event(event)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {key: writer.path for key, writer in writers.items()}
+
+
+def split_by_style(path, out_pattern, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    按样式分割字幕
+
+    :param path: 输入文件路径
+    :param out_pattern: 输出路径模板，如："out/ep01.%(style)s.ass"
+    :return: 样式名与输出文件路径的字典
+    """
+    def make_path(style):
+        return out_pattern % {"style": style.replace("/", "_").replace("\\", "_")}
+
+    return split(path, lambda event: (event["Style"],), make_path, encoding, out_encoding)
+
+
+def split_by_time(path, ranges, out_pattern, encoding="utf-8", out_encoding="utf-8", *args, **kwargs):
+    """
+    按时间范围分割字幕
+
+    事件的开始时间落在[start, end)内时，写入到该范围对应的文件中；时间
+    范围可以重叠，这时事件会写入到多个文件中。
+
+    :param path: 输入文件路径
+    :param ranges: 时间范围列表，如：[("0:00:00.00", "0:12:00.00"), ...]，也可以使用厘秒（int）
+    :param out_pattern: 输出路径模板，如："out/part%(index)d.ass"
+    :return: 时间范围下标与输出文件路径的字典
+    """
+    ranges = [tuple(str2cs(t) if isinstance(t, str) else t for t in range_) for range_ in ranges]
+
+    def route(event):
+        start = str2cs(event["Start"])
+        return [num for num, (s, e) in enumerate(ranges) if s <= start < e]
+
+    return split(path, route, lambda index: out_pattern % {"index": index}, encoding, out_encoding)
+
+
+def _event_stream(reader, rename, formats, presorted=False):
+    """返回单个字幕的事件流，并处理样式重命名以及Format差异"""
+    if presorted:
+        events = reader.iter_events()
+    else:
+        events = _sorted_events(reader)
+
+    same_format = reader.event_format == formats
+    for event in events:
+        if not same_format:
+            event = {k: event.get(k, "") for k in ["Format"] + formats}
+        if event["Style"] in rename:
+            event["Style"] = rename[event["Style"]]
+        yield event
+
+
+def _sorted_events(reader):
+    """读取全部事件行（不解析）并按开始时间排序，之后逐条解析返回"""
+    lines = []
+    starts = []
+    for line in reader.iter_event_lines():
+        event = reader.parse_event_line(line)
+        if event:
+            lines.append(line)
+            starts.append(str2cs(event["Start"]))
+    for num in sorted(range(len(lines)), key=starts.__getitem__):
+        yield reader.parse_event_line(lines[num])
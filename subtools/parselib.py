@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 # author: "Kairu"
 
+import os
+import random
 import re
-import uuid
-from .utils.field import Field
-from . import exceptions
+import sys
+from .utils.field import Field, KeyValueSchema, RecordSchema
+from .utils.offsets import LineIndex, OffsetRecord, RecordLayout
+from .utils.times import str2cs
+from .utils.validators import WARNING
 
 class AssParse(object):
     SCRIPT_DEFAULT_ORDER = (
@@ -42,11 +46,188 @@ class AssParse(object):
     )
     GARBAGE_DEFAULT_ORDER = SCRIPT_DEFAULT_ORDER
 
+    # script info formats
+    SCRIPT_INFO = {
+        ";": Field(r";\s?", r".*", "注释"),
+        "Title": Field(r"[\w\s]+:\s?", r".*", "标题"),
+        "Original Script": Field(r"[\w\s]+:\s?", r".*", "脚本原作"),
+        "Original Translation": Field(r"[\w\s]+:\s?", r".*", "原译者"),
+        "Original Editing": Field(r"[\w\s]+:\s?", r".*", "原编辑者"),
+        "Original Timing": Field(r"[\w\s]+:\s?", r".*", "原时间轴作者"),
+        "Synch Point": Field(r"[\w\s]+:\s?", r".*", "加载起始点"),
+        "Script Updated By": Field(r"[\w\s]+:\s?", r".*", "更新人员"),
+        "Update Details": Field(r"[\w\s]+:\s?", r".*", "更新摘要"),
+        "ScriptType": Field(r"[\w\s]+:\s?", r"v4\.00\+?", "脚本类型"),
+        "PlayResX": Field(r"[\w\s]+:\s?", r"\d{1,4}", "分辨率(宽)"),
+        "PlayResY": Field(r"[\w\s]+:\s?", r"\d{1,4}", "分辨率(高)"),
+        "PlayDepth": Field(r"[\w\s]+:\s?", r".*", "颜色深度"),
+        "Timer": Field(r"[\w\s]+:\s?", r"[\d\.,]+", "加载速度"),
+        "Video Zoom": Field(r"[\w\s]+:\s?", r"[\d\.,]+", "视频缩放"),
+        "YCbCr Matrix": Field(r"[\w\s]+:\s?", r".*", "YCbCr矩阵"),
+        "Scroll Position": Field(r"[\w\s]+:\s?", r".*", "滚动位置"),
+        "Active Line": Field(r"[\w\s]+:\s?", r"\d*", "活跃行"),
+        "Collisions": Field(r"[\w\s]+:\s?", r"Normal|Reverse", "字幕重叠方式"),
+        "WrapStyle": Field(r"[\w\s]+:\s?", r"[0-3]{1}", "换行方式"),
+        "ScaledBorderAndShadow": Field(r"[\w\s]+:\s?", r"yes|no", "同比例缩放"),
+        "Audio URI": Field(r"[\w\s]+:\s?", r".*", "音频路径"),
+        "Audio File": Field(r"[\w\s]+:\s?", r".*", "音频文件"),
+        "Video File": Field(r"[\w\s]+:\s?", r".*", "视频文件"),
+        "Video Aspect Ratio": Field(r"[\w\s]+:\s?", r"\d+", "视频纵横比"),
+        "Video Position": Field(r"[\w\s]+:\s?", r".*", "视频位置"),
+        "Video Zoom Percent": Field(r"[\w\s]+:\s?", r"[\d\.]*", "视频缩放比例"),
+        "Last Style Storage": Field(r"[\w\s]+:\s?", r".*", "Last Style Storage"),
+        "Video AR Mode":  Field(r"[\w\s]+:\s?", r".*", "AR模式"),
+        "Video AR Value": Field(r"[\w\s]+:\s?", r".*", "AR值"),
+    }
+
+    # 必选的脚本信息及其默认值
+    SCRIPT_REQUIRED = {
+        "Title": "<untitled>",
+        "Original Script": "<unknown>",
+        "ScriptType": "v4.00+",
+        "PlayResX": 640,
+        "PlayResY": 480,
+        "ScaledBorderAndShadow": "yes",
+    }
+
+    # style formats
+    STYLE_INFO = {
+        "Format": Field(r"Format:\s?", r"(?P<Format>Style):\s?", zh_title="格式"),
+        "Name": Field(r"Name", r"(?P<Name>[^,]+)", zh_title="样式名称"),
+        "Fontname": Field(r"Fontname", r"(?P<Fontname>[^,]+)", zh_title="字体"),
+        "Fontsize": Field(r"Fontsize", r"(?P<Fontsize>[\d\.]+)", zh_title="字体大小"),
+        "PrimaryColour": Field(r"PrimaryColour", r"(?P<PrimaryColour>&H[0-9a-fA-F]{8})", zh_title="主要颜色"),
+        "SecondaryColour": Field(r"SecondaryColour", r"(?P<SecondaryColour>&H[0-9a-fA-F]{8})", zh_title="次要颜色"),
+        "OutlineColour": Field(r"OutlineColour", r"(?P<OutlineColour>&H[0-9a-fA-F]{8})", zh_title="边框颜色"),
+        "BackColour": Field(r"BackColour", r"(?P<BackColour>&H[0-9a-fA-F]{8})", zh_title="阴影颜色"),
+        "Bold": Field(r"Bold", r"(?P<Bold>0|-1)", zh_title="粗体"),
+        "Italic": Field(r"Italic", r"(?P<Italic>0|-1)", zh_title="斜体"),
+        "Underline": Field(r"Underline", r"(?P<Underline>0|-1)", zh_title="下划线"),
+        "StrikeOut": Field(r"StrikeOut", r"(?P<StrikeOut>0|-1)", zh_title="删除线"),
+        "ScaleX": Field(r"ScaleX", r"(?P<ScaleX>[\d\.]+)", zh_title="文字水平缩放"),
+        "ScaleY": Field(r"ScaleY", r"(?P<ScaleY>[\d\.]+)", zh_title="文字垂直缩放"),
+        "Spacing": Field(r"Spacing", r"(?P<Spacing>[\d\.]+)", zh_title="文字间距"),
+        "Angle": Field(r"Angle", r"(?P<Angle>[\d\.\-]+)", zh_title="旋转"),
+        "BorderStyle": Field(r"BorderStyle", r"(?P<BorderStyle>[\d\.]+)", zh_title="轮廓风格"),
+        "Outline": Field(r"Outline", r"(?P<Outline>[\d\.]+)", zh_title="轮廓宽度"),
+        "Shadow": Field(r"Shadow", r"(?P<Shadow>[\d\.]+)", zh_title="阴影深度"),
+        "Alignment": Field(r"Alignment", r"(?P<Alignment>[\d]+)", zh_title="对齐"),
+        "MarginL": Field(r"MarginL", r"(?P<MarginL>[\d\.]+)", zh_title="左边距"),
+        "MarginR": Field(r"MarginR", r"(?P<MarginR>[\d\.]+)", zh_title="右边距"),
+        "MarginV": Field(r"MarginV", r"(?P<MarginV>[\d\.]+)", zh_title="垂直边距"),
+        "Encoding": Field(r"Encoding", r"(?P<Encoding>[\d]+)", zh_title="编码"),
+    }
+
+    # SSA（V4 Styles）style formats
+    SSA_STYLE_INFO = {
+        "Name": Field(r"Name", r"(?P<Name>[^,]+)", zh_title="样式名称"),
+        "Fontname": Field(r"Fontname", r"(?P<Fontname>[^,]+)", zh_title="字体"),
+        "Fontsize": Field(r"Fontsize", r"(?P<Fontsize>[\d\.]+)", zh_title="字体大小"),
+        "PrimaryColour": Field(r"PrimaryColour", r"(?P<PrimaryColour>&H[0-9a-fA-F]+|-?\d+)", zh_title="主要颜色"),
+        "SecondaryColour": Field(r"SecondaryColour", r"(?P<SecondaryColour>&H[0-9a-fA-F]+|-?\d+)", zh_title="次要颜色"),
+        "TertiaryColour": Field(r"TertiaryColour", r"(?P<TertiaryColour>&H[0-9a-fA-F]+|-?\d+)", zh_title="边框颜色"),
+        "BackColour": Field(r"BackColour", r"(?P<BackColour>&H[0-9a-fA-F]+|-?\d+)", zh_title="阴影颜色"),
+        "Bold": Field(r"Bold", r"(?P<Bold>-?\d+)", zh_title="粗体"),
+        "Italic": Field(r"Italic", r"(?P<Italic>-?\d+)", zh_title="斜体"),
+        "BorderStyle": Field(r"BorderStyle", r"(?P<BorderStyle>[\d\.]+)", zh_title="轮廓风格"),
+        "Outline": Field(r"Outline", r"(?P<Outline>[\d\.]+)", zh_title="轮廓宽度"),
+        "Shadow": Field(r"Shadow", r"(?P<Shadow>[\d\.]+)", zh_title="阴影深度"),
+        "Alignment": Field(r"Alignment", r"(?P<Alignment>[\d]+)", zh_title="对齐"),
+        "MarginL": Field(r"MarginL", r"(?P<MarginL>[\d\.]+)", zh_title="左边距"),
+        "MarginR": Field(r"MarginR", r"(?P<MarginR>[\d\.]+)", zh_title="右边距"),
+        "MarginV": Field(r"MarginV", r"(?P<MarginV>[\d\.]+)", zh_title="垂直边距"),
+        "AlphaLevel": Field(r"AlphaLevel", r"(?P<AlphaLevel>[\d]+)", zh_title="透明度"),
+        "Encoding": Field(r"Encoding", r"(?P<Encoding>[\d]+)", zh_title="编码"),
+    }
+
+    # event类型
+    EVENT_TYPES = ("Dialogue", "Comment", "Picture", "Sound", "Movie", "Command",)
+    # event formats
+    EVENT_INFO = {
+        "Format": Field(re_val=r"(?P<Format>%s):\s?" % "|".join(EVENT_TYPES), zh_title="格式"),
+        "Marked": Field(re_val=r"(?P<Marked>(?:Marked=)?\d+)", zh_title="标记"),
+        "Layer": Field(re_val=r"(?P<Layer>\d+)", zh_title="图层"),
+        "Start": Field(re_val=r"(?P<Start>\d{1,2}:(?:5\d|[0-4]\d):(?:5\d|[0-4]\d).(?:9\d{1,2}|[0-8]\d{1,2}))", zh_title="开始时间"),
+        "End": Field(re_val=r"(?P<End>\d{1,2}:(?:5\d|[0-4]\d):(?:5\d|[0-4]\d).(?:9\d{1,2}|[0-8]\d{1,2}))", zh_title="结束时间"),
+        "Style": Field(re_val=r"(?P<Style>[^,]+)", zh_title="样式"),
+        "Name": Field(re_val=r"(?P<Name>[^,]*)", zh_title="角色名"),
+        "MarginL": Field(re_val=r"(?P<MarginL>\d+)", zh_title="左边距"),
+        "MarginR": Field(re_val=r"(?P<MarginR>\d+)", zh_title="右边距"),
+        "MarginV": Field(re_val=r"(?P<MarginV>\d+)", zh_title="垂直边距"),
+        "Effect": Field(re_val=r"(?P<Effect>[^,]*)", zh_title="过渡特效"),
+        "Text": Field(re_val=r"(?P<Text>.*)", zh_title="对白字幕"),
+    }
+
+    # 取值种类很少、在event之间大量重复的字段，解析时会通过符号表复用同一个字符串对象
+    INTERN_FIELDS = ("Format", "Marked", "Layer", "Style", "Name", "MarginL", "MarginR", "MarginV", "Effect")
+    # event行数超过该值时，自动使用多进程进行解析
+    PARALLEL_MIN_LINES = 100000
+
+    # 编译后的字段定义，四个部分的解析以及反向解析共用
+    SCRIPT_SCHEMA = KeyValueSchema(SCRIPT_INFO, SCRIPT_DEFAULT_ORDER, SCRIPT_REQUIRED)
+    STYLE_SCHEMA = RecordSchema(STYLE_INFO, r"Style:\s?", "Style", head="Style")
+    SSA_STYLE_SCHEMA = RecordSchema(SSA_STYLE_INFO, r"Style:\s?", "Style", head="Style")
+    EVENT_SCHEMA = RecordSchema(EVENT_INFO, EVENT_INFO["Format"].re_val, "event", last="Text")
+
     def __init__(self):
         pass
 
     @staticmethod
-    def script(textlist, start_index=0, set_default=True, *args, **kwargs):
+    def style_matcher(format_line, info=None, *args, **kwargs):
+        """
+        根据style的Format行生成用于匹配style行的正则表达式
+
+        当Format行不合法，或者Format的内容项存在不合法内容时，触发异常。
+
+        :param format_line: Format行内容
+        :param info: 字段定义，默认为STYLE_INFO，解析SSA时使用SSA_STYLE_INFO
+        :param args:
+        :param kwargs:
+        :return: format列表和编译好的正则表达式
+        """
+        return AssParse.style_schema(info).matcher(format_line)
+
+    @staticmethod
+    def style_schema(info=None, *args, **kwargs):
+        """获取字段定义info对应的RecordSchema"""
+        if info is None or info is AssParse.STYLE_INFO:
+            return AssParse.STYLE_SCHEMA
+        elif info is AssParse.SSA_STYLE_INFO:
+            return AssParse.SSA_STYLE_SCHEMA
+        return RecordSchema(info, r"Style:\s?", "Style", head="Style")
+
+    @staticmethod
+    def event_matcher(format_line, *args, **kwargs):
+        """
+        根据event的Format行生成用于匹配event行的正则表达式
+
+        当Format行不合法，Format的内容项存在不合法内容，或者最后一项
+        不是Text时，触发异常。
+
+        :param format_line: Format行内容
+        :param args:
+        :param kwargs:
+        :return: format列表和编译好的正则表达式
+        """
+        return AssParse.EVENT_SCHEMA.matcher(format_line)
+
+    @staticmethod
+    def register_script_key(key, re_val=r".*", zh_title="", default=None, *args, **kwargs):
+        """
+        注册自定义的Script Info键
+
+        注册后解析Script Info、Garbage时会保留该键，反向解析时该键位于已
+        有键之后。
+
+        :param key: 键名，只能包含字母、数字、下划线以及空格
+        :param re_val: 值的正则表达式
+        :param zh_title: 中文名称
+        :param default: 默认值，不为None时该键为必选项
+        """
+        AssParse.SCRIPT_SCHEMA.register(key, re_val, zh_title, default)
+
+    @staticmethod
+    def script(textlist, start_index=0, set_default=True, report=None, section="Script Info", *args, **kwargs):
         """
         解析Script的内容，不包含[Script Info]行。
 
@@ -64,53 +245,14 @@ class AssParse(object):
         :param textlist: 字幕文本列表
         :param start_index: 起始下标
         :param set_default: 是否设置默认值
+        :param report: validators.Diagnostics实例，为None时不收集诊断信息
+        :param section: 标题（用于诊断信息）
         :param args:
         :param kwargs:
         :return: 解析到的该项数据和结束下标
         """
-        SCRIPT_INFO = {
-            ";": Field(r";\s?", r".*", "注释"),
-            "Title": Field(r"[\w\s]+:\s?", r".*", "标题"),
-            "Original Script": Field(r"[\w\s]+:\s?", r".*", "脚本原作"),
-            "Original Translation": Field(r"[\w\s]+:\s?", r".*", "原译者"),
-            "Original Editing": Field(r"[\w\s]+:\s?", r".*", "原编辑者"),
-            "Original Timing": Field(r"[\w\s]+:\s?", r".*", "原时间轴作者"),
-            "Synch Point": Field(r"[\w\s]+:\s?", r".*", "加载起始点"),
-            "Script Updated By": Field(r"[\w\s]+:\s?", r".*", "更新人员"),
-            "Update Details": Field(r"[\w\s]+:\s?", r".*", "更新摘要"),
-            "ScriptType": Field(r"[\w\s]+:\s?", r"v4\.00+", "脚本类型"),
-            "PlayResX": Field(r"[\w\s]+:\s?", r"\d{1,4}", "分辨率(宽)"),
-            "PlayResY": Field(r"[\w\s]+:\s?", r"\d{1,4}", "分辨率(高)"),
-            "PlayDepth": Field(r"[\w\s]+:\s?", r".*", "颜色深度"),
-            "Timer": Field(r"[\w\s]+:\s?", r"[\d\.,]+", "加载速度"),
-            "Video Zoom": Field(r"[\w\s]+:\s?", r"[\d\.,]+", "视频缩放"),
-            "YCbCr Matrix": Field(r"[\w\s]+:\s?", r".*", "YCbCr矩阵"),
-            "Scroll Position": Field(r"[\w\s]+:\s?", r".*", "滚动位置"),
-            "Active Line": Field(r"[\w\s]+:\s?", r"\d*", "活跃行"),
-            "Collisions": Field(r"[\w\s]+:\s?", r"Normal|Reverse", "字幕重叠方式"),
-            "WrapStyle": Field(r"[\w\s]+:\s?", r"[0-3]{1}", "换行方式"),
-            "ScaledBorderAndShadow": Field(r"[\w\s]+:\s?", r"yes|no", "同比例缩放"),
-            "Audio URI": Field(r"[\w\s]+:\s?", r".*", "音频路径"),
-            "Audio File": Field(r"[\w\s]+:\s?", r".*", "音频文件"),
-            "Video File": Field(r"[\w\s]+:\s?", r".*", "视频文件"),
-            "Video Aspect Ratio": Field(r"[\w\s]+:\s?", r"\d+", "视频纵横比"),
-            "Video Position": Field(r"[\w\s]+:\s?", r".*", "视频位置"),
-            "Video Zoom Percent": Field(r"[\w\s]+:\s?", r"[\d\.]*", "视频缩放比例"),
-            "Last Style Storage": Field(r"[\w\s]+:\s?", r".*", "Last Style Storage"),
-            "Video AR Mode":  Field(r"[\w\s]+:\s?", r".*", "AR模式"),
-            "Video AR Value": Field(r"[\w\s]+:\s?", r".*", "AR值"),
-            }
-
-        # 脚本信息，包含必要信息
-        SCRIPT_REQUIRED = {
-            "Title": "<untitled>",
-            "Original Script": "<unknown>",
-            "ScriptType": "v4.00+",
-            "PlayResX": 640,
-            "PlayResY": 480,
-            "ScaledBorderAndShadow": "yes",
-        }
-
+        schema = AssParse.SCRIPT_SCHEMA
+        values = schema.values
         script_body = {";": {"value": []}} if set_default else {}
 
         end_index = -1  # 读取到下一个标题时的下标
@@ -121,50 +263,53 @@ class AssParse(object):
                 end_index = num
                 break
             # 检查标题是否是合法标题
-            re_res = re.search(r"^(?P<key>;)\s?.*$", line) \
-                if line.startswith(";") \
-                else re.search(r"^(?P<key>[\w\s]+):\s?.*$", line)
+            re_res = schema.match(line)
             if not re_res:
+                if report is not None:
+                    report.add(num + 1, section, None, "不是合法的键值行")
                 continue
 
-            key = re_res.groupdict().get("key")
+            key, value = re_res
             # 检查Key值是否合法
-            if key not in SCRIPT_INFO:
+            if key not in values:
+                if report is not None:
+                    report.add(num + 1, section, key, "未知的键，该行已被忽略", WARNING)
                 continue
 
-            re_res = re.search(r"^%s(?P<value>%s)$" % (SCRIPT_INFO[key].re_key,SCRIPT_INFO[key].re_val),line)
-            if not re_res:
+            if not values[key].fullmatch(value):
+                if report is not None:
+                    report.add(num + 1, section, key, "值不合法")
                 continue
 
             order += 1
-            re_res = re_res.groupdict()
             if key == ";":
                 # ;的值可能存在多个，这里使用列表存储它的值
-                script_body[key]["value"].append(re_res.get("value"))
+                script_body.setdefault(key, {"value": []})
+                script_body[key]["value"].append(value)
                 script_body[key]["order"] = order,
-                script_body[key]["zh_title"] = SCRIPT_INFO[key].zh_title
+                script_body[key]["zh_title"] = schema.fields[key].zh_title
             else:
                 script_body[key] = {
-                    "value": re_res.get("value"),
+                    "value": value,
                     "order": order,
-                    "zh_title": SCRIPT_INFO[key].zh_title,
+                    "zh_title": schema.fields[key].zh_title,
                 }
 
         if set_default:
             # 验证是否存在必选内容
-            for key in SCRIPT_REQUIRED:
+            for key in schema.defaults:
                 if key in script_body:
                     # 如果有必选项，则跳过
                     continue
                 order += 1
-                script_body[key] = {"value": SCRIPT_REQUIRED[key],
+                script_body[key] = {"value": schema.defaults[key],
                                     "order": order,
-                                    "zh_title": SCRIPT_INFO[key].zh_title
+                                    "zh_title": schema.fields[key].zh_title
                                     }
         return script_body, end_index
 
     @staticmethod
-    def garbage(textlist, start_index=0, *args, **kwargs):
+    def garbage(textlist, start_index=0, report=None, *args, **kwargs):
         """
         解析Garbage
 
@@ -172,14 +317,15 @@ class AssParse(object):
 
         :param textlist: 字幕文本列表
         :param start_index: 起始下标
+        :param report: validators.Diagnostics实例，为None时不收集诊断信息
         :param args:
         :param kwargs:
         :return: 解析到的该项数据和结束下标
         """
-        return AssParse.script(textlist, start_index, False)
+        return AssParse.script(textlist, start_index, False, report, "Aegisub Project Garbage")
 
     @staticmethod
-    def style(textlist,  start_index=0, *args, **kwargs):
+    def style(textlist,  start_index=0, info=None, report=None, *args, **kwargs):
         """
         解析style的内容，format和style行，不包含[V4+ Styles]行
 
@@ -204,56 +350,18 @@ class AssParse(object):
 
         :param textlist: 字幕文本列表
         :param start_index: 起始下标
+        :param info: 字段定义，默认为STYLE_INFO，解析SSA时使用SSA_STYLE_INFO
+        :param report: validators.Diagnostics实例，为None时不收集诊断信息
         :param args:
         :param kwargs:
         :return: 解析到的该项数据和结束下标
         """
-        STYLE_INFO = {
-            "Format": Field(r"Format:\s?", r"(?P<Format>Style):\s?", zh_title="格式"),
-            "Name": Field(r"Name", r"(?P<Name>[^,]+)", zh_title="样式名称"),
-            "Fontname": Field(r"Fontname", r"(?P<Fontname>[^,]+)", zh_title="字体"),
-            "Fontsize": Field(r"Fontsize", r"(?P<Fontsize>[\d\.]+)", zh_title="字体大小"),
-            "PrimaryColour": Field(r"PrimaryColour", r"(?P<PrimaryColour>&H[0-9a-fA-F]{8})", zh_title="主要颜色"),
-            "SecondaryColour": Field(r"SecondaryColour", r"(?P<SecondaryColour>&H[0-9a-fA-F]{8})", zh_title="次要颜色"),
-            "OutlineColour": Field(r"OutlineColour", r"(?P<OutlineColour>&H[0-9a-fA-F]{8})", zh_title="边框颜色"),
-            "BackColour": Field(r"BackColour", r"(?P<BackColour>&H[0-9a-fA-F]{8})", zh_title="阴影颜色"),
-            "Bold": Field(r"Bold", r"(?P<Bold>0|-1)", zh_title="粗体"),
-            "Italic": Field(r"Italic", r"(?P<Italic>0|-1)", zh_title="斜体"),
-            "Underline": Field(r"Underline", r"(?P<Underline>0|-1)", zh_title="下划线"),
-            "StrikeOut": Field(r"StrikeOut", r"(?P<StrikeOut>0|-1)", zh_title="删除线"),
-            "ScaleX": Field(r"ScaleX", r"(?P<ScaleX>[\d\.]+)", zh_title="文字水平缩放"),
-            "ScaleY": Field(r"ScaleY", r"(?P<ScaleY>[\d\.]+)", zh_title="文字垂直缩放"),
-            "Spacing": Field(r"Spacing", r"(?P<Spacing>[\d\.]+)", zh_title="文字间距"),
-            "Angle": Field(r"Angle", r"(?P<Angle>[\d\.\-]+)", zh_title="旋转"),
-            "BorderStyle": Field(r"BorderStyle", r"(?P<BorderStyle>[\d\.]+)", zh_title="轮廓风格"),
-            "Outline": Field(r"Outline", r"(?P<Outline>[\d\.]+)", zh_title="轮廓宽度"),
-            "Shadow": Field(r"Shadow", r"(?P<Shadow>[\d\.]+)", zh_title="阴影深度"),
-            "Alignment": Field(r"Alignment", r"(?P<Alignment>[\d]+)", zh_title="对齐"),
-            "MarginL": Field(r"MarginL", r"(?P<MarginL>[\d\.]+)", zh_title="左边距"),
-            "MarginR": Field(r"MarginR", r"(?P<MarginR>[\d\.]+)", zh_title="右边距"),
-            "MarginV": Field(r"MarginV", r"(?P<MarginV>[\d\.]+)", zh_title="垂直边距"),
-            "Encoding": Field(r"Encoding", r"(?P<Encoding>[\d]+)", zh_title="编码"),
-        }
-
-
         end_index = -1  # 读取到下一个标题时的下标
-        val_re = r""
 
         # 检查第一行是否是合法的Format内容
-        if textlist[start_index].startswith("Format:"):
-            formats = textlist[start_index][len("Format:"):].split(",")
-            for num, format_ in enumerate(formats):
-                formats[num] = format_.strip()
-                if formats[num] not in STYLE_INFO:
-                    raise exceptions.AssParseError("解析ASS文件Style时发生错误。"
-                                                   "原因：Format的内容相存在不合法项目或无效项目。")
-                if num == len(formats) - 1:
-                    val_re = "%s%s" % (val_re, STYLE_INFO[formats[num]].re_val)
-                else:
-                    val_re = r"%s%s,\s?" % (val_re, STYLE_INFO[formats[num]].re_val)
-        else:
-            raise exceptions.AssParseError("解析ASS文件Style时发生错误。"
-                                           "原因：没有找到Format行内容。")
+        formats, matcher = AssParse.style_matcher(textlist[start_index], info)
+        # textlist为LineIndex时（零拷贝模式），style只保存偏移量
+        layout = RecordLayout(textlist.text, matcher) if isinstance(textlist, LineIndex) else None
 
         style_body = {
             "format": formats,
@@ -268,25 +376,28 @@ class AssParse(object):
                 end_index = num
                 break
 
-            re_res = re.search(r"^Style:\s?%s$" % val_re, line)
+            re_res = matcher.search(line)
             if not re_res:
+                if report is not None:
+                    report.add(num + 1, "V4+ Styles", *AssParse.style_schema(info).diagnose(line, formats))
                 continue
 
-            # 生成uid，并验证uid是否唯一
-            while True:
-                uid = uuid.uuid4().hex[-6:]
-                if uid not in style_body["order"]: break
+            uid = _new_uid(style_body["style"])
 
             style_body["order"].append(uid)
-            style_body["style"][uid] = re_res.groupdict()
-            if style_body["style"][uid]["Name"] not in style_body["style_name"]:
-                style_body["style_name"].append(style_body["style"][uid]["Name"])
+            style_body["style"][uid] = re_res.groupdict() if layout is None \
+                else OffsetRecord(layout, *textlist.span(num))
+            if re_res.group("Name") not in style_body["style_name"]:
+                style_body["style_name"].append(re_res.group("Name"))
+            elif report is not None:
+                report.add(num + 1, "V4+ Styles", "Name", "样式名重复", WARNING)
             # style_body["style"].append(re_res.groupdict())
 
         return style_body, end_index
 
     @staticmethod
-    def event(textlist, start_index=0, *args, **kwargs):
+    def event(textlist, start_index=0, report=None, style_names=None, symbols=None, jobs=None, executor=None,
+              *args, **kwargs):
         """
         解析event内容
 
@@ -306,81 +417,208 @@ class AssParse(object):
         该行的唯一标识符，uuid还会存入一个order的列表中，方便反向生成数
         据，以及快速找到并修改指定内容（前端发起修改时）。
 
+        传入report时，会在同一次遍历中收集不合法行的诊断信息；同时传入
+        style_names时，还会检查event使用的样式是否存在。
+
+        传入symbols（dict或者PROCESS_SYMBOLS）时，INTERN_FIELDS中的字段
+        值会通过symbols.setdefault(value, value)复用已有的字符串对象。
+
+        event行数超过PARALLEL_MIN_LINES，并且存在多个CPU时，会将event行
+        分块，在进程池中进行匹配，之后在当前进程中按原来的顺序合并结果并
+        生成uid。jobs为1时总是在当前进程中解析；jobs大于1时总是使用jobs个
+        进程。零拷贝模式下不使用进程池。
+
         :param textlist: 字幕文本列表
         :param start_index: 起始下标
+        :param report: validators.Diagnostics实例，为None时不收集诊断信息
+        :param style_names: 已定义的样式名，为None时不检查样式
+        :param symbols: 符号表，为None时不复用字符串
+        :param jobs: 进程数，为None时自动选择
+        :param executor: 使用已有的进程池（concurrent.futures.Executor），为None时临时创建
         :param args:
         :param kwargs:
         :return: 解析到的该项数据和结束下标
         """
-        # event类型
-        EVENT_TYPES = ("Dialogue", "Comment", "Picture", "Sound", "Movie", "Command",)
-        # event formats
-        EVENT_INFO = {
-            "Format": Field(re_val=r"(?P<Format>%s):\s?" % "|".join(EVENT_TYPES), zh_title="格式"),
-            "Layer": Field(re_val=r"(?P<Layer>\d+)", zh_title="图层"),
-            "Start": Field(re_val=r"(?P<Start>\d{1,2}:(?:5\d|[0-4]\d):(?:5\d|[0-4]\d).(?:9\d{1,2}|[0-8]\d{1,2}))", zh_title="开始时间"),
-            "End": Field(re_val=r"(?P<End>\d{1,2}:(?:5\d|[0-4]\d):(?:5\d|[0-4]\d).(?:9\d{1,2}|[0-8]\d{1,2}))", zh_title="结束时间"),
-            "Style": Field(re_val=r"(?P<Style>[^,]+)", zh_title="样式"),
-            "Name": Field(re_val=r"(?P<Name>[^,]*)", zh_title="角色名"),
-            "MarginL": Field(re_val=r"(?P<MarginL>\d+)", zh_title="左边距"),
-            "MarginR": Field(re_val=r"(?P<MarginR>\d+)", zh_title="右边距"),
-            "MarginV": Field(re_val=r"(?P<MarginV>\d+)", zh_title="垂直边距"),
-            "Effect": Field(re_val=r"(?P<Effect>[^,]*)", zh_title="过渡特效"),
-            "Text": Field(re_val=r"(?P<Text>.*)", zh_title="对白字幕"),
-        }
-
         end_index = -1  # 读取到下一个标题时的下标
-        val_re = r""
 
-        # 检查第一行是否是合法的Format内容
-        if textlist[start_index].startswith("Format:"):
-            formats = textlist[start_index][len("Format:"):].split(",")
-            for num, format_ in enumerate(formats):
-                formats[num] = format_.strip()
-                if formats[num] not in EVENT_INFO:
-                    raise exceptions.AssParseError("解析ASS文件event时发生错误。"
-                                                   "原因：Format的内容相存在不合法项目或无效项目。")
-                if num == len(formats) - 1:
-                    if formats[num] != "Text":
-                        raise exceptions.AssParseError("解析ASS文件event时发生错误。"
-                                                       "原因：Format行最后项非Text。")
-                    val_re = "%s%s" % (val_re, EVENT_INFO[formats[num]].re_val)
-                else:
-                    val_re = r"%s%s,\s?" % (val_re, EVENT_INFO[formats[num]].re_val)
-        else:
-            raise exceptions.AssParseError("解析ASS文件event时发生错误。"
-                                           "原因：没有找到Format行内容。")
+        # 检查第一行是否是合法的Format内容，并获取用于匹配每行event内容的正则表达式
+        formats, matcher = AssParse.event_matcher(textlist[start_index])
+        # textlist为LineIndex时（零拷贝模式），event只保存偏移量
+        layout = RecordLayout(textlist.text, matcher) if isinstance(textlist, LineIndex) else None
+        intern_keys = [key for key in AssParse.INTERN_FIELDS if key in matcher.groupindex] \
+            if symbols is not None else ()
 
-        # 用于匹配每行event内容的正则表达式
-        val_re = "%s%s" % (EVENT_INFO["Format"].re_val, val_re)
         event_body = {
             "format": formats,
             "event": {},
             "order": [],
         }  # 保存event信息
+        events = event_body["event"]
 
-        for num, line in enumerate(textlist[start_index + 1:], start_index + 1):
-            if (line.startswith("[") and line.endswith("]")):
-                # 如果读取到下一个标题时，说明这部分内容以及解析结束
-                end_index = num
-                break
-            if num == len(textlist) - 1:
-                end_index = num
-
-            re_res = re.search(r"^%s$" % val_re, line)
-            if not re_res:
-                continue
-
-            # 生成uid，并验证uid是否唯一
-            while True:
-                uid = uuid.uuid4().hex[-6:]
-                if uid not in event_body["order"]: break
-
+        def add(num, values):
+            uid = _new_uid(events)
             event_body["order"].append(uid)
-            event_body["event"][uid] = re_res.groupdict()
+            if report is not None:
+                AssParse.check_event(values, num + 1, report, style_names)
+            if layout is not None:
+                events[uid] = OffsetRecord(layout, *textlist.span(num))
+                return
+            for key in intern_keys:
+                values[key] = symbols.setdefault(values[key], values[key])
+            events[uid] = values
+
+        def reject(num, line):
+            if report is not None and line:
+                report.add(num + 1, "Events", *AssParse.EVENT_SCHEMA.diagnose(line, formats))
+
+        matches = None  # 多进程匹配的结果
+        if layout is None and jobs != 1 and (jobs or len(textlist) - start_index > AssParse.PARALLEL_MIN_LINES):
+            stop, end_index = _event_range(textlist, start_index)
+            if jobs or (stop - start_index > AssParse.PARALLEL_MIN_LINES and (os.cpu_count() or 1) > 1):
+                matches = _match_events_parallel(textlist[start_index], textlist[start_index + 1:stop],
+                                                 jobs, executor)
+
+        if matches is None:
+            for num, line in enumerate(textlist[start_index + 1:], start_index + 1):
+                if (line.startswith("[") and line.endswith("]")):
+                    # 如果读取到下一个标题时，说明这部分内容以及解析结束
+                    end_index = num
+                    break
+                if num == len(textlist) - 1:
+                    end_index = num
+
+                re_res = matcher.search(line)
+                if not re_res:
+                    reject(num, line)
+                    continue
+                add(num, re_res.groupdict())
+        else:
+            # 按原来的顺序合并各进程的结果，uid在这里生成
+            for num, values in enumerate(matches, start_index + 1):
+                if values is None:
+                    reject(num, textlist[num])
+                    continue
+                add(num, values)
 
         return event_body, end_index
 
+    @staticmethod
+    def check_event(event, line, report, style_names=None, *args, **kwargs):
+        """
+        检查已解析的event内容，结果以warning的形式加入report
+
+        :param event: event内容（dict）
+        :param line: 行号
+        :param report: validators.Diagnostics实例
+        :param style_names: 已定义的样式名，为None时不检查样式
+        :param args:
+        :param kwargs:
+        """
+        if "Start" in event and "End" in event and str2cs(event["End"]) < str2cs(event["Start"]):
+            report.add(line, "Events", "End", "结束时间早于开始时间", WARNING)
+        if style_names is not None and event.get("Style") not in style_names:
+            report.add(line, "Events", "Style", "样式%s不存在" % event.get("Style"), WARNING)
+
     def all(self):
         pass
 
+
+def _new_uid(taken):
+    """生成6位十六进制的uid，并验证uid是否唯一（taken为已使用的uid的dict或者set）"""
+    while True:
+        uid = "%06x" % random.getrandbits(24)
+        if uid not in taken:
+            return uid
+
+
+def _event_range(textlist, start_index):
+    """获取event行的结束位置（不包含），以及AssParse.event返回的结束下标"""
+    for num in range(start_index + 1, len(textlist)):
+        line = textlist[num]
+        if line.startswith("[") and line.endswith("]"):
+            return num, num
+    return len(textlist), len(textlist) - 1 if len(textlist) > start_index + 1 else -1
+
+
+def _match_event_lines(format_line, lines):
+    """匹配一块event行（在子进程中执行），不合法的行为None"""
+    matcher = AssParse.event_matcher(format_line)[1]
+    return [re_res.groupdict() if re_res else None for re_res in map(matcher.search, lines)]
+
+
+def _match_events_parallel(format_line, lines, jobs=None, executor=None):
+    """将event行分块后在进程池中匹配，按原来的顺序返回结果"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = jobs or os.cpu_count() or 1
+    size = max(-(-len(lines) // (jobs * 4)), 1)  # 每个进程分到约4块，平衡各进程的负载
+    chunks = [lines[num:num + size] for num in range(0, len(lines), size)]
+    if executor is None:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(_match_event_lines, [format_line] * len(chunks), chunks))
+    else:
+        results = list(executor.map(_match_event_lines, [format_line] * len(chunks), chunks))
+    return [values for chunk in results for values in chunk]
+
+
+class _ProcessSymbols(object):
+    """进程级的符号表，与dict的setdefault接口相同，使用sys.intern实现"""
+    @staticmethod
+    def setdefault(key, default=None):
+        return sys.intern(key)
+
+
+PROCESS_SYMBOLS = _ProcessSymbols()
+
+
+class SrtParse(object):
+    # 时间行，如：00:00:01,000 --> 00:00:04,000
+    TIME_RE = re.compile(r"^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*"
+                         r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})")
+
+    @staticmethod
+    def blocks(lines, *args, **kwargs):
+        """
+        逐行解析SRT内容
+
+        使用方法：
+        传入一个可迭代的文本行（可以是文件流），每解析完成一个字幕块就返
+        回一次，不会一次性读取全部内容。
+
+        如何判断字幕块：
+        以时间行作为字幕块的开始，之后的内容直到空行为字幕文本。如果字幕
+        块之间缺少空行，遇到下一个时间行时，会把它前面的序号行从文本中去
+        除。
+
+        :param lines: 可迭代的文本行
+        :param args:
+        :param kwargs:
+        :return: (开始时间, 结束时间, 文本行列表)，时间单位为毫秒
+        """
+        start = end = None
+        textlines = []
+        for line in lines:
+            re_res = SrtParse.TIME_RE.search(line)
+            if re_res:
+                if start is not None:
+                    if textlines and textlines[-1].strip().isdigit():
+                        textlines.pop()
+                    yield start, end, textlines
+                values = re_res.groups()
+                start, end = SrtParse.__ms(values[:4]), SrtParse.__ms(values[4:])
+                textlines = []
+            elif start is not None:
+                if line.strip():
+                    textlines.append(line)
+                else:
+                    yield start, end, textlines
+                    start = end = None
+                    textlines = []
+        if start is not None:
+            yield start, end, textlines
+
+    @staticmethod
+    def __ms(values):
+        """将(时, 分, 秒, 毫秒)转换为毫秒"""
+        hours, minutes, seconds, ms = values
+        return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(ms.ljust(3, "0"))
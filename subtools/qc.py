@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+字幕质量检查：重叠、闪烁以及过短的间隔
+
+event按(Style, Layer)分组，每组按开始时间排序后扫描一遍，复杂度为O(n log n)：
+overlap：同组中时间重叠的event，链式重叠（A与B重叠，B与C重叠）的event
+         合并为一个问题，而不是逐对列出
+flash：持续时间短于min_duration的event
+gap：同组中相邻两条event之间大于0但短于min_gap的间隔
+
+默认只检查Dialogue。每个问题为一个dict：
+{"type": "overlap", "style": "Default", "layer": "0", "start": 100, "end": 200, "events": [uid1, uid2]}
+start、end为问题所在的时间段（厘秒，overlap为至少两条event同时显示的时间段），
+events为相关event的uid（流式检查时为event的序号）。
+"""
+
+import math
+from .utils.times import str2cs, cs2str
+
+OVERLAP = "overlap"
+FLASH = "flash"
+GAP = "gap"
+
+
+def frames2cs(frames, fps=24000 / 1001, *args, **kwargs):
+    """帧数转换为厘秒（向上取整）"""
+    return int(math.ceil(round(frames * 100 / fps, 6)))
+
+
+def find_issues(events, min_duration=0, min_gap=0, formats=("Dialogue",), *args, **kwargs):
+    """
+    检查event
+
+    :param events: (key, event)的可迭代对象，key用于在结果中标识event
+    :param min_duration: 持续时间短于该值（厘秒）的event视为闪烁，为0时不检查
+    :param min_gap: 同组中短于该值（厘秒）的间隔视为过短，为0时不检查
+    :param formats: 检查的event类型，为None时检查全部
+    :return: 问题列表，按开始时间排序
+    """
+    groups = {}
+    findings = []
+    for key, event in events:
+        if formats is not None and event["Format"] not in formats:
+            continue
+        start, end = str2cs(event["Start"]), str2cs(event["End"])
+        group = (event["Style"], event["Layer"])
+        groups.setdefault(group, []).append((start, end, key))
+        if min_duration and end - start < min_duration:
+            findings.append(_finding(FLASH, group, start, end, [key]))
+
+    for group, items in groups.items():
+        items.sort(key=lambda item: (item[0], item[1]))
+        cluster = []  # 当前链式重叠的event
+        cluster_end, last_key = None, None  # cluster中最晚的结束时间以及对应的event
+        overlap_start = overlap_end = None  # cluster中至少有两条event同时显示的时间段
+        for start, end, key in items:
+            if cluster and start < cluster_end:
+                if len(cluster) == 1:
+                    overlap_start, overlap_end = start, min(end, cluster_end)
+                else:
+                    overlap_end = max(overlap_end, min(end, cluster_end))
+                cluster.append(key)
+            else:
+                if len(cluster) > 1:
+                    findings.append(_finding(OVERLAP, group, overlap_start, overlap_end, cluster))
+                if min_gap and cluster_end is not None and 0 < start - cluster_end < min_gap:
+                    findings.append(_finding(GAP, group, cluster_end, start, [last_key, key]))
+                cluster = [key]
+                cluster_end = None
+            if cluster_end is None or end > cluster_end:
+                cluster_end, last_key = end, key
+        if len(cluster) > 1:
+            findings.append(_finding(OVERLAP, group, overlap_start, overlap_end, cluster))
+
+    findings.sort(key=lambda item: (item["start"], item["end"], item["type"]))
+    return findings
+
+
+def check(ass, min_duration=0, min_gap=0, formats=("Dialogue",), styles=None, *args, **kwargs):
+    """
+    检查已经解析了event的Ass实例，参数与find_issues相同
+
+    :param styles: 只检查这些样式，为None时检查全部
+    :return: 问题列表，events为uid
+    """
+    events = ((uid, ass.event_[uid]) for uid in ass.event_uid)
+    if styles is not None:
+        styles = set(styles)
+        events = ((uid, event) for uid, event in events if event["Style"] in styles)
+    return find_issues(events, min_duration, min_gap, formats)
+
+
+def as_text(finding, limit=10):
+    """问题的文本描述，最多列出limit条event"""
+    keys = " ".join(map(str, finding["events"][:limit]))
+    if len(finding["events"]) > limit:
+        keys += " ...（共%d条）" % len(finding["events"])
+    return "%-7s %s/%s %s-%s %s" % (finding["type"], finding["style"], finding["layer"],
+                                    cs2str(finding["start"]), cs2str(finding["end"]), keys)
+
+
+def _finding(type, group, start, end, keys):
+    return {"type": type, "style": group[0], "layer": group[1], "start": start, "end": end, "events": keys}
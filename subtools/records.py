@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+以列的形式导出、导入event
+
+每个字段保存为一列：
+Start、End：厘秒（int）
+Layer、MarginL、MarginR、MarginV：int
+Format、Marked、Style、Name、Effect：分类编码（int），编码对应的值保存在categories中
+Text以及其它字段：str
+
+安装了NumPy时，每列为numpy数组（str列为object数组），否则int列为
+array.array，str列为list。
+
+从文本或者文件导出时，直接将正则表达式匹配到的各字段追加到对应的列中，
+不会生成每条event的dict。
+
+注意：时间会统一为厘秒（三位小数的毫秒会舍去最后一位），数字字段会
+去除前导0，重新生成的字幕可能与原文本不完全相同。
+"""
+
+import copy
+from array import array
+from . import exceptions
+from .ass import Ass
+from .parselib import AssParse
+from .utils.times import str2cs, cs2str
+
+TIME_FIELDS = ("Start", "End")
+INT_FIELDS = ("Layer", "MarginL", "MarginR", "MarginV")
+CATEGORY_FIELDS = ("Format", "Marked", "Style", "Name", "Effect")
+
+
+def load_numpy(numpy=None):
+    """numpy为None时，如果可以导入NumPy则使用，为True时必须使用"""
+    if numpy is False:
+        return None
+    try:
+        import numpy as np
+    except ImportError:
+        if numpy:
+            raise
+        return None
+    return np
+
+
+class Records(object):
+    """
+    列形式的event
+
+    records["Start"]为开始时间列，records.decode("Style")为样式名列表。
+    """
+    def __init__(self, columns, categories, format):
+        self.columns = columns  # 字段与列的dict
+        self.categories = categories  # 分类字段与编码对应的值（list）的dict
+        self.format = format  # 事件格式（list，不包含Format）
+
+    def __len__(self):
+        return len(self.columns["Format"])
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def decode(self, key):
+        """获取分类字段的值（list）"""
+        values = self.categories[key]
+        return [values[code] for code in self.columns[key]]
+
+    def as_structured(self):
+        """转换为NumPy结构化数组（需要安装NumPy）"""
+        import numpy as np
+
+        dtype = []
+        for key in self.columns:
+            if key in TIME_FIELDS or key in INT_FIELDS:
+                dtype.append((key, np.int64))
+            elif key in self.categories:
+                dtype.append((key, np.int32))
+            else:
+                dtype.append((key, object))
+        result = np.empty(len(self), dtype=dtype)
+        for key, column in self.columns.items():
+            result[key] = column
+        return result
+
+
+class RecordBuilder(object):
+    """逐条追加event，生成Records"""
+    def __init__(self, formats):
+        """
+        :param formats: 事件格式（list，不包含Format）
+        """
+        self.format = list(formats)
+        self.keys = ["Format"] + self.format
+        self.__columns = []
+        self.__codes = {}  # 分类字段的值与编码的dict
+        self.__converters = []
+        for key in self.keys:
+            if key in TIME_FIELDS:
+                self.__columns.append(array("q"))
+                self.__converters.append(str2cs)
+            elif key in INT_FIELDS:
+                self.__columns.append(array("q"))
+                self.__converters.append(int)
+            elif key in CATEGORY_FIELDS:
+                codes = self.__codes[key] = {}
+                self.__columns.append(array("l"))
+                self.__converters.append(self.__encoder(codes))
+            else:
+                self.__columns.append([])
+                self.__converters.append(None)
+        self.__appenders = [(column.append, converter)
+                            for column, converter in zip(self.__columns, self.__converters)]
+
+    @staticmethod
+    def __encoder(codes):
+        def encode(value):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            return code
+        return encode
+
+    def add_values(self, values):
+        """追加一条event，values为与["Format"] + format顺序相同的字段值"""
+        for (append, converter), value in zip(self.__appenders, values):
+            append(converter(value) if converter else value)
+
+    def add_event(self, event):
+        """追加一条event（dict）"""
+        self.add_values([event[key] for key in self.keys])
+
+    def build(self, numpy=None):
+        """
+        生成Records
+
+        :param numpy: 是否使用NumPy，为None时如果可以导入NumPy则使用
+        :return: Records
+        """
+        np = load_numpy(numpy)
+        columns = {}
+        for key, column in zip(self.keys, self.__columns):
+            if np is None:
+                columns[key] = column
+            elif isinstance(column, array):
+                columns[key] = np.array(column, dtype=np.int64 if column.typecode == "q" else np.int32)
+            else:
+                values = np.empty(len(column), dtype=object)
+                values[:] = column
+                columns[key] = values
+        categories = {key: list(codes) for key, codes in self.__codes.items()}
+        return Records(columns, categories, self.format)
+
+
+def from_events(formats, events, numpy=None, *args, **kwargs):
+    """
+    将event（dict）转换为Records
+
+    :param formats: 事件格式（list）
+    :param events: event的可迭代对象
+    :param numpy: 是否使用NumPy
+    :return: Records
+    """
+    builder = RecordBuilder(formats)
+    for event in events:
+        builder.add_event(event)
+    return builder.build(numpy)
+
+
+def from_lines(textlist, start_index, numpy=None, *args, **kwargs):
+    """
+    直接从Events的文本行生成Records，不生成每条event的dict
+
+    :param textlist: 字幕文本列表
+    :param start_index: Events的Format行的下标
+    :param numpy: 是否使用NumPy
+    :return: Records
+    """
+    formats, matcher = AssParse.event_matcher(textlist[start_index])
+    builder = RecordBuilder(formats)
+    add = builder.add_values
+    search = matcher.search
+    for line in textlist[start_index + 1:]:
+        if line.startswith("[") and line.endswith("]"):
+            # 如果读取到下一个标题时，说明这部分内容以及解析结束
+            break
+        re_res = search(line)
+        if re_res:
+            add(re_res.groups())
+    return builder.build(numpy)
+
+
+def read_records(path, encoding="utf-8", numpy=None, *args, **kwargs):
+    """
+    流式读取字幕文件，生成Records
+
+    :param path: 文件路径或者文本流
+    :param encoding: 文件编码
+    :param numpy: 是否使用NumPy
+    :return: 头部内容（Ass实例）以及Records
+    """
+    from .stream import AssReader
+
+    with AssReader(path, encoding) as reader:
+        if reader.event_format is None:
+            raise exceptions.NoExists("没有找到events")
+        matcher = AssParse.event_matcher("Format: %s" % ", ".join(reader.event_format))[1]
+        builder = RecordBuilder(reader.event_format)
+        add = builder.add_values
+        search = matcher.search
+        for line in reader.iter_event_lines():
+            re_res = search(line)
+            if re_res:
+                add(re_res.groups())
+        return reader.header, builder.build(numpy)
+
+
+def to_events(records, *args, **kwargs):
+    """逐条返回Records中的event（dict）"""
+    keys = ["Format"] + list(records.format)
+    columns = []
+    for key in keys:
+        column = records.columns[key]
+        if key in TIME_FIELDS:
+            columns.append(map(cs2str, column))
+        elif key in INT_FIELDS:
+            columns.append(map(str, column))
+        elif key in records.categories:
+            columns.append(map(records.categories[key].__getitem__, column))
+        else:
+            columns.append(map(str, column))
+    for values in zip(*columns):
+        yield dict(zip(keys, values))
+
+
+def from_records(records, header=None, ass=None, *args, **kwargs):
+    """
+    使用Records生成Ass实例（不经过文本）
+
+    :param records: Records
+    :param header: 提供Script Info、Garbage以及Styles的Ass实例，为None时使用默认的头部内容
+    :param ass: 写入的Ass实例，为None时新建
+    :return: Ass实例
+    """
+    if header is None:
+        from .stream import DEFAULT_HEADER
+
+        header = Ass()
+        header.from_str(DEFAULT_HEADER)
+        header.parse_all()
+
+    if ass is None:
+        ass = Ass()
+    for title in ("Script Info", "Aegisub Project Garbage", "V4+ Styles"):
+        ass.text_dict[title] = copy.deepcopy(header.text_dict[title])
+    events = {}
+    order = []
+    for num, event in enumerate(to_events(records)):
+        uid = "%06x" % num
+        order.append(uid)
+        events[uid] = event
+    ass.text_dict["Events"] = {"format": list(records.format), "event": events, "order": order}
+    return ass
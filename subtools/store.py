@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+基于SQLite的event存储
+
+用于处理超出内存大小的字幕：头部内容（Script Info、Garbage、Event的
+Format）以json保存在meta表中，样式保存在styles表中，event保存在events
+表中，并对开始时间、样式、角色名建立索引。
+
+读取字幕时通过stream中的Reader逐行解析，每BATCH_SIZE条event在一个事务
+中批量写入；查询、批量修改以及保存时都按原来的顺序逐行读取，内存占用
+与字幕的大小无关。
+
+使用方法：
+with EventStore("archive.db") as store:
+    store.load("huge.ass")
+    store.shift(150, style="Default")
+    store.save2file("huge.shifted.ass")
+"""
+
+import json
+import sqlite3
+from . import exceptions
+from .ass import Ass
+from .stream import AssWriter
+from .utils.times import str2cs, cs2str
+
+BATCH_SIZE = 5000  # 每个事务写入的event数
+
+# 以列的形式保存的event字段，其它字段以json保存在extra列中
+COLUMNS = ("Format", "Marked", "Layer", "Start", "End", "Style", "Name",
+           "MarginL", "MarginR", "MarginV", "Effect", "Text")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS styles (seq INTEGER PRIMARY KEY, Name TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    start_cs INTEGER,
+    end_cs INTEGER,
+    %s,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS styles_name ON styles (Name);
+CREATE INDEX IF NOT EXISTS events_start ON events (start_cs);
+CREATE INDEX IF NOT EXISTS events_style ON events (Style);
+CREATE INDEX IF NOT EXISTS events_name ON events (Name);
+""" % ",\n    ".join('"%s" TEXT' % column for column in COLUMNS)
+
+_COLUMN_SET = frozenset(COLUMNS)
+_SELECT = "SELECT seq, %s, extra FROM events" % ", ".join('"%s"' % column for column in COLUMNS)
+_INSERT = "INSERT INTO events (start_cs, end_cs, %s, extra) VALUES (?, ?, %s, ?)" \
+          % (", ".join('"%s"' % column for column in COLUMNS), ", ".join("?" * len(COLUMNS)))
+
+
+class EventStore(object):
+    """
+    以SQLite保存的字幕
+
+    筛选条件（filters）可以用于count、query、update、shift、edit、delete
+    以及save2file：
+    style: 样式名（str）或者样式名列表
+    name: 角色名（str）或者角色名列表
+    start, end: 时间范围[start, end)，与该范围有重叠的event，可以是ASS时间或者厘秒
+    where, params: 额外的SQL条件以及参数，如：where='"Text" LIKE ?', params=("%♪%",)
+    """
+    def __init__(self, path=":memory:", *args, **kwargs):
+        """
+        :param path: 数据库文件路径，默认为内存数据库
+        """
+        self.path = path
+        self.__conn = sqlite3.connect(path)
+        self.__conn.create_function("cs2str", 1, cs2str)
+        self.__conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """关闭数据库"""
+        self.__conn.close()
+
+    @property
+    def event_format(self):
+        """事件格式（list）"""
+        return self.__get_meta("format") or []
+
+    @property
+    def header(self):
+        """只包含头部内容（不包含event）的Ass实例"""
+        header = Ass()
+        header.text_dict["Script Info"] = self.__get_meta("Script Info")
+        header.text_dict["Aegisub Project Garbage"] = self.__get_meta("Aegisub Project Garbage")
+        style_body = self.__get_meta("V4+ Styles")
+        if style_body is not None:
+            style_body["style"] = {}
+            style_body["style_name"] = []
+            style_body["order"] = []
+            for seq, name, data in self.__conn.execute("SELECT seq, Name, data FROM styles ORDER BY seq"):
+                uid = "%06x" % seq
+                style_body["order"].append(uid)
+                style_body["style"][uid] = json.loads(data)
+                if name not in style_body["style_name"]:
+                    style_body["style_name"].append(name)
+        header.text_dict["V4+ Styles"] = style_body
+        header.text_dict["Events"] = {"format": self.event_format, "event": {}, "order": []}
+        return header
+
+    def load(self, src, format="ASS", encoding="utf-8", batch=BATCH_SIZE, *args, **kwargs):
+        """
+        从字幕文件中读取内容，替换当前全部内容
+
+        :param src: 文件路径或者文本流
+        :param format: 字幕格式（ASS|SSA|SRT）
+        :param encoding: 文件编码
+        :param batch: 每个事务写入的event数
+        :return: 写入的event数
+        """
+        from .convert import READERS
+
+        format = format.upper()
+        if format not in READERS:
+            raise exceptions.SubFormatError("不支持的字幕格式：%s" % format)
+        with READERS[format](src, encoding) as reader:
+            self.__set_header(reader.header)
+            return self.insert(reader, batch)
+
+    def import_ass(self, ass, batch=BATCH_SIZE, *args, **kwargs):
+        """
+        导入已经解析完成的Ass实例，替换当前全部内容
+
+        :param ass: Ass实例
+        :param batch: 每个事务写入的event数
+        :return: 写入的event数
+        """
+        if not ass.styles or not ass.events:
+            raise exceptions.NoExists("无法导入，原因：没有找到styles和events")
+        self.__set_header(ass)
+        return self.insert((ass.event_[uid] for uid in ass.event_uid), batch)
+
+    def insert(self, events, batch=BATCH_SIZE, *args, **kwargs):
+        """
+        在末尾追加event，每batch条event在一个事务中写入
+
+        :param events: event（dict）的可迭代对象
+        :param batch: 每个事务写入的event数
+        :return: 写入的event数
+        """
+        count = 0
+        rows = []
+        for event in events:
+            rows.append(self.__to_row(event))
+            if len(rows) >= batch:
+                count += self.__insert_rows(rows)
+                rows = []
+        if rows:
+            count += self.__insert_rows(rows)
+        return count
+
+    def count(self, *args, **kwargs):
+        """获取符合条件的event数"""
+        where, params = self.__where(**kwargs)
+        return self.__conn.execute("SELECT COUNT(*) FROM events" + where, params).fetchone()[0]
+
+    def query(self, *args, **kwargs):
+        """按原来的顺序逐条返回符合条件的event（dict）"""
+        for _, event in self.__iter_events(**kwargs):
+            yield event
+
+    def update(self, values, *args, **kwargs):
+        """
+        批量修改符合条件的event的字段
+
+        :param values: 字段与新值的dict，只能修改COLUMNS中的字段
+        :return: 修改的event数
+        """
+        columns = []
+        params = []
+        for key, value in values.items():
+            if key not in COLUMNS:
+                raise exceptions.NoExists("无法修改，原因：%s不是可以批量修改的字段" % key)
+            columns.append('"%s" = ?' % key)
+            params.append(value)
+            if key in ("Start", "End"):
+                columns.append("%s_cs = ?" % key.lower())
+                params.append(str2cs(value))
+        where, where_params = self.__where(**kwargs)
+        with self.__conn:
+            return self.__conn.execute("UPDATE events SET %s%s" % (", ".join(columns), where),
+                                       params + where_params).rowcount
+
+    def shift(self, offset, *args, **kwargs):
+        """
+        平移符合条件的event的时间
+
+        :param offset: 平移的厘秒数，可以为负数（时间最小为0）
+        :return: 修改的event数
+        """
+        where, params = self.__where(**kwargs)
+        with self.__conn:
+            return self.__conn.execute(
+                "UPDATE events SET start_cs = MAX(start_cs + ?, 0), end_cs = MAX(end_cs + ?, 0), "
+                '"Start" = cs2str(start_cs + ?), "End" = cs2str(end_cs + ?)' + where,
+                [offset] * 4 + params).rowcount
+
+    def edit(self, func, batch=BATCH_SIZE, *args, **kwargs):
+        """
+        使用函数逐条修改符合条件的event
+
+        每次读取batch条event，修改后在一个事务中写回，内存中最多只有batch
+        条event。
+
+        :param func: 接收event（dict），返回修改后的event（dict），返回None时删除该event
+        :param batch: 每次处理的event数
+        :return: 处理的event数
+        """
+        where, params = self.__where(**kwargs)
+        where = "%s seq > ?" % ("%s AND" % where if where else " WHERE")
+        formats = self.event_format
+        count = 0
+        last = -1
+        while True:
+            rows = self.__conn.execute("%s%s ORDER BY seq LIMIT ?" % (_SELECT, where),
+                                       params + [last, batch]).fetchall()
+            if not rows:
+                return count
+            with self.__conn:
+                for row in rows:
+                    event = func(self.__to_event(row, formats))
+                    if event is None:
+                        self.__conn.execute("DELETE FROM events WHERE seq = ?", (row[0],))
+                    else:
+                        self.__conn.execute(
+                            "UPDATE events SET start_cs = ?, end_cs = ?, %s, extra = ? WHERE seq = ?"
+                            % ", ".join('"%s" = ?' % column for column in COLUMNS),
+                            self.__to_row(event) + (row[0],))
+            count += len(rows)
+            last = rows[-1][0]
+
+    def edit_times(self, func, batch=BATCH_SIZE, *args, **kwargs):
+        """
+        批量修改符合条件的event的时间
+
+        每次读取batch条event的开始、结束时间（厘秒），交给func一次性计算，
+        只写回时间发生变化的event。
+
+        :param func: 接收开始时间、结束时间两个列表，返回新的开始时间、结束时间
+        :param batch: 每次处理的event数
+        :return: 修改的event数
+        """
+        where, params = self.__where(**kwargs)
+        where = "%s seq > ?" % ("%s AND" % where if where else " WHERE")
+        count = 0
+        last = -1
+        while True:
+            rows = self.__conn.execute("SELECT seq, start_cs, end_cs FROM events%s ORDER BY seq LIMIT ?"
+                                       % where, params + [last, batch]).fetchall()
+            if not rows:
+                return count
+            seqs, starts, ends = zip(*rows)
+            new_starts, new_ends = func(list(starts), list(ends))
+            changes = [(int(start), int(end), int(start), int(end), seq)
+                       for seq, old_start, old_end, start, end in zip(seqs, starts, ends, new_starts, new_ends)
+                       if start != old_start or end != old_end]
+            with self.__conn:
+                self.__conn.executemany('UPDATE events SET start_cs = ?, end_cs = ?, '
+                                        '"Start" = cs2str(?), "End" = cs2str(?) WHERE seq = ?', changes)
+            count += len(changes)
+            last = seqs[-1]
+
+    def delete(self, *args, **kwargs):
+        """删除符合条件的event，返回删除的event数"""
+        where, params = self.__where(**kwargs)
+        with self.__conn:
+            return self.__conn.execute("DELETE FROM events" + where, params).rowcount
+
+    def save2file(self, path, furigana=False, encoding="utf-8", *args, **kwargs):
+        """
+        按原来的顺序逐条写入到文件中
+
+        :param path: 文件路径或者文本流
+        :param furigana: 是否输出假名标注的内容
+        :param encoding: 文件编码
+        :return: 写入的event数
+        """
+        count = 0
+        with AssWriter(path, self.header, furigana, encoding) as writer:
+            for event in self.query(**kwargs):
+                writer.write_event(event)
+                count += 1
+        return count
+
+    def to_ass(self, *args, **kwargs):
+        """将符合条件的event读取到Ass实例中（全部在内存中）"""
+        ass = self.header
+        event_body = ass.text_dict["Events"]
+        for seq, event in self.__iter_events(**kwargs):
+            uid = "%06x" % seq
+            event_body["order"].append(uid)
+            event_body["event"][uid] = event
+        return ass
+
+    def __iter_events(self, *args, **kwargs):
+        """按原来的顺序逐条返回符合条件的(seq, event)"""
+        where, params = self.__where(**kwargs)
+        formats = self.event_format
+        for row in self.__conn.execute("%s%s ORDER BY seq" % (_SELECT, where), params):
+            yield row[0], self.__to_event(row, formats)
+
+    def __set_header(self, ass):
+        """保存头部内容以及样式，并清空全部event"""
+        style_body = ass.styles
+        with self.__conn:
+            self.__conn.execute("DELETE FROM meta")
+            self.__conn.execute("DELETE FROM styles")
+            self.__conn.execute("DELETE FROM events")
+            meta = {
+                "Script Info": ass.scripts,
+                "Aegisub Project Garbage": ass.garbages,
+                "V4+ Styles": {"format": style_body["format"]} if style_body else None,
+                "format": ass.event_format,
+            }
+            self.__conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                    [(key, json.dumps(value)) for key, value in meta.items()])
+            if style_body:
+                self.__conn.executemany("INSERT INTO styles (Name, data) VALUES (?, ?)",
+                                        [(style_body["style"][uid]["Name"], json.dumps(dict(style_body["style"][uid])))
+                                         for uid in style_body["order"]])
+
+    def __get_meta(self, key):
+        row = self.__conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __insert_rows(self, rows):
+        with self.__conn:
+            self.__conn.executemany(_INSERT, rows)
+        return len(rows)
+
+    @staticmethod
+    def __to_row(event):
+        """event（dict）转换为events表的一行"""
+        extra = None
+        if not _COLUMN_SET.issuperset(event):
+            extra = json.dumps({key: value for key, value in event.items() if key not in _COLUMN_SET})
+        return (str2cs(event["Start"]), str2cs(event["End"])) + tuple(map(event.get, COLUMNS)) + (extra,)
+
+    @staticmethod
+    def __to_event(row, formats):
+        """events表的一行转换为event（dict）"""
+        values = dict(zip(COLUMNS, row[1:-1]))
+        event = {"Format": values["Format"]}
+        for key in formats:
+            if values.get(key) is not None:
+                event[key] = values[key]
+        if row[-1]:
+            event.update(json.loads(row[-1]))
+        return event
+
+    @staticmethod
+    def __where(style=None, name=None, start=None, end=None, where=None, params=(), *args, **kwargs):
+        """根据筛选条件生成WHERE子句以及参数"""
+        clauses = []
+        values = []
+        for column, value in (("Style", style), ("Name", name)):
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            clauses.append('"%s" IN (%s)' % (column, ", ".join("?" * len(value))))
+            values.extend(value)
+        if start is not None:
+            clauses.append("end_cs > ?")
+            values.append(str2cs(start) if isinstance(start, str) else start)
+        if end is not None:
+            clauses.append("start_cs < ?")
+            values.append(str2cs(end) if isinstance(end, str) else end)
+        if where:
+            clauses.append("(%s)" % where)
+            values.extend(params)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
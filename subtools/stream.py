@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+流式读写字幕
+
+头部内容（Script Info、Aegisub Project Garbage、V4+ Styles）通常很小，
+会一次性解析到一个Ass实例中；Events部分则逐行读取、逐行解析或写入，
+不会在内存中生成全部事件。
+
+所有Reader返回的都是ASS格式的event（dict）和header（Ass实例），所以任
+意Reader都可以和任意Writer组合使用，进行格式转换。
+
+gzip、bz2、xz格式的文件会在读取时逐块解压（根据文件头判断）；Writer的
+路径扩展名为.gz、.bz2、.xz时逐块压缩写入。
+"""
+
+import re
+from . import exceptions
+from .ass import Ass
+from .parselib import AssParse, SrtParse, _new_uid
+from .utils import data as data_utils
+from .utils import tokenizer
+from .utils.times import str2cs, cs2str
+
+# ASS默认的事件格式
+EVENT_FORMAT = ["Layer", "Start", "End", "Style", "Name", "MarginL", "MarginR", "MarginV", "Effect", "Text"]
+
+# 没有头部内容的字幕（如SRT）转换为ASS时使用的头部
+DEFAULT_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 384
+PlayResY: 288
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
+"""
+
+# SSA对齐方式与ASS（小键盘）对齐方式的对应关系
+SSA_ALIGNMENT = {"1": "1", "2": "2", "3": "3", "5": "7", "6": "8", "7": "9", "9": "4", "10": "5", "11": "6"}
+
+# SRT中支持转换的html标签
+SRT_TAG_RE = re.compile(r"<(/?)([ibus])>|<font[^>]*?color=\"?#?([0-9a-fA-F]{6})\"?[^>]*>|</font>|<[^>]*>", re.I)
+
+
+def open_stream(path, encoding="utf-8", *args, **kwargs):
+    """打开文件，如果path已经是文本流则直接返回（不需要关闭）"""
+    if hasattr(path, "read"):
+        return path, False
+    return data_utils.open_file(path, encoding), True
+
+
+class AssReader(object):
+    """
+    流式读取ASS字幕
+
+    使用方法：
+    with AssReader(path) as reader:
+        for event in reader:
+            ...
+
+    reader.header是一个只包含头部内容的Ass实例，它的Events部分只有
+    format，没有任何事件。path也可以是一个已经打开的文本流。
+    """
+    __event_header = "[Events]"
+
+    def __init__(self, path, encoding="utf-8", *args, **kwargs):
+        self.path = path
+        self.header = None
+        self.event_format = None  # 事件格式（list）
+        self.__matcher = None  # 用于匹配event行的正则表达式
+        self.__stream, self.__close = open_stream(path, encoding)
+        self.__lines = data_utils.iter_lines(self.__stream)
+        try:
+            self.header = self.parse_header(*self.__read_header())
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self.iter_events()
+
+    def close(self):
+        """关闭文件"""
+        if self.__close:
+            self.__stream.close()
+
+    def parse_header(self, textlines, format_line, *args, **kwargs):
+        """
+        解析头部内容
+
+        :param textlines: [Events]之前的全部文本行
+        :param format_line: Events的Format行，没有时为None
+        :return: 只包含头部内容的Ass实例
+        """
+        header = Ass()
+        header.from_str("\n".join(textlines))
+        header.parse_all()
+        if format_line is not None:
+            self.event_format, self.__matcher = AssParse.event_matcher(format_line)
+        header.text_dict["Events"] = {
+            "format": self.event_format or list(EVENT_FORMAT),
+            "event": {},
+            "order": [],
+        }
+        return header
+
+    def parse_event_line(self, line):
+        """解析单行event内容，不合法的行返回None"""
+        re_res = self.__matcher.search(line) if self.__matcher else None
+        if re_res:
+            return re_res.groupdict()
+
+    def iter_event_lines(self):
+        """逐行返回Events部分中未经解析的内容（跳过空行）"""
+        if self.event_format is None:
+            return
+        for line in self.__lines:
+            if line.startswith("[") and line.endswith("]"):
+                # 如果读取到下一个标题时，说明这部分内容以及解析结束
+                break
+            if line:
+                yield line
+
+    def iter_events(self):
+        """逐行解析并返回event内容（dict），会抛弃不合法的event行"""
+        for line in self.iter_event_lines():
+            event = self.parse_event_line(line)
+            if event:
+                yield event
+
+    def __read_header(self):
+        """读取头部内容，直到Events的Format行"""
+        textlines = []
+        for line in self.__lines:
+            if line == self.__event_header:
+                break
+            textlines.append(line)
+        for line in self.__lines:
+            if line:
+                return textlines, line
+        return textlines, None
+
+
+class SsaReader(AssReader):
+    """
+    流式读取SSA（V4 Styles）字幕
+
+    头部内容以及每条event都会被转换为ASS格式：样式的TertiaryColour作为
+    OutlineColour，对齐方式转换为小键盘方式，颜色转换为&HAABBGGRR；event
+    的Marked被丢弃，Layer为0。
+    """
+    __style_header = "[V4 Styles]"
+    __script_header = "[Script Info]"
+
+    def parse_header(self, textlines, format_line, *args, **kwargs):
+        """解析头部内容，并转换为ASS格式"""
+        header = Ass()
+        for num, line in enumerate(textlines):
+            if line == self.__script_header:
+                header.text_dict["Script Info"], _ = AssParse.script(textlines, num + 1)
+                header.text_dict["Script Info"]["ScriptType"]["value"] = "v4.00+"
+            elif line == self.__style_header:
+                styles, _ = AssParse.style(textlines, num + 1, AssParse.SSA_STYLE_INFO)
+                header.text_dict["V4+ Styles"] = self.ssa2ass_styles(styles)
+        if header.styles is None:
+            raise exceptions.SubFormatError("非SSA字幕格式内容")
+        if header.scripts is None:
+            header.text_dict["Script Info"], _ = AssParse.script([""])
+            header.text_dict["Script Info"]["ScriptType"]["value"] = "v4.00+"
+
+        if format_line is not None:
+            self.__matcher = AssParse.event_matcher(format_line)[1]
+            self.event_format = list(EVENT_FORMAT)
+        header.text_dict["Events"] = {"format": list(EVENT_FORMAT), "event": {}, "order": []}
+        return header
+
+    def parse_event_line(self, line):
+        """解析单行SSA event内容，并转换为ASS格式"""
+        re_res = self.__matcher.search(line) if self.event_format else None
+        if not re_res:
+            return
+        event = re_res.groupdict()
+        return {
+            "Format": event["Format"],
+            "Layer": event.get("Layer", "0"),
+            "Start": event.get("Start", "0:00:00.00"),
+            "End": event.get("End", "0:00:00.00"),
+            "Style": event.get("Style", "Default").lstrip("*") or "Default",
+            "Name": event.get("Name", ""),
+            "MarginL": event.get("MarginL", "0"),
+            "MarginR": event.get("MarginR", "0"),
+            "MarginV": event.get("MarginV", "0"),
+            "Effect": event.get("Effect", ""),
+            "Text": event["Text"],
+        }
+
+    @staticmethod
+    def ssa2ass_styles(style_body, *args, **kwargs):
+        """将解析好的SSA样式转换为ASS样式"""
+        def colour(value):
+            if value.upper().startswith("&H"):
+                return "&H%08X" % int(value[2:], 16)
+            return "&H%08X" % (int(value) & 0xFFFFFFFF)
+
+        formats = list(AssParse.STYLE_INFO)[1:]
+        styles = {}
+        for uid in style_body["order"]:
+            style = style_body["style"][uid]
+            styles[uid] = {
+                "Name": style.get("Name", "Default").lstrip("*") or "Default",
+                "Fontname": style.get("Fontname", "Arial"),
+                "Fontsize": style.get("Fontsize", "20"),
+                "PrimaryColour": colour(style.get("PrimaryColour", "16777215")),
+                "SecondaryColour": colour(style.get("SecondaryColour", "255")),
+                "OutlineColour": colour(style.get("TertiaryColour", "0")),
+                "BackColour": colour(style.get("BackColour", "0")),
+                "Bold": "-1" if int(style.get("Bold", "0")) else "0",
+                "Italic": "-1" if int(style.get("Italic", "0")) else "0",
+                "Underline": "0",
+                "StrikeOut": "0",
+                "ScaleX": "100",
+                "ScaleY": "100",
+                "Spacing": "0",
+                "Angle": "0",
+                "BorderStyle": style.get("BorderStyle", "1"),
+                "Outline": style.get("Outline", "2"),
+                "Shadow": style.get("Shadow", "2"),
+                "Alignment": SSA_ALIGNMENT.get(style.get("Alignment", "2"), "2"),
+                "MarginL": style.get("MarginL", "10"),
+                "MarginR": style.get("MarginR", "10"),
+                "MarginV": style.get("MarginV", "10"),
+                "Encoding": style.get("Encoding", "1"),
+            }
+        return {
+            "format": formats,
+            "style": styles,
+            "style_name": [styles[uid]["Name"] for uid in style_body["order"]],
+            "order": list(style_body["order"]),
+        }
+
+
+class SrtReader(object):
+    """
+    流式读取SRT字幕
+
+    每个字幕块都会被转换为使用style样式的ASS Dialogue，<i>、<b>、<u>、
+    <s>以及<font color>标签会被转换为对应的特效标签。header为None时使用
+    DEFAULT_HEADER。
+    """
+    def __init__(self, path, encoding="utf-8", header=None, style="Default", *args, **kwargs):
+        self.path = path
+        self.style = style
+        if header is None:
+            header = Ass()
+            header.from_str(DEFAULT_HEADER)
+            header.parse_all()
+            header.text_dict["Events"] = {"format": list(EVENT_FORMAT), "event": {}, "order": []}
+        self.header = header
+        self.event_format = header.event_format
+        self.__stream, self.__close = open_stream(path, encoding)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self.iter_events()
+
+    def close(self):
+        """关闭文件"""
+        if self.__close:
+            self.__stream.close()
+
+    def iter_events(self):
+        """逐个字幕块解析并返回ASS格式的event内容（dict）"""
+        for start, end, textlines in SrtParse.blocks(data_utils.iter_lines(self.__stream)):
+            event = {k: "" for k in self.event_format}
+            event.update({
+                "Format": "Dialogue",
+                "Layer": "0",
+                "Start": cs2str(start // 10),
+                "End": cs2str(end // 10),
+                "Style": self.style,
+                "MarginL": "0",
+                "MarginR": "0",
+                "MarginV": "0",
+                "Text": self.srt2ass_text(textlines),
+            })
+            yield event
+
+    @staticmethod
+    def srt2ass_text(textlines, *args, **kwargs):
+        """将SRT的文本行转换为ASS的Text"""
+        def replace(re_res):
+            close, tag, colour = re_res.groups()
+            if tag:
+                return "{\\%s%s}" % (tag.lower(), "0" if close else "1")
+            if colour:
+                return "{\\c&H%s%s%s&}" % (colour[4:6], colour[2:4], colour[0:2])
+            if re_res.group().lower() == "</font>":
+                return "{\\c}"
+            return ""
+
+        return SRT_TAG_RE.sub(replace, "\\N".join(textlines))
+
+
+class AssFollower(object):
+    """
+    增量读取不断追加event的ASS字幕（如直播字幕）
+
+    使用方法：
+    follower = AssFollower(path)
+    for uid, event in follower.follow(interval=0.5):
+        ...
+
+    第一次poll时解析文件中已经完整的内容（最后一个换行符之前），并返回其中
+    全部的event；之后每次poll只从上次结束的字节位置读取新追加的完整行，解析
+    后加入self.ass的Events，并返回新增的event。没有写完的最后一行会留到下
+    次读取，因此每次poll的开销只与新增的内容有关。
+
+    文件按字节位置读取，编码必须兼容ASCII（如utf-8、gbk），不支持utf-16。
+    Events之后出现其他标题行时，之后的内容都会被忽略。
+    """
+    __event_header = "[Events]"
+
+    def __init__(self, path, encoding="utf-8", callback=None, *args, **kwargs):
+        """
+        :param path: 字幕文件路径
+        :param encoding: 文件编码
+        :param callback: 每次poll读取到新event时调用，参数为(uid, event)列表
+        """
+        self.path = path
+        self.encoding = encoding
+        self.callback = callback
+        self.ass = None  # 头部内容完整后才会生成
+        self.offset = 0  # 已经解析的字节数
+        self.__matcher = None
+        self.__in_events = False  # 当前是否位于Events部分
+
+    def poll(self):
+        """
+        读取并解析新追加的完整行
+
+        :return: 新增event的(uid, event)列表，头部内容还不完整时返回空列表
+        """
+        with open(self.path, "rb") as f:
+            size = f.seek(0, 2)
+            if size < self.offset:
+                raise exceptions.SubFormatError("文件被截断或者替换：%s" % self.path)
+            f.seek(self.offset)
+            content = f.read(size - self.offset)
+        end = content.rfind(b"\n") + 1
+        if not end:
+            return []
+        text = content[:end].decode(self.encoding)
+
+        if self.ass is None:
+            new = self.__load(text)
+            if new is None:
+                return []
+        else:
+            new = self.__parse_lines(text)
+        self.offset += end
+        if new and self.callback is not None:
+            self.callback(new)
+        return new
+
+    def follow(self, interval=1.0, timeout=None, *args, **kwargs):
+        """
+        持续poll，逐条返回新增的event
+
+        :param interval: 没有新内容时等待的秒数
+        :param timeout: 超过该秒数没有新内容时结束，为None时一直等待
+        :return: (uid, event)的迭代器
+        """
+        import time
+        last = time.monotonic()
+        while True:
+            new = self.poll()
+            if new:
+                last = time.monotonic()
+                yield from new
+                continue
+            if timeout is not None and time.monotonic() - last >= timeout:
+                return
+            time.sleep(interval)
+
+    def __load(self, text):
+        """解析第一次读取到的内容，Events的Format行还没有写入时返回None"""
+        textlines = data_utils.clear_bom(text).split("\n")
+        section = None  # 最后一个标题
+        has_format = False
+        for line in textlines:
+            line = line.rstrip("\r")
+            if line.startswith("[") and line.endswith("]"):
+                section = line
+            elif section == self.__event_header and line:
+                has_format = True
+        if not has_format:
+            return None
+
+        ass = Ass()
+        ass.from_str(text)
+        ass.parse_all()
+        self.ass = ass
+        self.__matcher = AssParse.event_matcher("Format: %s" % ", ".join(ass.event_format))[1]
+        self.__in_events = section == self.__event_header
+        return [(uid, ass.event_[uid]) for uid in ass.event_uid]
+
+    def __parse_lines(self, text):
+        """解析新追加的行，抛弃不合法的event行"""
+        events, order = self.ass.event_, self.ass.event_uid
+        new = []
+        for line in text.split("\n"):
+            if not self.__in_events:
+                break
+            line = line.rstrip("\r")
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                self.__in_events = False
+                continue
+            re_res = self.__matcher.search(line)
+            if re_res:
+                uid = _new_uid(events)
+                events[uid] = re_res.groupdict()
+                order.append(uid)
+                new.append((uid, events[uid]))
+        return new
+
+
+class AssWriter(object):
+    """
+    流式写入ASS字幕
+
+    创建时会先写入header（Ass实例）的全部内容，之后每次调用write_event
+    都会在文件末尾追加一行event。path也可以是一个可写的文本流。
+    """
+    def __init__(self, path, header, furigana=False, encoding="utf-8", *args, **kwargs):
+        if not header.styles or not header.events:
+            raise exceptions.NoExists("无法写入字幕，原因：没有找到styles和events")
+        self.path = path
+        self.header = header
+        self.furigana = furigana
+        if hasattr(path, "write"):
+            self.__file, self.__close = path, False
+        else:
+            self.__file, self.__close = data_utils.open_write(path, encoding), True
+        self.__file.write("\n".join(header.as_textlines(furigana)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_event(self, event):
+        """写入单条event"""
+        self.__file.write("\n")
+        self.__file.write(self.header.rev_event_line(event, self.furigana))
+
+    def write_events(self, events):
+        """写入多条event"""
+        for event in events:
+            self.write_event(event)
+
+    def close(self):
+        """关闭文件"""
+        if self.__close:
+            self.__file.close()
+
+
+class SrtWriter(object):
+    """
+    流式写入SRT字幕
+
+    只写入Dialogue，特效标签中的\\i、\\b、\\u、\\s会被转换为html标签，其
+    余标签以及绘图指令会被去除。path也可以是一个可写的文本流。
+    """
+    def __init__(self, path, encoding="utf-8", *args, **kwargs):
+        self.path = path
+        self.count = 0  # 已写入的字幕块数量
+        if hasattr(path, "write"):
+            self.__file, self.__close = path, False
+        else:
+            self.__file, self.__close = data_utils.open_write(path, encoding), True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_event(self, event):
+        """写入单条event"""
+        if event["Format"] != "Dialogue":
+            return
+        text = self.ass2srt_text(event["Text"])
+        if not text:
+            return
+        self.count += 1
+        self.__file.write("%d\n%s --> %s\n%s\n\n" % (
+            self.count, self.__time(event["Start"]), self.__time(event["End"]), text))
+
+    def write_events(self, events):
+        """写入多条event"""
+        for event in events:
+            self.write_event(event)
+
+    def close(self):
+        """关闭文件"""
+        if self.__close:
+            self.__file.close()
+
+    @staticmethod
+    def ass2srt_text(text, *args, **kwargs):
+        """将ASS的Text转换为SRT文本"""
+        texts = []
+        in_drawing = False
+        for token in tokenizer.tokenize(text):
+            if token[0] == tokenizer.TEXT:
+                if not in_drawing:
+                    texts.append(token[1])
+                continue
+            for name, arg in token[2]:
+                if name == "p":
+                    in_drawing = bool(arg) and arg[0] not in ("", "0")
+                elif name in ("i", "b", "u", "s"):
+                    texts.append("</%s>" % name if arg and arg[0] == "0" else "<%s>" % name)
+        text = "".join(texts).replace("\\N", "\n").replace("\\n", "\n").replace("\\h", "\u00a0")
+        return "\n".join(line for line in text.split("\n") if line.strip())
+
+    @staticmethod
+    def __time(value):
+        """将ASS时间转换为SRT时间"""
+        seconds, cs = divmod(str2cs(value), 100)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, cs * 10)
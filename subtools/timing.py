@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+将event的时间吸附到关键帧以及帧边界
+
+关键帧文件（Aegisub keyframe format v1或者每行一个帧号）以及timecodes v2
+文件读取后转换为有序的时间数组（厘秒），之后对选中的全部event一次性进行
+二分查找：安装了NumPy时使用numpy.searchsorted，否则使用bisect。
+
+吸附规则：
+1. 指定了frames时，开始、结束时间吸附到最近的帧边界；
+2. 与最近的关键帧相差不超过tolerance（厘秒）时，吸附到该关键帧。
+吸附后结束时间早于开始时间的event保持不变。
+
+帧的开始时间为毫秒，转换为厘秒时向上取整，保证时间落在该帧内。
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from functools import partial
+from . import exceptions
+from .records import load_numpy
+from .utils.times import str2cs, cs2str
+
+SENTINEL = 1 << 62  # 有序时间数组首尾的哨兵值
+
+
+def _ms2cs(ms):
+    """帧开始时间（毫秒）转换为厘秒（向上取整）"""
+    return int(math.ceil(round(ms / 10, 6)))
+
+
+class Timecodes(object):
+    """视频每一帧的开始时间（毫秒）"""
+    def __init__(self, times):
+        """
+        :param times: 每一帧的开始时间（毫秒，递增）
+        """
+        if len(times) < 2:
+            raise ValueError("至少需要两帧的时间")
+        self.times = array("d", times)
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def from_file(path, encoding="utf-8", *args, **kwargs):
+        """读取timecodes v2文件"""
+        with open(path, encoding=encoding) as f:
+            lines = [line.strip() for line in f]
+        if not lines or not lines[0].lower().startswith("# timecode format v2"):
+            raise exceptions.SubFormatError("只支持timecodes v2格式：%s" % path)
+        times = []
+        for line in lines[1:]:
+            if line and not line.startswith("#"):
+                try:
+                    times.append(float(line))
+                except ValueError:
+                    raise exceptions.SubFormatError("不合法的时间：%s" % line)
+        return Timecodes(times)
+
+    @staticmethod
+    def from_fps(fps, count, *args, **kwargs):
+        """
+        固定帧率的时间
+
+        :param fps: 帧率，如24000 / 1001
+        :param count: 帧数
+        """
+        return Timecodes([frame * 1000 / fps for frame in range(count)])
+
+    def time(self, frame):
+        """获取帧的开始时间（毫秒），超出范围时按最后一帧的时长推算"""
+        if frame < len(self.times):
+            return self.times[frame]
+        last = self.times[-1] - self.times[-2]
+        return self.times[-1] + (frame - len(self.times) + 1) * last
+
+    def boundaries(self):
+        """全部帧边界（厘秒）"""
+        return array("q", map(_ms2cs, self.times))
+
+
+def load_keyframes(path, encoding="utf-8", *args, **kwargs):
+    """
+    读取关键帧文件
+
+    支持Aegisub keyframe format v1以及每行一个帧号的文本，#开头的行以及fps行会被忽略。
+
+    :return: 有序的关键帧帧号（array）
+    """
+    frames = set()
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line.lower().startswith("fps"):
+                continue
+            try:
+                frames.add(int(line))
+            except ValueError:
+                raise exceptions.SubFormatError("不合法的关键帧：%s" % line)
+    return array("q", sorted(frames))
+
+
+def _snap_to(points, values, tolerance, np=None):
+    """
+    将values中与points的最近点相差不超过tolerance的值替换为该点
+
+    points有序，并且首尾为SENTINEL（见Snapper.__points），因此不需要处理越界。
+    """
+    if np is not None:
+        values = np.asarray(values, dtype=np.int64)
+        index = np.searchsorted(points, values)
+        lower, upper = points[index - 1], points[index]
+        nearest = np.where(values - lower <= upper - values, lower, upper)
+        return np.where(np.abs(nearest - values) <= tolerance, nearest, values)
+
+    result = []
+    append = result.append
+    for value, index in zip(values, map(partial(bisect_left, points), values)):
+        lower, upper = points[index - 1], points[index]
+        nearest = lower if value - lower <= upper - value else upper
+        append(nearest if abs(nearest - value) <= tolerance else value)
+    return result
+
+
+class Snapper(object):
+    """
+    批量吸附开始、结束时间
+
+    snapper = Snapper(load_keyframes("kf.txt"), Timecodes.from_file("tc.txt"), tolerance=25)
+    new_starts, new_ends = snapper.snap(starts, ends)
+    """
+    def __init__(self, keyframes=None, timecodes=None, tolerance=25, frames=False, numpy=None, *args, **kwargs):
+        """
+        :param keyframes: 关键帧帧号
+        :param timecodes: Timecodes，使用关键帧或者frames时必须提供
+        :param tolerance: 吸附到关键帧的最大距离（厘秒）
+        :param frames: 是否先将时间吸附到最近的帧边界
+        :param numpy: 是否使用NumPy，为None时如果可以导入NumPy则使用
+        """
+        if timecodes is None and (keyframes is not None or frames):
+            raise ValueError("吸附到关键帧或者帧边界时需要提供timecodes")
+        self.tolerance = tolerance
+        self.np = load_numpy(numpy)
+        self.keyframes = None
+        self.frames = None
+        if keyframes is not None and len(keyframes):
+            self.keyframes = self.__points(array("q", sorted(set(_ms2cs(timecodes.time(frame))
+                                                                 for frame in keyframes))))
+        if frames:
+            boundaries = timecodes.boundaries()
+            self.frames = self.__points(boundaries)
+            # 吸附到帧边界的距离不超过最长帧的一半，超出视频范围的时间保持不变
+            self.frame_tolerance = max(b - a for a, b in zip(boundaries, boundaries[1:])) // 2 + 1
+
+    def __points(self, values):
+        """在首尾加上哨兵值"""
+        points = array("q", [-SENTINEL]) + values + array("q", [SENTINEL])
+        return self.np.asarray(points, dtype=self.np.int64) if self.np is not None else points
+
+    def snap(self, starts, ends):
+        """
+        :param starts: 开始时间（厘秒）
+        :param ends: 结束时间（厘秒）
+        :return: 吸附后的开始时间、结束时间（list）
+        """
+        # 先吸附到帧边界，再吸附到关键帧，重复处理时结果不变
+        new_starts, new_ends = starts, ends
+        if self.frames is not None:
+            new_starts = _snap_to(self.frames, new_starts, self.frame_tolerance, self.np)
+            new_ends = _snap_to(self.frames, new_ends, self.frame_tolerance, self.np)
+        if self.keyframes is not None:
+            new_starts = _snap_to(self.keyframes, new_starts, self.tolerance, self.np)
+            new_ends = _snap_to(self.keyframes, new_ends, self.tolerance, self.np)
+
+        if self.np is not None:
+            np = self.np
+            new_starts, new_ends = np.asarray(new_starts), np.asarray(new_ends)
+            invalid = new_ends < new_starts
+            new_starts = np.where(invalid, starts, new_starts)
+            new_ends = np.where(invalid, ends, new_ends)
+            return new_starts.tolist(), new_ends.tolist()
+
+        new_starts, new_ends = list(new_starts), list(new_ends)
+        for num, (start, end) in enumerate(zip(new_starts, new_ends)):
+            if end < start:
+                new_starts[num], new_ends[num] = starts[num], ends[num]
+        return new_starts, new_ends
+
+
+def snap(ass, snapper, styles=None, uids=None, *args, **kwargs):
+    """
+    吸附字幕中event的时间
+
+    :param ass: 已经解析了event的Ass实例
+    :param snapper: Snapper
+    :param styles: 只处理这些样式的event，为None时处理全部
+    :param uids: 只处理这些event，为None时处理全部
+    :return: 修改的event数
+    """
+    if not ass.events:
+        raise exceptions.NoExists("没有找到events")
+    events = ass.event_
+    uids = list(ass.event_uid if uids is None else uids)
+    if styles is not None:
+        styles = set(styles)
+        uids = [uid for uid in uids if events[uid]["Style"] in styles]
+    starts = [str2cs(events[uid]["Start"]) for uid in uids]
+    ends = [str2cs(events[uid]["End"]) for uid in uids]
+    new_starts, new_ends = snapper.snap(starts, ends)
+
+    count = 0
+    for uid, start, end, new_start, new_end in zip(uids, starts, ends, new_starts, new_ends):
+        if start != new_start or end != new_end:
+            events[uid]["Start"] = cs2str(new_start)
+            events[uid]["End"] = cs2str(new_end)
+            count += 1
+    return count
+
+
+def snap_store(store, snapper, *args, **kwargs):
+    """
+    吸附EventStore中event的时间，筛选条件与EventStore.query相同
+
+    :return: 修改的event数
+    """
+    return store.edit_times(snapper.snap, **kwargs)
@@ -4,15 +4,22 @@
 
 import os
 import re
-import chardet
-# import codecs
+import io
+import codecs
+import contextlib
+import importlib
 from subtools import exceptions
 
+# 压缩文件的扩展名与对应的标准库模块（第一次使用时才会导入）
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"}
+# 压缩文件的文件头
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "lzma"))
+READ_SIZE = 1024 * 1024  # 读取压缩文件时每次解压的字节数
 
 
 
 def get_encoding(content, *args, **kwargs):
-    """从unicode内容中获取编码"""
+    """从unicode内容中获取编码（chardet在第一次使用时才会导入）"""
     from chardet.universaldetector import UniversalDetector
 
     # 创建一个检测对象
@@ -25,9 +32,66 @@ def get_encoding(content, *args, **kwargs):
     detector.close()
     return detector.result.get("encoding")
 
+def split_compression(path):
+    """分离压缩扩展名，如("a.ass", ".gz")，不是压缩文件时为(path, "")"""
+    root, ext = os.path.splitext(path)
+    if ext.lower() in COMPRESSIONS:
+        return root, ext
+    return path, ""
+
+def _compression_of(head):
+    """根据文件头获取压缩格式对应的模块名，没有压缩时返回None"""
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def decompress(content, *args, **kwargs):
+    """解压gzip、bz2、xz格式的二进制内容，没有压缩时原样返回"""
+    name = _compression_of(content[:6])
+    if name is None:
+        return content
+    return importlib.import_module(name).decompress(content)
+
+def open_binary(path, *args, **kwargs):
+    """
+    以二进制流的方式打开文件用于读取
+
+    gzip、bz2、xz格式的文件（根据文件头判断）返回解压流，读取时逐块解压。
+    """
+    if not os.path.isfile(path):
+        raise exceptions.AssFilePathError("路径不存在，无法读取文件内容")
+    f = open(path, 'rb')
+    name = _compression_of(f.read(6))
+    if name is None:
+        f.seek(0)
+        return f
+    f.close()
+    return importlib.import_module(name).open(path, 'rb')
+
+def open_write(path, encoding="utf-8", *args, **kwargs):
+    """以文本流的方式打开文件用于写入，扩展名为.gz、.bz2、.xz时写入压缩格式"""
+    name = COMPRESSIONS.get(split_compression(path)[1].lower())
+    if name is None:
+        return open(path, 'w', encoding=encoding)
+    return importlib.import_module(name).open(path, 'wt', encoding=encoding)
+
+def _read_text(f, encoding):
+    """逐块读取、解码二进制流，不会生成完整的二进制内容"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parts = []
+    while True:
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            break
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
 def from_bin(content, encoding, *args, **kwargs):
-    """从二进制中获取字幕文本内容"""
+    """从二进制中获取字幕文本内容，gzip、bz2、xz格式的内容会先解压"""
     if isinstance(content, bytes):
+        content = decompress(content)
         try:
             return content.decode(encoding)
         except UnicodeDecodeError:
@@ -35,19 +99,113 @@ def from_bin(content, encoding, *args, **kwargs):
     return content
 
 def from_file(path, encoding, *args, **kwargs):
-    """从文件中获取字幕文本内容"""
-    if os.path.isfile(path):
-        f = open(path, 'rb')
-        content = f.read()
-        f.close()
+    """
+    从文件中获取字幕文本内容
+
+    gzip、bz2、xz格式的文件会逐块解压、解码，不会生成完整的解压后的二进制内容。
+    """
+    f = open_binary(path)
+    if isinstance(f, io.BufferedReader):
+        with f:
+            content = f.read()
         # content = open(path, "rb").read()
         try:
             return content.decode(encoding)
         except UnicodeDecodeError:
             # 如果指定编码无法解码文件内容，则尝试自动获取编码
             return content.decode(encoding=get_encoding(content[:10000]))
-    else:
-        raise exceptions.AssFilePathError("路径不存在，无法读取文件内容")
+    with f:
+        try:
+            return _read_text(f, encoding)
+        except UnicodeDecodeError:
+            f.seek(0)
+            encoding = get_encoding(f.read(10000))
+            f.seek(0)
+            return _read_text(f, encoding)
+
+def open_file(path, encoding, *args, **kwargs):
+    """
+    以文本流的方式打开字幕文件，不会一次性读取全部内容
+
+    只读取文件头部的内容来验证编码，如果指定编码无法解码，则尝试自动获取编码。
+    gzip、bz2、xz格式的文件会在读取时逐块解压。
+
+    :param path: 文件路径
+    :param encoding: 编码
+    :return: 文本流
+    """
+    f = open_binary(path)
+    head = f.read(10000)
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(head)
+    except UnicodeDecodeError:
+        encoding = get_encoding(head)
+    f.seek(0)
+    return io.TextIOWrapper(f, encoding=encoding)
+
+@contextlib.contextmanager
+def atomic_open(path, encoding="utf-8", *args, **kwargs):
+    """
+    以原子操作的方式写入文件
+
+    先写入同目录下的临时文件，全部写入成功后再替换目标文件；写入过程中发生
+    异常时删除临时文件，目标文件保持不变。扩展名为.gz、.bz2、.xz时写入压缩格式。
+
+    :param path: 文件路径
+    :param encoding: 编码
+    :return: 可写的文本流
+    """
+    fd, temp_path = _create_temp(path)
+    name = COMPRESSIONS.get(split_compression(path)[1].lower())
+    try:
+        with io.open(fd, 'wb') as raw:
+            stream = raw if name is None else importlib.import_module(name).open(raw, 'wb')
+            f = io.TextIOWrapper(stream, encoding=encoding)
+            try:
+                yield f
+                f.flush()
+            finally:
+                # 关闭压缩流时写入压缩格式的结尾（不会关闭raw）；没有压缩时只解除关联
+                if stream is raw:
+                    f.detach()
+                else:
+                    f.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        if os.path.exists(path):
+            # 沿用目标文件的权限；新文件的权限在创建临时文件时已经由umask决定
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _create_temp(path):
+    """
+    在目标文件所在的目录中创建临时文件，返回(fd, 临时文件路径)
+
+    与tempfile.mkstemp（权限固定为0600）不同，这里以0666创建，由系统按umask
+    得到新文件的默认权限，不需要读取或者修改进程的umask。
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        temp_path = os.path.join(directory, ".%s.%s.tmp" % (name, os.urandom(4).hex()))
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+
+def iter_lines(stream, *args, **kwargs):
+    """逐行读取文本流，去除行尾换行符以及文件头的bom"""
+    for num, line in enumerate(stream):
+        line = line.rstrip("\r\n")
+        if num == 0:
+            line = clear_bom(line)
+        yield line
 
 def clear_bom(text):
     """清理文件头的bom"""
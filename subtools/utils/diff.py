@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+比较两个Ass对象的事件，生成补丁并应用补丁
+
+补丁只包含发生变化的内容，结构如下（可以直接json序列化）：
+{
+    "base": 原文档的摘要,
+    "sections": {标题: 内容},  # 发生变化的Script Info、Garbage、Styles以及事件格式
+    "ops": [
+        ["d", uid],  # 删除
+        ["m", uid, {字段: 值}],  # 修改，值为None时删除该字段
+        ["i", uid, after, event],  # 在after之后插入，after为None时插入到开头
+        ["v", uid, after],  # 移动到after之后
+    ],
+}
+
+补丁中的uid都是原文档（old）中的uid，插入的事件使用新文档中的uid。
+"""
+
+import bisect
+import hashlib
+import json
+from .. import exceptions
+
+# 快照中的只读dict不能直接json序列化，比较时进行转换
+_dumps = json.JSONEncoder(default=dict, sort_keys=True).encode
+
+
+def event_hash(event, *args, **kwargs):
+    """
+    计算单条event的内容摘要
+
+    :param event: event内容（dict）
+    :return: 16位十六进制字符串
+    """
+    content = "\x1e".join("%s\x1f%s" % (k, event[k]) for k in sorted(event))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def doc_hash(ass, *args, **kwargs):
+    """计算文档全部事件（包含顺序）的摘要"""
+    digest = hashlib.blake2b(digest_size=8)
+    for uid in ass.event_uid:
+        digest.update(event_hash(ass.event_[uid]).encode("ascii"))
+    return digest.hexdigest()
+
+
+def diff(old, new, *args, **kwargs):
+    """
+    比较两个Ass对象，生成从old到new的补丁
+
+    先匹配uid与内容摘要都相同的事件，剩余的事件根据内容摘要匹配，最后
+    uid相同但摘要不同的事件视为修改（uid是随机生成的，不同文档之间可能
+    重复，所以放在最后）。未匹配的旧事件会被删除，未匹配的新事件会被插
+    入。匹配的事件中，保持相对顺序的最长部分（最长递增子序列）不做处理，
+    其余视为移动。整个过程的复杂度为O(n log n)。
+
+    :param old: 原Ass对象
+    :param new: 新Ass对象
+    :return: 补丁（dict）
+    """
+    if not old.events or not new.events:
+        raise exceptions.NoExists("无法比较，原因：没有找到events")
+
+    old_hashes = {uid: event_hash(old.event_[uid]) for uid in old.event_uid}
+    new_hashes = [event_hash(new.event_[uid]) for uid in new.event_uid]
+    old_pos = {uid: num for num, uid in enumerate(old.event_uid)}
+
+    # 第一轮：uid与摘要都相同
+    matched = [uid if old_hashes.get(uid) == hash_ else None
+               for uid, hash_ in zip(new.event_uid, new_hashes)]  # 新文档顺序中每条事件对应的旧uid
+    used = set(uid for uid in matched if uid is not None)
+    # 第二轮：根据摘要匹配剩余事件
+    by_hash = {}
+    for uid in reversed(old.event_uid):
+        if uid not in used:
+            by_hash.setdefault(old_hashes[uid], []).append(uid)
+    for num, hash_ in enumerate(new_hashes):
+        if matched[num] is None and by_hash.get(hash_):
+            matched[num] = by_hash[hash_].pop()
+            used.add(matched[num])
+    # 第三轮：uid相同但内容不同，视为修改
+    ops = []
+    for num, uid in enumerate(new.event_uid):
+        if matched[num] is None and uid in old_pos and uid not in used:
+            matched[num] = uid
+            used.add(uid)
+            ops.append(["m", uid, _changed_fields(old.event_[uid], new.event_[uid])])
+
+    for uid in old.event_uid:
+        if uid not in used:
+            ops.append(["d", uid])
+
+    # 插入事件使用新文档中的uid，与旧文档冲突时重新生成
+    taken = set(old_pos)
+    stable = _longest_increasing([old_pos[uid] for uid in matched if uid is not None])
+    after = None
+    num = 0
+    for new_uid, old_uid in zip(new.event_uid, matched):
+        if old_uid is None:
+            uid = new_uid
+            while uid in taken:
+                uid = hashlib.blake2b(uid.encode("ascii"), digest_size=3).hexdigest()
+            taken.add(uid)
+            ops.append(["i", uid, after, _plain(new.event_[new_uid])])
+            after = uid
+            continue
+        if num not in stable:
+            ops.append(["v", old_uid, after])
+        num += 1
+        after = old_uid
+
+    sections = {}
+    for title in ("Script Info", "Aegisub Project Garbage"):
+        if _dumps(old.text_dict[title]) != _dumps(new.text_dict[title]):
+            sections[title] = _plain(new.text_dict[title])
+    # 样式的uid每次解析都会重新生成，这里只比较样式内容及其顺序
+    if old.rev_style_lines() != new.rev_style_lines():
+        sections["V4+ Styles"] = _plain(new.styles)
+    if list(old.event_format) != list(new.event_format):  # 快照中为tuple
+        sections["format"] = _plain(new.event_format)
+
+    return {"base": doc_hash(old), "sections": sections, "ops": ops}
+
+
+def patch(ass, patch_, verify=True, *args, **kwargs):
+    """
+    将补丁应用到Ass对象上（直接修改该对象）
+
+    :param ass: Ass对象（对应diff时的old）
+    :param patch_: diff生成的补丁（dict）
+    :param verify: 是否验证补丁是否基于该文档生成
+    :return: ass
+    """
+    if not ass.events:
+        raise exceptions.NoExists("无法应用补丁，原因：没有找到events")
+    if verify and patch_["base"] != doc_hash(ass):
+        raise exceptions.PatchError("应用补丁时发生错误。原因：补丁与当前文档不匹配。")
+
+    event_body = ass.text_dict["Events"]
+    events = event_body["event"]
+    removed = set()
+    follow = {}  # after -> 紧跟在after之后的uid
+    for op in patch_["ops"]:
+        uid = op[1]
+        if op[0] == "i":
+            if uid in events:
+                raise exceptions.PatchError("应用补丁时发生错误。原因：uid %s已存在。" % uid)
+            events[uid] = dict(op[3])
+            follow[op[2]] = uid
+            continue
+        if uid not in events:
+            raise exceptions.PatchError("应用补丁时发生错误。原因：没有找到uid %s。" % uid)
+        if op[0] == "d":
+            removed.add(uid)
+            del events[uid]
+        elif op[0] == "m":
+            for key, value in op[2].items():
+                if value is None:
+                    events[uid].pop(key, None)
+                else:
+                    events[uid][key] = value
+        elif op[0] == "v":
+            removed.add(uid)
+            follow[op[2]] = uid
+        else:
+            raise exceptions.PatchError("应用补丁时发生错误。原因：未知的操作%s。" % op[0])
+
+    order = []
+    for uid in [None] + event_body["order"]:
+        if uid in removed:
+            continue
+        if uid is not None:
+            order.append(uid)
+        # 依次加入插入或移动到该事件之后的事件
+        while uid in follow:
+            uid = follow.pop(uid)
+            order.append(uid)
+    event_body["order"] = order
+
+    for title, value in patch_["sections"].items():
+        if title == "format":
+            event_body["format"] = list(value)
+        else:
+            ass.text_dict[title] = value
+    return ass
+
+
+def _plain(value):
+    """
+    转换为普通的dict、list，使补丁可以直接json序列化
+
+    零拷贝模式下的event、style为OffsetRecord，不能直接放入补丁中。
+    """
+    if hasattr(value, "keys"):
+        return {key: _plain(value[key]) for key in value.keys()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _changed_fields(old_event, new_event):
+    """获取两条event之间发生变化的字段"""
+    changed = {k: v for k, v in new_event.items() if old_event.get(k) != v}
+    changed.update({k: None for k in old_event if k not in new_event})
+    return changed
+
+
+def _longest_increasing(seq):
+    """获取最长递增子序列的下标（set）"""
+    tails = []  # tails[n]为长度n+1的递增子序列的最小结尾值
+    tails_idx = []
+    prev = [-1] * len(seq)
+    for num, value in enumerate(seq):
+        pos = bisect.bisect_left(tails, value)
+        if pos == len(tails):
+            tails.append(value)
+            tails_idx.append(num)
+        else:
+            tails[pos] = value
+            tails_idx[pos] = num
+        prev[num] = tails_idx[pos - 1] if pos else -1
+
+    stable = set()
+    num = tails_idx[-1] if tails_idx else -1
+    while num != -1:
+        stable.add(num)
+        num = prev[num]
+    return stable
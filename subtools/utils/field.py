@@ -2,6 +2,11 @@
 # -*- coding: utf-8 -*-
 # author: "Kairu"
 
+import operator
+import re
+from .. import exceptions
+
+
 class Field(object):
     """字段内容"""
     def __init__(self, re_key="", re_val="", zh_title="", default=None, order=None, default_order=None):
@@ -10,4 +15,187 @@ class Field(object):
         self.default = default
         self.zh_title = zh_title
         self.order = order
-        self.default_order = default_order
\ No newline at end of file
+        self.default_order = default_order
+
+class KeyValueSchema(object):
+    """
+    键值对形式的内容（Script Info、Aegisub Project Garbage）的字段定义
+
+    第一次使用时将字段定义编译为一个匹配键值行的正则表达式，以及每个键
+    对应的值的正则表达式，之后解析每行时不再重新生成正则表达式。通过
+    register添加自定义的键后，会在下次使用时重新编译。
+    """
+    LINE_RE = re.compile(r"^(?:(?P<comment>;)\s?|(?P<key>[\w\s]+):\s?)(?P<value>.*)$")
+
+    def __init__(self, fields, order, defaults=None):
+        """
+        :param fields: 键与Field的dict
+        :param order: 反向解析时键的顺序
+        :param defaults: 必选的键与默认值的dict
+        """
+        self.fields = dict(fields)
+        self.order = tuple(order)
+        self.defaults = dict(defaults or {})
+        self.__values = None
+
+    def register(self, key, re_val=r".*", zh_title="", default=None):
+        """
+        注册自定义的键
+
+        :param key: 键名，只能包含字母、数字、下划线以及空格
+        :param re_val: 值的正则表达式
+        :param zh_title: 中文名称
+        :param default: 默认值，不为None时该键为必选项
+        """
+        if not re.fullmatch(r"[\w\s]+", key):
+            raise ValueError("不合法的键名：%s" % key)
+        self.fields[key] = Field(r"[\w\s]+:\s?", re_val, zh_title)
+        if key not in self.order:
+            self.order = self.order + (key,)
+        if default is not None:
+            self.defaults[key] = default
+        self.__values = None
+
+    @property
+    def values(self):
+        """键与编译好的值的正则表达式的dict"""
+        if self.__values is None:
+            self.__values = {key: re.compile(field.re_val) for key, field in self.fields.items()}
+        return self.__values
+
+    def match(self, line):
+        """
+        匹配键值行
+
+        :param line: 行内容
+        :return: (键, 值)，不是合法的键值行时返回None
+        """
+        re_res = self.LINE_RE.match(line)
+        if not re_res:
+            return None
+        return re_res.group("comment") or re_res.group("key"), re_res.group("value")
+
+    def serialize(self, body):
+        """将解析结果反向解析为文本列表（按order的顺序）"""
+        textlines = []
+        for key in self.order:
+            if key not in body:
+                continue
+            if key == ";":
+                value = body[key]["value"]
+                textlines.extend("; %s" % item for item in (value if isinstance(value, (list, tuple)) else [value]))
+            else:
+                textlines.append("%s: %s" % (key, body[key]["value"]))
+        return textlines
+
+
+class RecordSchema(object):
+    """
+    以Format行定义字段的内容（V4+ Styles、Events）的字段定义
+
+    根据Format行生成的正则表达式以及反向解析的函数会按Format缓存，同一
+    个Format只会编译一次。
+    """
+    def __init__(self, fields, prefix, name, last=None, head=None):
+        """
+        :param fields: 字段名与Field的dict
+        :param prefix: 匹配行首（Style:、Dialogue:等）的正则表达式
+        :param name: 名称，用于错误信息
+        :param last: Format行的最后一项必须为该字段，为None时不检查
+        :param head: 反向解析时使用的行首，为None时使用记录的Format字段
+        """
+        self.fields = fields
+        self.prefix = prefix
+        self.name = name
+        self.last = last
+        self.head = head
+        self.__matchers = {}
+        self.__serializers = {}
+        self.__values = {}
+
+    def matcher(self, format_line):
+        """
+        根据Format行生成用于匹配每行内容的正则表达式
+
+        :param format_line: Format行内容
+        :return: format列表和编译好的正则表达式
+        """
+        cached = self.__matchers.get(format_line)
+        if cached is None:
+            cached = self.__compile(format_line)
+            self.__matchers[format_line] = cached
+        return list(cached[0]), cached[1]
+
+    def __compile(self, format_line):
+        if not format_line.startswith("Format:"):
+            raise exceptions.AssParseError("解析ASS文件%s时发生错误。"
+                                           "原因：没有找到Format行内容。" % self.name)
+
+        formats = tuple(format_.strip() for format_ in format_line[len("Format:"):].split(","))
+        for format_ in formats:
+            if format_ not in self.fields:
+                raise exceptions.AssParseError("解析ASS文件%s时发生错误。"
+                                               "原因：Format的内容相存在不合法项目或无效项目。" % self.name)
+        if self.last and formats[-1] != self.last:
+            raise exceptions.AssParseError("解析ASS文件%s时发生错误。"
+                                           "原因：Format行最后项非%s。" % (self.name, self.last))
+        val_re = r",\s?".join(self.fields[format_].re_val for format_ in formats)
+        return formats, re.compile(r"^%s%s$" % (self.prefix, val_re))
+
+    def serializer(self, formats):
+        """
+        获取反向解析单条记录的函数
+
+        最后一项字段可以通过函数的第二个参数替换为其它字段（如furigana），
+        该字段不存在时使用原字段。
+
+        :param formats: format列表
+        :return: 接收记录（dict）以及最后一项的替换字段，返回行内容的函数
+        """
+        formats = tuple(formats)
+        func = self.__serializers.get(formats)
+        if func is None:
+            func = self.__make_serializer(formats)
+            self.__serializers[formats] = func
+        return func
+
+    def __make_serializer(self, formats):
+        keys = formats[:-1]
+        last = formats[-1]
+        head = self.head
+        if len(keys) > 1:
+            getter = operator.itemgetter(*keys)
+        else:
+            def getter(record):
+                return tuple(record[key] for key in keys)
+
+        def serialize(record, replace=None):
+            value = record[replace] if replace is not None and replace in record else record[last]
+            return "%s: %s" % (head or record["Format"], ",".join(getter(record) + (value,)))
+        return serialize
+
+    def diagnose(self, line, formats):
+        """
+        找出不合法行中第一个不合法的字段
+
+        只在整行匹配失败后调用，不影响正常行的解析速度。
+
+        :param line: 行内容
+        :param formats: format列表
+        :return: 字段名和原因
+        """
+        re_res = re.match(self.prefix, line)
+        if not re_res:
+            return None, "不是合法的%s行" % self.name
+
+        values = line[re_res.end():].split(",", len(formats) - 1)
+        for format_, value in zip(formats, values):
+            if value.startswith(" "):
+                value = value[1:]
+            if format_ not in self.__values:
+                self.__values[format_] = re.compile(self.fields[format_].re_val)
+            if not self.__values[format_].fullmatch(value):
+                return format_, "字段内容不合法：%s" % value
+        if len(values) < len(formats):
+            return formats[len(values)], "字段数量不足，需要%d项，实际为%d项" % (len(formats), len(values))
+        return None, "行内容不合法"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+只读的text_dict（快照）
+
+freeze将dict转换为MappingProxyType，list转换为tuple；字符串等不可变对象
+直接共用，只复制容器本身，比copy.deepcopy快很多。零拷贝模式下的
+OffsetRecord转换为FrozenRecord，仍然只保存偏移量。
+
+快照中的任何内容都无法被修改，多个线程可以不加锁地同时读取、生成文本；
+原字幕之后的修改也不会影响快照。
+"""
+
+from types import MappingProxyType
+from .offsets import OffsetRecord
+
+STR_TYPES = {str}
+
+
+def _flat(values):
+    """是否全部为字符串（event、style等单条记录）"""
+    return set(map(type, values)) <= STR_TYPES
+
+
+def freeze(value):
+    """生成只读的副本"""
+    if isinstance(value, (dict, MappingProxyType)):
+        if _flat(value.values()):
+            return MappingProxyType(value.copy())
+        return MappingProxyType({key: item if type(item) is str else freeze(item)
+                                 for key, item in value.items()})
+    if isinstance(value, OffsetRecord):
+        return value.freeze()
+    if isinstance(value, (list, tuple)):
+        return tuple(item if type(item) is str else freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """由只读的副本生成可以修改的副本"""
+    if isinstance(value, (dict, MappingProxyType)):
+        if _flat(value.values()):
+            return value.copy()
+        return {key: item if type(item) is str else thaw(item) for key, item in value.items()}
+    if isinstance(value, OffsetRecord):
+        return value.copy()
+    if isinstance(value, (list, tuple)):
+        return [item if type(item) is str else thaw(item) for item in value]
+    return value
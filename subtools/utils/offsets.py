@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+以偏移量的形式保存解析结果（零拷贝模式）
+
+普通模式下，字幕内容会同时存在三份：self.text、按行分割后的文本列表，
+以及每条event、style的字段值。零拷贝模式下只保留self.text：
+
+LineIndex：只保存每行的起止偏移量，读取某一行时才生成字符串。
+OffsetRecord：只保存该行的起止偏移量，读取字段时才重新匹配该行并生成
+字符串；修改后的字段单独保存。
+
+OffsetRecord实现了Mapping的全部接口，可以像dict一样使用；复制、pickle
+时会转换为普通的dict。
+"""
+
+import re
+from array import array
+from collections.abc import MutableMapping, Sequence
+
+# 与str.splitlines相同的换行符
+LINE_END_RE = re.compile(r"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+_DELETED = object()  # 标记被删除的字段
+
+
+class LineIndex(Sequence):
+    """
+    按行访问文本，与text.splitlines()的结果相同，但只保存每行的偏移量
+
+    切片返回的是逐行生成字符串的迭代器，而不是列表。
+    """
+    def __init__(self, text):
+        self.text = text
+        self.__starts = array("q")
+        self.__ends = array("q")
+        pos = 0
+        for re_res in LINE_END_RE.finditer(text):
+            self.__starts.append(pos)
+            self.__ends.append(re_res.start())
+            pos = re_res.end()
+        if pos < len(text):
+            self.__starts.append(pos)
+            self.__ends.append(len(text))
+
+    def __len__(self):
+        return len(self.__starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("LineIndex不支持步长")
+            return (self.text[start:end]
+                    for start, end in zip(self.__starts[index], self.__ends[index]))
+        return self.text[self.__starts[index]:self.__ends[index]]
+
+    def span(self, index):
+        """获取第index行的起止偏移量"""
+        return self.__starts[index], self.__ends[index]
+
+
+class RecordLayout(object):
+    """
+    同一部分（如Events）内所有OffsetRecord共享的内容
+
+    保存文本、用于匹配每行的正则表达式，以及最近一次匹配的结果。连续读
+    取同一条记录的多个字段时只会匹配一次。
+    """
+    def __init__(self, text, matcher):
+        self.text = text
+        self.matcher = matcher
+        self.keys = tuple(matcher.groupindex)
+        self.key_set = frozenset(self.keys)
+        self.__last = (None, None)
+
+    def values(self, start, end):
+        """获取start开始的行的全部字段值（dict，不要修改）"""
+        # 快照可能在多个线程中同时读取，只读取一次self.__last，并返回本次使用的结果
+        last = self.__last
+        if last[0] == start:
+            return last[1]
+        values = self.matcher.search(self.text[start:end]).groupdict()
+        self.__last = (start, values)
+        return values
+
+
+class OffsetRecord(MutableMapping):
+    """以偏移量保存的单条event或者style"""
+    __slots__ = ("_layout", "_start", "_end", "_changes")
+
+    def __init__(self, layout, start, end):
+        self._layout = layout
+        self._start = start
+        self._end = end
+        self._changes = None  # 被修改的字段，没有修改时为None
+
+    def __getitem__(self, key):
+        if self._changes and key in self._changes:
+            value = self._changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        if key not in self._layout.key_set:
+            raise KeyError(key)
+        return self._layout.values(self._start, self._end)[key]
+
+    def __setitem__(self, key, value):
+        if self._changes is None:
+            self._changes = {}
+        self._changes[key] = value
+
+    def __delitem__(self, key):
+        self[key]  # 字段不存在时触发KeyError
+        self[key] = _DELETED
+
+    def __iter__(self):
+        changes = self._changes or {}
+        for key in self._layout.keys:
+            if changes.get(key) is not _DELETED:
+                yield key
+        for key, value in changes.items():
+            if key not in self._layout.key_set and value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "OffsetRecord(%r)" % dict(self)
+
+    def __reduce__(self):
+        # 复制、pickle时转换为普通的dict
+        return dict, (dict(self),)
+
+    @property
+    def span(self):
+        """该行在原文本中的起止偏移量"""
+        return self._start, self._end
+
+    def copy(self):
+        """复制（共用原文本，只复制修改过的字段）"""
+        record = OffsetRecord(self._layout, self._start, self._end)
+        if self._changes:
+            record._changes = dict(self._changes)
+        return record
+
+    def freeze(self):
+        """生成只读的副本"""
+        record = FrozenRecord(self._layout, self._start, self._end)
+        if self._changes:
+            record._changes = dict(self._changes)
+        return record
+
+
+class FrozenRecord(OffsetRecord):
+    """只读的OffsetRecord，见utils.frozen"""
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        raise TypeError("只读的记录不支持修改")
+
+    def __delitem__(self, key):
+        raise TypeError("只读的记录不支持修改")
@@ -2,17 +2,19 @@
 # -*- coding: utf-8 -*-
 # author: "Kairu"
 
-"""调用雅虎的API接口，对汉字进行假名标注"""
+"""
+调用雅虎的API接口，对汉字进行假名标注
+
+requests、xmltodict、asyncio等依赖只会在第一次请求API时导入，只进行
+解析的程序不需要承担这部分导入时间。
+"""
 
-import json
-import requests
-import xmltodict
 import copy
-import uuid
 import re
-import urllib.request
 from collections import OrderedDict
+from types import MappingProxyType
 from subtools import exceptions
+from subtools.parselib import _new_uid
 
 
 YAHOO_API_URL = "https://jlp.yahooapis.jp/FuriganaService/V1/furigana"
@@ -41,8 +43,8 @@ CHAR_AMENT = {
     "✕": "X",
 }
 
-# Aegisub自动注音卡拉OK脚本
-FURI_EVENT =[
+# Aegisub自动注音卡拉OK脚本（只读）
+FURI_EVENT = tuple(MappingProxyType(event) for event in [
     {
         "Format": "Comment",
         "Layer": "0",
@@ -69,7 +71,7 @@ FURI_EVENT =[
         "Effect": "template syl",
         "Text": r"{\pos(!line.left+syl.center!,!line.middle!)\an5\k!syl.start_time/10!\k$kdur}",
     }
-]
+])
 
 
 def add_furi_karacode(ass, style_name):
@@ -83,16 +85,13 @@ def add_furi_karacode(ass, style_name):
     tmp = ass.text_dict[ass._Ass__event_header]
     # 添加所有目标样式的注音脚本
     for style in style_name:
-        for event in FURI_EVENT:
-            event["Style"] = style
-            # 生成uid，并确保uid是在order里是唯一的
-            while True:
-                uid = uuid.uuid4().hex[-6:]
-                if uid not in tmp["order"]: break
+        for template in FURI_EVENT:
+            # 生成uid，并确保uid是唯一的
+            uid = _new_uid(tmp["event"])
             # 添加uid
             tmp["order"].insert(0, uid)
-            # 添加脚本事件
-            tmp["event"][uid] = copy.deepcopy(event)
+            # 添加脚本事件（复制模板，模板本身是只读的，多个字幕、线程之间共用）
+            tmp["event"][uid] = dict(template, Style=style)
 
 def yahoo_rubi(text, appid, grade=1, *args, **kwargs):
     """
@@ -105,6 +104,9 @@ def yahoo_rubi(text, appid, grade=1, *args, **kwargs):
     :param kwargs:
     :return:
     """
+    import requests
+    import xmltodict
+
     # print(len(text))
     data = {
         "appid": appid,  # APPID
@@ -121,6 +123,48 @@ def yahoo_rubi(text, appid, grade=1, *args, **kwargs):
             raise exceptions.RequestError("提交data到yahoo时发生错误，原因：%s" % request.reason)
         return xmltodict.parse(request.content.decode("utf-8"))
 
+async def ayahoo_rubi(text, appid, grade=1, session=None, *args, **kwargs):
+    """
+    利用yahoo API进行假名标注（异步）
+
+    传入aiohttp的ClientSession时使用非阻塞的HTTP请求，否则在默认的
+    executor中调用yahoo_rubi，不会阻塞事件循环。
+
+    :param text:
+    :param appid:
+    :param grade:
+    :param session: aiohttp.ClientSession或者None
+    :param args:
+    :param kwargs:
+    :return:
+    """
+    import asyncio
+    import urllib.parse
+    import xmltodict
+
+    if session is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, yahoo_rubi, text, appid, grade)
+
+    data = {
+        "appid": appid,  # APPID
+        "grade": str(grade),  # 等级(1-8)
+        "sentence": text,  # 对象文本
+    }
+    # 手动进行urlencode，避免bytes内容被当作文件上传
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    try:
+        async with session.post(YAHOO_API_URL, data=urllib.parse.urlencode(data), headers=headers) as response:
+            content = await response.read()
+            status, reason = response.status, response.reason
+    except Exception:
+        return
+    # 如果返回状态码非200，触发异常
+    if status != 200:
+        raise exceptions.RequestError("提交data到yahoo时发生错误，原因：%s" % reason)
+    return xmltodict.parse(content.decode("utf-8"))
+
+
 def parse_ord(xml_dict):
     """
     提取OrderedDict内的有效信息，并存放到列表内
@@ -186,8 +230,39 @@ def to_rubitext(ass, text_list, appid="", style_name=[], grade=1, *args, **kwarg
     reversed_ = []
     for text in text_list:
         reversed_.append(parse_ord(yahoo_rubi(text, appid, grade)))
+    set_rubitext(ass, reversed_, style_name)
+
+async def ato_rubitext(ass, text_list, appid="", style_name=[], grade=1, session=None, concurrency=4,
+                       *args, **kwargs):
+    """
+    异步并发请求yahoo API，同时进行的请求数不超过concurrency
+
+    :param session: aiohttp.ClientSession或者None
+    :param concurrency: 最大并发请求数
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(text):
+        async with semaphore:
+            return parse_ord(await ayahoo_rubi(text, appid, grade, session))
+
+    # gather会保持结果的顺序与text_list一致
+    reversed_ = await asyncio.gather(*[request(text) for text in text_list])
+    set_rubitext(ass, list(reversed_), style_name)
+
+def set_rubitext(ass, reversed_, style_name=[], *args, **kwargs):
+    """
+    将yahoo API的结果写入到ass中
+
+    :param ass: Ass实例化对象
+    :param reversed_: 每组文本经过parse_ord处理后的结果（list）
+    :param style_name: 经过处理的目标样式名
+    :return:
+    """
     # 写入api调用次数
-    ass.text_dict["apires_count"] = len(text_list)
+    ass.text_dict["apires_count"] = len(reversed_)
     # 逆向工程
     furi_list = rev_ord2text(reversed_)
     # 添加注音的文本
@@ -277,4 +352,34 @@ def furigana(ass, appid="", style_name=[], grade=1, *args, **kwargs):
     :return:
     """
     text_list, style_name = get_event(ass, style_name)
-    to_rubitext(ass, text_list, appid, style_name, grade)
\ No newline at end of file
+    to_rubitext(ass, text_list, appid, style_name, grade)
+
+async def afurigana(ass, appid="", style_name=[], grade=1, session=None, concurrency=4, *args, **kwargs):
+    """
+    给字幕注音（异步）
+
+    如果没有传入session，并且安装了aiohttp，则会创建一个临时的
+    ClientSession；没有安装aiohttp时，请求会在默认的executor中进行。
+
+    :param ass: Ass实例化对象
+    :param style_name: 经过处理的目标样式名
+    :param appid: 雅虎appid
+    :param grade: 注音等级(1-8)
+    :param session: aiohttp.ClientSession或者None
+    :param concurrency: 最大并发请求数
+    :param args:
+    :param kwargs:
+    :return:
+    """
+    text_list, style_name = get_event(ass, style_name)
+    if session is not None:
+        await ato_rubitext(ass, text_list, appid, style_name, grade, session, concurrency)
+        return
+
+    try:
+        import aiohttp
+    except ImportError:
+        await ato_rubitext(ass, text_list, appid, style_name, grade, None, concurrency)
+        return
+    async with aiohttp.ClientSession() as session:
+        await ato_rubitext(ass, text_list, appid, style_name, grade, session, concurrency)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""ASS时间格式(H:MM:SS.cc)与厘秒之间的转换"""
+
+
+def str2cs(text, *args, **kwargs):
+    """
+    将ASS时间转换为厘秒
+
+    秒的小数部分如果是三位（毫秒），则舍去最后一位。
+
+    :param text: ASS时间，如：0:01:02.50
+    :return: 厘秒（int）
+    """
+    hours, minutes, seconds = text.split(":")
+    frac = seconds[3:5]
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds[:2])) * 100 + int(frac or 0)
+
+
+def cs2str(cs, *args, **kwargs):
+    """
+    将厘秒转换为ASS时间
+
+    :param cs: 厘秒（int）
+    :return: ASS时间，如：0:01:02.50
+    """
+    cs = max(int(cs), 0)
+    seconds, cs = divmod(cs, 100)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d.%02d" % (hours, minutes, seconds, cs)
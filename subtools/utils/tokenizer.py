@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# author: "Kairu"
+
+"""
+解析event Text中的特效标签
+
+Text会被解析为由文本和特效块组成的token列表：
+(TEXT, "文本")
+(OVERRIDE, "{\\pos(1,2)\\k20}", (("pos", ("1", "2")), ("k", ("20",))))
+
+特效块内不以反斜杠开头的内容（注释）不会出现在解析后的标签中。
+"""
+
+import re
+
+TEXT = 0  # 文本
+OVERRIDE = 1  # 特效块
+
+# 已知的标签名，解析时优先匹配较长的标签名（如fscx优先于fs）
+TAG_NAMES = (
+    "xbord", "ybord", "xshad", "yshad", "iclip", "alpha", "blur", "bord", "shad",
+    "fscx", "fscy", "fade", "clip", "move", "pos", "org", "fad", "fax", "fay",
+    "fsp", "frx", "fry", "frz", "pbo", "fs", "fr", "fn", "fe", "an", "be",
+    "1c", "2c", "3c", "4c", "1a", "2a", "3a", "4a", "kf", "ko", "kt",
+    "a", "b", "c", "i", "k", "K", "p", "q", "r", "s", "t", "u",
+)
+# 卡拉OK标签
+KARAOKE_TAGS = ("k", "K", "kf", "ko")
+
+BLOCK_RE = re.compile(r"\{[^}]*\}")
+SPECIAL_RE = re.compile(r"[()\\]")  # 分割标签时需要处理的字符
+SEPARATOR_RE = re.compile(r"[(),]")  # 分割参数时需要处理的字符
+TAG_RE = re.compile(r"(%s|[A-Za-z]*)(.*)" % "|".join(sorted(TAG_NAMES, key=len, reverse=True)), re.S)
+
+
+def tokenize(text, *args, **kwargs):
+    """
+    将Text解析为token列表
+
+    :param text: event Text
+    :return: token元组
+    """
+    tokens = []
+    pos = 0
+    for re_res in BLOCK_RE.finditer(text):
+        if re_res.start() > pos:
+            tokens.append((TEXT, text[pos:re_res.start()]))
+        block = re_res.group()
+        tokens.append((OVERRIDE, block, parse_tags(block[1:-1])))
+        pos = re_res.end()
+    if pos < len(text):
+        tokens.append((TEXT, text[pos:]))
+    return tuple(tokens)
+
+
+def parse_tags(block, *args, **kwargs):
+    """
+    解析特效块（不包含花括号）中的标签
+
+    :param block: 特效块内容，如：\\pos(1,2)\\k20
+    :return: (标签名, 参数元组)组成的元组
+    """
+    if "\\t(" not in block:
+        # 只有\t的括号内会嵌套其它标签，其余情况可以直接分割
+        pieces = block.split("\\")[1:]
+    else:
+        # 只在括号外分割
+        pieces = []
+        depth = 0
+        last = None
+        for re_res in SPECIAL_RE.finditer(block):
+            char = re_res.group()
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max(depth - 1, 0)
+            elif depth == 0:
+                num = re_res.start()
+                if last is not None:
+                    pieces.append(block[last:num])
+                last = num + 1
+        if last is not None:
+            pieces.append(block[last:])
+
+    tags = []
+    for piece in pieces:
+        name, arg = TAG_RE.match(piece).groups()
+        if arg.startswith("("):
+            tags.append((name, split_args(arg[1:-1] if arg.endswith(")") else arg[1:])))
+        else:
+            tags.append((name, (arg,) if arg else ()))
+    return tuple(tags)
+
+
+def split_args(arg, *args, **kwargs):
+    """在括号外的逗号处分割参数"""
+    if "(" not in arg:
+        return tuple(item.strip() for item in arg.split(","))
+    items = []
+    depth = 0
+    last = 0
+    for re_res in SEPARATOR_RE.finditer(arg):
+        char = re_res.group()
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            items.append(arg[last:re_res.start()].strip())
+            last = re_res.end()
+    items.append(arg[last:].strip())
+    return tuple(items)
+
+
+def plain_text(tokens, drawing=False, *args, **kwargs):
+    """
+    获取去除特效标签后的纯文本
+
+    \\N、\\n会转换为换行符，\\h转换为不换行空格。绘图模式（\\p大于0）下的
+    绘图指令默认不包含在内。
+
+    :param tokens: tokenize的结果
+    :param drawing: 是否保留绘图指令
+    :return: 纯文本
+    """
+    texts = []
+    in_drawing = False
+    for token in tokens:
+        if token[0] == OVERRIDE:
+            for name, arg in token[2]:
+                if name == "p":
+                    in_drawing = bool(arg) and arg[0] not in ("", "0")
+            continue
+        if in_drawing and not drawing:
+            continue
+        texts.append(token[1])
+    return "".join(texts).replace("\\N", "\n").replace("\\n", "\n").replace("\\h", "\u00a0")
+
+
+def karaoke(tokens, *args, **kwargs):
+    """
+    获取每个音节的卡拉OK时间
+
+    每个卡拉OK标签（\\k、\\K、\\kf、\\ko）开始一个新的音节，音节的文本为该
+    标签之后、下一个卡拉OK标签之前的纯文本。
+
+    :param tokens: tokenize的结果
+    :return: (相对开始时间, 持续时间, 标签名, 文本)组成的列表，时间单位为厘秒
+    """
+    syllables = []
+    offset = 0
+    for token in tokens:
+        if token[0] == TEXT:
+            if syllables:
+                syllables[-1][3] += token[1]
+            continue
+        for name, arg in token[2]:
+            if name in KARAOKE_TAGS:
+                try:
+                    duration = int(float(arg[0])) if arg else 0
+                except ValueError:
+                    duration = 0
+                syllables.append([offset, duration, name, ""])
+                offset += duration
+    return [tuple(syllable) for syllable in syllables]
+
+
+class TokenCache(object):
+    """
+    按uid缓存Text的解析结果
+
+    读取时会比较缓存的Text与当前Text，Text被修改后会自动重新解析，不需
+    要手动使缓存失效。
+    """
+    def __init__(self):
+        self.__cache = {}
+
+    def get(self, uid, text):
+        """获取uid对应Text的token列表"""
+        entry = self.__cache.get(uid)
+        if entry is None or entry[0] is not text and entry[0] != text:
+            entry = (text, tokenize(text))
+            self.__cache[uid] = entry
+        return entry[1]
+
+    def invalidate(self, uid=None):
+        """清除缓存，uid为None时清除全部缓存"""
+        if uid is None:
+            self.__cache.clear()
+        else:
+            self.__cache.pop(uid, None)
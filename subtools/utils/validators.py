@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 # author: "Kairu"
 
+import re
 from .. import exceptions
 
-formats = ("ASS", "SSA", "STR")
+formats = ("ASS", "SSA", "SRT")
 
 def ass_vali(text):
     """
@@ -30,17 +31,31 @@ def ssa_vali(text):
     else:
         return False
 
+def srt_vali(text):
+    """
+    验证是否为合法SRT字幕内容
+
+    :param text: 文本内容
+    :return: True|False
+    """
+    if re.search(r"^\s*\d+:\d{1,2}:\d{1,2}[,.]\d{1,3}\s*-->", text, re.M):
+        return True
+    else:
+        return False
+
 def get_format(text):
     """
     获取字幕格式
 
     :param text: 文本内容
-    :return: ASS|SSA|None
+    :return: ASS|SSA|SRT|None
     """
     if "V4+ Styles" in text:
         return "ASS"
     elif "V4 Styles" in text:
         return "SSA"
+    elif srt_vali(text):
+        return "SRT"
 
 def style_name_validator(style_name, style_lib):
     """
@@ -50,7 +65,6 @@ def style_name_validator(style_name, style_lib):
     :param style_lib: 样式仓库
     :return: 一个包含有效样式的列表或者None
     """
-    from collections import Iterable
     if isinstance(style_name, list):
         style_name = [name for name in style_name if name in style_lib]
         if not style_name:
@@ -61,4 +75,75 @@ def style_name_validator(style_name, style_lib):
         style_name = [style_name]
     else:
         raise exceptions.NoExists("没有找到可匹配的样式名")
-    return style_name
\ No newline at end of file
+    return style_name
+
+# 验证级别
+LEVELS = ("off", "lenient", "strict")
+ERROR = "error"  # 该行在解析时被抛弃
+WARNING = "warning"  # 该行被保留，但内容可能存在问题
+
+
+class Diagnostics(object):
+    """
+    解析时收集的诊断信息
+
+    每条诊断信息为dict：
+    {"line": 行号（从1开始）, "section": 标题, "field": 字段, "reason": 原因, "level": error|warning}
+
+    为了限制内存占用，最多只保存limit条诊断信息，超出的部分只计数。
+    """
+    def __init__(self, level="lenient", limit=1000):
+        if level not in LEVELS:
+            raise ValueError("未知的验证级别：%s" % level)
+        self.level = level
+        self.limit = limit
+        self.items = []
+        self.count = 0  # 诊断信息总数（包含未保存的部分）
+        self.errors = 0  # error的数量
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def ok(self):
+        """是否不存在error"""
+        return not self.errors
+
+    def add(self, line, section, field, reason, level=ERROR):
+        """
+        添加一条诊断信息
+
+        :param line: 行号（从1开始）
+        :param section: 标题，如：Events
+        :param field: 字段名，无法确定时为None
+        :param reason: 原因
+        :param level: error|warning
+        """
+        self.count += 1
+        if level == ERROR:
+            self.errors += 1
+        if len(self.items) < self.limit:
+            self.items.append({"line": line, "section": section, "field": field,
+                               "reason": reason, "level": level})
+
+    def as_text(self):
+        """转换为可读的文本"""
+        lines = ["%s: 第%d行 [%s] %s: %s" % (item["level"], item["line"], item["section"],
+                                             item["field"] or "-", item["reason"])
+                 for item in self.items]
+        if self.count > len(self.items):
+            lines.append("...（另有%d条未保存）" % (self.count - len(self.items)))
+        return "\n".join(lines)
+
+    def check(self):
+        """存在error时触发异常"""
+        if self.errors:
+            first = next((item for item in self.items if item["level"] == ERROR), None)
+            message = "验证字幕内容时发现%d处错误。" % self.errors
+            if first:
+                message = "%s第一处错误：第%d行 [%s] %s: %s" % (message, first["line"], first["section"],
+                                                           first["field"] or "-", first["reason"])
+            raise exceptions.AssValidationError(message, self)
@@ -6,10 +6,807 @@ import sys, os
 import time
 import re
 import io
+import json
+import tempfile
+import collections
+import contextlib
+import shutil
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from subtools.ass import Ass
 
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+#######################################################
+# 不变量检查：python test/test.py --check
+#######################################################
+
+def load(path, **kwargs):
+    ass = Ass(**kwargs)
+    ass.from_file(os.path.join(TEST_DIR, path))
+    ass.parse_all()
+    return ass
+
+
+def event_lines(ass):
+    """event行的多重集合（合并后相同开始时间的event顺序可能不同）"""
+    return collections.Counter(ass.rev_event_line(ass.event_[uid]) for uid in ass.event_uid)
+
+
+SAMPLE_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1280
+PlayResY: 720
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,40,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,20,1
+Style: Sign,Times,30,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,2,0,8,30,30,40,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def sample(*lines):
+    """由event行生成字幕文本"""
+    return SAMPLE_HEADER + "\n".join(lines) + "\n"
+
+
+def dialogue(start, end, text, style="Default", format="Dialogue", layer=0):
+    return "%s: %d,%s,%s,%s,,0,0,0,,%s" % (format, layer, start, end, style, text)
+
+
+def from_str(text, **kwargs):
+    ass = Ass(**kwargs)
+    ass.from_str(text)
+    ass.parse_all()
+    return ass
+
+
+def check_merge_split(path):
+    """按样式、按时间分割后再合并，event以及样式保持不变"""
+    from subtools import merge
+    from subtools.utils.times import str2cs
+
+    src = load(path)
+    end = max(str2cs(src.event_[uid]["End"]) for uid in src.event_uid) + 1
+    with tempfile.TemporaryDirectory() as tmp:
+        parts = [
+            list(merge.split_by_style(os.path.join(TEST_DIR, path), os.path.join(tmp, "style.%(style)s.ass")).values()),
+            list(merge.split_by_time(os.path.join(TEST_DIR, path), [(0, end // 2), (end // 2, end)],
+                                     os.path.join(tmp, "part%(index)d.ass")).values()),
+        ]
+        for num, paths in enumerate(parts):
+            out_path = os.path.join(tmp, "merged%d.ass" % num)
+            count = merge.merge(paths, out_path)
+            merged = load(out_path)
+            starts = [str2cs(merged.event_[uid]["Start"]) for uid in merged.event_uid]
+            assert count == src.event_line_num, (count, src.event_line_num)
+            assert event_lines(merged) == event_lines(src)
+            assert merged.rev_style_lines() == src.rev_style_lines()
+            assert starts == sorted(starts)
+
+
+def copy(ass):
+    """复制文档（保留uid）"""
+    new = Ass()
+    new.from_json(ass.as_json())
+    return new
+
+
+def check_diff_patch(old_path, new_path, **kwargs):
+    """diff生成的补丁经过json序列化后应用到原文档，得到新文档"""
+    old = load(old_path, **kwargs)
+    # 删除、移动、修改以及插入event
+    edited = copy(old)
+    order = edited.text_dict["Events"]["order"]
+    events = edited.text_dict["Events"]["event"]
+    del events[order.pop(0)]
+    order.insert(0, order.pop())
+    events[order[5]]["Text"] += "{\\i1}edited"
+    events["inserted"] = dict(events[order[1]])
+    order.insert(3, "inserted")
+
+    for new in (edited, load(new_path, **kwargs)):
+        patch = json.loads(json.dumps(old.diff(new)))
+        target = copy(old)
+        target.apply_patch(patch)
+        assert target.as_str() == new.as_str()
+    assert not old.diff(copy(old))["ops"]
+
+
+def check_async(path):
+    """异步读取、解析、保存的结果与同步相同，解析可以在线程或者进程中进行"""
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    src = load(path)
+
+    async def run(out_path, executor):
+        ass = Ass()
+        await ass.afrom_file(os.path.join(TEST_DIR, path))
+        await ass.aparse_all(executor)
+        await ass.asave2file(out_path)
+        return ass
+
+    with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor(1) as executor:
+        out_path = os.path.join(tmp, "out.ass")
+        for pool in (None, executor):
+            ass = asyncio.run(run(out_path, pool))
+            assert ass.as_str() == src.as_str()
+            with open(out_path, encoding="utf-8") as f:
+                assert f.read() == src.as_str()
+
+
+def check_lazy_imports(*modules):
+    """导入subtools.ass时不加载只在部分功能中使用的模块（-S：不受site-packages中.pth文件的影响）"""
+    import subprocess
+
+    code = "import sys; from subtools.ass import Ass; print(' '.join(m for m in %r if m in sys.modules))" % (modules,)
+    res = subprocess.run([sys.executable, "-S", "-c", code], cwd=os.path.dirname(TEST_DIR),
+                         stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert not res.stdout.strip(), res.stdout
+
+
+def check_tokenizer():
+    """特效标签的解析、纯文本、卡拉OK时间以及缓存"""
+    from subtools.utils import tokenizer
+
+    text = "{\\pos(1,2)\\t(0,100,\\fs20\\clip(1,2,3,4))\\k20}ka{\\kf30\\fnArial}ra\\Nok{\\p1}m 0 0 l 1 1{\\p0}\\he"
+    tokens = tokenizer.tokenize(text)
+    assert [token[0] for token in tokens] == [tokenizer.OVERRIDE, tokenizer.TEXT, tokenizer.OVERRIDE, tokenizer.TEXT,
+                                              tokenizer.OVERRIDE, tokenizer.TEXT, tokenizer.OVERRIDE, tokenizer.TEXT]
+    assert tokens[0][2] == (("pos", ("1", "2")), ("t", ("0", "100", "\\fs20\\clip(1,2,3,4)")), ("k", ("20",)))
+    assert tokens[2][2] == (("kf", ("30",)), ("fn", ("Arial",)))
+    assert tokenizer.parse_tags("\\fscx120\\fs30\\alpha&H80&\\an7\\1c&HFF&") == (
+        ("fscx", ("120",)), ("fs", ("30",)), ("alpha", ("&H80&",)), ("an", ("7",)), ("1c", ("&HFF&",)))
+    assert tokenizer.plain_text(tokens) == "kara\nok\u00a0e"
+    assert tokenizer.plain_text(tokens, drawing=True) == "kara\nokm 0 0 l 1 1\u00a0e"
+    assert tokenizer.karaoke(tokens) == [(0, 20, "k", "ka"), (20, 30, "kf", "ra\\Nokm 0 0 l 1 1\\he")]
+
+    cache = tokenizer.TokenCache()
+    assert cache.get("a", text) is cache.get("a", text)
+    assert cache.get("a", "plain") == ((tokenizer.TEXT, "plain"),)
+
+    ass = load("11.ass")
+    uid = next(uid for uid in ass.event_uid if ass.event_[uid]["Text"].startswith("{\\k26}胸"))
+    assert ass.plain_texts([uid])[uid] == "胸に残る言葉 記憶も"
+    assert ass.karaoke_timings([uid])[uid][:2] == [(24836, 24862, "k", "胸"), (24862, 24882, "k", "に")]
+    ass.event_[uid]["Text"] = "{\\b1}edited"
+    assert ass.plain_texts([uid])[uid] == "edited"
+
+
+def check_convert():
+    """ASS、SSA、SRT之间的转换"""
+    from subtools import convert
+    from subtools.stream import SrtWriter
+
+    ass_text = sample(dialogue("0:00:01.00", "0:00:02.50", "{\\i1}one{\\i0}\\Ntwo\\hthree"),
+                      dialogue("0:00:03.00", "0:00:04.00", "{\\p1}m 0 0 l 1 1{\\p0}"),
+                      dialogue("0:00:05.00", "0:00:06.00", "comment", format="Comment"),
+                      dialogue("1:00:00.00", "1:00:01.20", "<b>bold</b>", "Sign"))
+    srt = io.StringIO()
+    assert convert.convert(io.StringIO(ass_text), srt, "ASS", "SRT") == 4
+    assert srt.getvalue() == ("1\n00:00:01,000 --> 00:00:02,500\n<i>one</i>\ntwo\u00a0three\n\n"
+                              "2\n01:00:00,000 --> 01:00:01,200\n<b>bold</b>\n\n")
+    assert SrtWriter.ass2srt_text("{\\b1\\fs20}a{\\b0}") == "<b>a</b>"
+
+    back = io.StringIO()
+    assert convert.convert(io.StringIO(srt.getvalue()), back, "SRT", "ASS") == 2
+    ass = from_str(back.getvalue())
+    assert [ass.event_[uid]["Text"] for uid in ass.event_uid] == ["{\\i1}one{\\i0}\\Ntwo\u00a0three",
+                                                                  "{\\b1}bold{\\b0}"]
+    assert [ass.event_[uid]["End"] for uid in ass.event_uid] == ["0:00:02.50", "1:00:01.20"]
+    # 直接读取SRT时先转换为ASS
+    assert from_str(srt.getvalue()).as_str() == ass.as_str()
+
+    ssa_text = ("[Script Info]\nScriptType: v4.00\n\n[V4 Styles]\n"
+                "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, TertiaryColour, BackColour, "
+                "Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, AlphaLevel, Encoding\n"
+                "Style: *Default,Arial,20,16777215,255,65280,0,-1,0,1,2,2,6,10,10,10,0,1\n\n[Events]\n"
+                "Format: Marked, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+                "Dialogue: Marked=0,0:00:01.00,0:00:02.00,*Default,,0000,0000,0000,,ssa\n")
+    out = io.StringIO()
+    assert convert.convert(io.StringIO(ssa_text), out, "SSA", "ASS") == 1
+    ass = from_str(out.getvalue())
+    style = ass.style_[ass.style_uid[0]]
+    assert (style["Name"], style["OutlineColour"], style["Bold"], style["Alignment"]) == (
+        "Default", "&H0000FF00", "-1", "8")
+    event = ass.event_[ass.event_uid[0]]
+    assert (event["Layer"], event["Style"], event["Text"]) == ("0", "Default", "ssa")
+
+
+def check_diagnostics():
+    """诊断信息包含行号、级别以及字段，strict模式下触发AssValidationError"""
+    import asyncio
+    from subtools.exceptions import AssValidationError
+
+    text = sample(dialogue("0:00:01.00", "0:00:02.00", "ok"),
+                  dialogue("0:00:0x.00", "0:00:02.00", "bad start"),
+                  dialogue("0:00:01.00", "0:00:02.00", "unknown style", "Missing"))
+    text = text.replace("Style: Sign,Times,30,", "Style: Sign,Times,big,")
+    expected = [(9, "error", "V4+ Styles", "Fontsize"), (14, "error", "Events", "Start"),
+                (15, "warning", "Events", "Style")]
+
+    def summary(ass):
+        return [(item["line"], item["level"], item["section"], item["field"]) for item in ass.diagnostics]
+
+    ass = Ass()
+    ass.from_str(text)
+    ass.parse_all("lenient")
+    assert summary(ass) == expected
+    assert not ass.diagnostics.ok
+    # 不合法的行被抛弃，样式不存在的event被保留
+    assert ass.style_names == ["Default"] and ass.event_line_num == 2
+
+    ass = Ass()
+    ass.from_str(text)
+    try:
+        ass.parse_all("strict")
+    except AssValidationError as e:
+        assert [item["line"] for item in e.diagnostics] == [9, 14, 15]
+    else:
+        raise AssertionError("strict模式下没有触发AssValidationError")
+
+    ass = Ass()
+    ass.from_str(text)
+    ass.parse_all()
+    assert ass.diagnostics is None and ass.event_line_num == 2
+
+    # 异步解析时同样返回诊断信息
+    ass = Ass()
+    ass.from_str(text)
+    asyncio.run(ass.aparse_all(validate="lenient"))
+    assert summary(ass) == expected
+    try:
+        asyncio.run(ass.aparse_all(validate="strict"))
+    except AssValidationError:
+        pass
+    else:
+        raise AssertionError("strict模式下没有触发AssValidationError")
+
+
+def check_zero_copy(path):
+    """零拷贝模式的解析结果以及生成的文本与普通模式相同"""
+    import asyncio
+    import pickle
+    from subtools.utils.offsets import OffsetRecord
+
+    normal, zero = load(path), load(path, zero_copy=True)
+    assert zero.as_str() == normal.as_str()
+    assert [dict(zero.event_[uid]) for uid in zero.event_uid] == [normal.event_[uid] for uid in normal.event_uid]
+    assert all(isinstance(zero.event_[uid], OffsetRecord) for uid in zero.event_uid)
+    assert type(pickle.loads(pickle.dumps(zero.event_[zero.event_uid[0]]))) is dict
+    assert json.loads(zero.as_json())["Events"]["event"][zero.event_uid[0]] == dict(zero.event_[zero.event_uid[0]])
+
+    events = [normal.event_[normal.event_uid[3]], zero.event_[zero.event_uid[3]]]
+    for event in events:
+        event["Text"] = "edited"
+        del event["Effect"]
+    assert dict(events[1]) == events[0] and "Effect" not in events[1]
+    for event in events:
+        event["Effect"] = "fx"
+    assert zero.as_str() == normal.as_str()
+
+    # 在线程中异步解析时保留零拷贝模式
+    ass = Ass(zero_copy=True)
+    ass.from_file(os.path.join(TEST_DIR, path))
+    asyncio.run(ass.aparse_all())
+    assert all(isinstance(ass.event_[uid], OffsetRecord) for uid in ass.event_uid)
+    assert ass.as_str() == load(path).as_str()
+
+
+def check_intern(path):
+    """document、process模式下相同的字段值只保存一份，off模式下不复用"""
+    import asyncio
+
+    def styles(ass):
+        return [ass.event_[uid]["Style"] for uid in ass.event_uid]
+
+    def shared(values):
+        first = {}
+        return all(first.setdefault(value, value) is value for value in values)
+
+    for intern in ("document", "process"):
+        assert shared(styles(load(path, intern=intern)))
+    assert shared(styles(load(path, intern="process")) + styles(load(path, intern="process")))
+    off = load(path, intern="off")
+    assert not shared(styles(off))
+    assert off.as_str() == load(path).as_str()
+
+    for intern, expected in (("document", True), ("off", False)):
+        ass = Ass(intern=intern)
+        ass.from_file(os.path.join(TEST_DIR, path))
+        asyncio.run(ass.aparse_all())
+        assert shared(styles(ass)) is expected
+
+
+def check_parallel(path):
+    """多进程解析event的结果（包括诊断信息）与单进程相同"""
+    single = Ass()
+    single.from_file(os.path.join(TEST_DIR, path))
+    single.parse_all("lenient", jobs=1)
+    multi = Ass()
+    multi.from_file(os.path.join(TEST_DIR, path))
+    multi.parse_all("lenient", jobs=2)
+    assert multi.as_str() == single.as_str()
+    assert list(multi.diagnostics) == list(single.diagnostics)
+
+
+def check_schema():
+    """编译后的解析、反向解析与诊断"""
+    from subtools.parselib import AssParse
+
+    format_line = "Format: " + ", ".join(list(AssParse.STYLE_INFO)[1:])
+    line = "Style: Default,Arial,40,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,20,1"
+    formats, matcher = AssParse.style_matcher(format_line)
+    assert AssParse.style_matcher(format_line)[1] is matcher
+    values = matcher.search(line).groupdict()
+    assert AssParse.STYLE_SCHEMA.serializer(formats)(values) == line
+    assert AssParse.STYLE_SCHEMA.diagnose(line.replace(",40,", ",big,"), formats) == (
+        "Fontsize", "字段内容不合法：big")
+
+    AssParse.register_script_key("X Custom Key", r"\d+")
+    ass = from_str(SAMPLE_HEADER.replace("PlayResY: 720", "PlayResY: 720\nX Custom Key: 42"))
+    assert ass.scripts["X Custom Key"]["value"] == "42"
+    assert "X Custom Key: 42" in ass.rev_script_lines()
+
+
+def check_store(path):
+    """导入SQLite后按条件查询、修改，导出的内容与原字幕相同"""
+    from subtools.store import EventStore
+    from subtools.utils.times import str2cs, cs2str
+
+    src = load(path)
+    styles = collections.Counter(src.event_[uid]["Style"] for uid in src.event_uid)
+    style = styles.most_common(1)[0][0]
+    with EventStore() as store:
+        assert store.load(os.path.join(TEST_DIR, path)) == src.event_line_num
+        assert store.to_ass().as_str() == src.as_str()
+        assert store.import_ass(src) == src.event_line_num
+        assert store.count() == src.event_line_num
+        assert store.count(style=style) == styles[style]
+
+        assert store.shift(150, style=style) == styles[style]
+        shifted = [event["Start"] for event in store.query(style=style)]
+        assert shifted == [cs2str(str2cs(src.event_[uid]["Start"]) + 150)
+                           for uid in src.event_uid if src.event_[uid]["Style"] == style]
+        assert store.shift(-150, style=style) == styles[style]
+        assert store.count(start=0, end="0:00:01.50") == sum(
+            1 for uid in src.event_uid if str2cs(src.event_[uid]["Start"]) < 150)
+
+        output = io.StringIO()
+        assert store.save2file(output) == src.event_line_num
+        assert output.getvalue() == src.as_str()
+
+
+def check_records(path):
+    """列形式的导出（NumPy与列表、已解析与未解析）结果相同，导入后event不变"""
+    from subtools import records
+
+    src = load(path)
+    expected = src.as_records(numpy=False)
+    unparsed = Ass()
+    unparsed.from_file(os.path.join(TEST_DIR, path))
+    results = [unparsed.as_records(numpy=False), records.read_records(os.path.join(TEST_DIR, path), numpy=False)[1]]
+    results.append(src.as_records())  # 可以导入NumPy时使用NumPy
+    assert len(expected) == src.event_line_num
+    for result in results:
+        assert result.categories == expected.categories
+        for key in expected.columns:
+            assert list(result[key]) == list(expected[key]), key
+        new = Ass()
+        new.from_records(result, src)
+        assert new.as_str() == src.as_str()
+    assert list(records.to_events(expected)) == [dict(src.event_[uid]) for uid in src.event_uid]
+
+
+def check_daemon(path):
+    """守护进程的解析结果与直接解析相同"""
+    import threading
+    from subtools.daemon import Daemon, Client
+    from subtools.exceptions import DaemonError
+
+    src = load(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon = Daemon(os.path.join(tmp, "subtools.sock"), jobs=1)
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        client = Client(daemon.path, timeout=60)
+        try:
+            for _ in range(600):
+                try:
+                    assert client.ping()["jobs"] == 1
+                    break
+                except DaemonError:
+                    time.sleep(0.05)
+            text, info = client.call("dump", path=os.path.join(TEST_DIR, path))
+            assert text == src.as_str() and info["events"] == src.event_line_num
+            text, info = client.call("parse", path=os.path.join(TEST_DIR, path))
+            assert text is None and info["events"] == src.event_line_num
+            try:
+                client.call("dump", path=os.path.join(tmp, "missing.ass"))
+            except DaemonError:
+                pass
+            else:
+                raise AssertionError("读取不存在的文件时没有触发DaemonError")
+        finally:
+            client.shutdown()
+            thread.join()
+        assert not os.path.exists(daemon.path)
+
+
+def check_cli(path):
+    """命令行的convert、retime与直接调用的结果相同"""
+    from subtools import cli, convert
+    from subtools.utils.times import str2cs
+
+    src = load(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path = os.path.join(tmp, os.path.basename(path))
+        shutil.copy(os.path.join(TEST_DIR, path), in_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert cli.main(["convert", "--to", "srt", "-q", tmp]) == 0
+            assert cli.main(["retime", "--offset", "1.5", "-q", in_path]) == 0
+            assert cli.main(["stats", "-q", in_path]) == 0
+
+        expected = io.StringIO()
+        convert.convert(os.path.join(TEST_DIR, path), expected, "ASS", "SRT")
+        stem = os.path.splitext(in_path)[0]
+        with open(stem + ".srt", encoding="utf-8") as f:
+            assert f.read() == expected.getvalue()
+        retimed = load(stem + ".retime.ass")
+        assert [str2cs(retimed.event_[uid]["Start"]) for uid in retimed.event_uid] == [
+            str2cs(src.event_[uid]["Start"]) + 150 for uid in src.event_uid]
+        assert sorted(os.listdir(tmp)) == sorted(os.path.basename(name) for name in (
+            in_path, stem + ".srt", stem + ".retime.ass"))
+
+
+def check_atomic_open():
+    """先写入临时文件再替换，新文件的权限与open创建的文件相同，已有文件保留原来的权限"""
+    from subtools.utils import data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "plain.txt")
+        open(plain_path, "w").close()
+        new_path = os.path.join(tmp, "new.txt")
+        with data.atomic_open(new_path) as f:
+            f.write("new")
+        assert os.stat(new_path).st_mode == os.stat(plain_path).st_mode
+        os.chmod(new_path, 0o600)
+        try:
+            with data.atomic_open(new_path) as f:
+                f.write("failed")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with open(new_path, encoding="utf-8") as f:
+            assert f.read() == "new"
+        with data.atomic_open(new_path) as f:
+            f.write("replaced")
+        assert os.stat(new_path).st_mode & 0o777 == 0o600
+        assert sorted(os.listdir(tmp)) == ["new.txt", "plain.txt"]
+
+
+def check_snap():
+    """NumPy与bisect的吸附结果相同，结束时间早于开始时间的event保持不变"""
+    from subtools.records import load_numpy
+    from subtools.timing import Snapper, Timecodes
+
+    timecodes = Timecodes.from_fps(24000 / 1001, 3000)
+    keyframes = [0, 24, 100, 250, 251, 1000, 2999]
+    starts = list(range(0, 13000, 37)) + [1030, 1050]
+    ends = [start + 150 for start in starts[:-2]] + [1100, 1040]
+    for frames in (False, True):
+        snapper = Snapper(keyframes, timecodes, frames=frames, numpy=False)
+        result = snapper.snap(starts, ends)
+        assert snapper.snap(*result) == result
+        if load_numpy() is not None:
+            assert Snapper(keyframes, timecodes, frames=frames, numpy=True).snap(starts, ends) == result
+        # 第250帧（10427ms）为关键帧，第264帧（11011ms）为帧边界；1050-1040吸附后结束时间早于开始时间，保持不变
+        assert (result[0][-2], result[1][-2]) == (1043, 1102 if frames else 1100)
+        assert (result[0][-1], result[1][-1]) == (1050, 1040)
+    # 只吸附到帧边界时，超出视频范围的时间保持不变
+    snapper = Snapper(timecodes=timecodes, frames=True, numpy=False)
+    assert snapper.snap([1001, 900000], [1003, 900001]) == ([1001, 900000], [1001, 900001])
+
+
+def check_qc():
+    """链式重叠、闪烁以及过短的间隔"""
+    from subtools import qc
+
+    def event(start, end, style="Default", format="Dialogue"):
+        return {"Format": format, "Start": start, "End": end, "Style": style, "Layer": "0"}
+
+    events = [
+        ("A", event("0:00:00.00", "0:00:03.00")),
+        ("B", event("0:00:02.00", "0:00:05.00")),
+        ("C", event("0:00:04.50", "0:00:06.00")),
+        ("D", event("0:00:06.10", "0:00:06.12")),
+        ("E", event("0:00:07.00", "0:00:08.00")),
+        ("F", event("0:00:00.50", "0:00:01.00", "Sign")),
+        ("G", event("0:00:07.50", "0:00:07.51", format="Comment")),
+    ]
+    assert qc.find_issues(events, min_duration=10, min_gap=20) == [
+        {"type": qc.OVERLAP, "style": "Default", "layer": "0", "start": 200, "end": 500, "events": ["A", "B", "C"]},
+        {"type": qc.GAP, "style": "Default", "layer": "0", "start": 600, "end": 610, "events": ["C", "D"]},
+        {"type": qc.FLASH, "style": "Default", "layer": "0", "start": 610, "end": 612, "events": ["D"]},
+    ]
+    assert [item["type"] for item in qc.find_issues(events)] == [qc.OVERLAP]
+    # 同时检查Comment时，G与E重叠
+    assert [(item["type"], item["start"], item["events"]) for item in qc.find_issues(events, 10, 20, None)][3:] == [
+        (qc.FLASH, 750, ["G"]), (qc.OVERLAP, 750, ["E", "G"])]
+
+
+def check_dedup(path):
+    """只有位置相同的event才视为重复"""
+    from subtools import dedup
+
+    ass = load(path)
+    assert not dedup.find_duplicates(ass)
+    assert not dedup.remove_duplicates(ass)
+    assert ass.event_line_num == load(path).event_line_num
+
+    ass = from_str(sample(dialogue("0:00:01.00", "0:00:02.00", "{\\bord2}same  text"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\bord4}same text"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\pos(10,10)}same text"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\pos(20,10)}same text"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\pos(20, 10)\\blur1}same\\Ntext"),
+                          dialogue("0:00:01.00", "0:00:02.00", "same text", "Sign")))
+    uids = ass.event_uid
+    first = {uids[1]: uids[0], uids[4]: uids[3]}
+    assert dedup.find_duplicates(ass) == first
+    assert dedup.find_duplicates(ass, normalize=False) == {}
+    assert dedup.find_duplicates_across([ass, ass]) == [((0, uid), (0, first[uid])) for uid in first] + [
+        ((1, uid), (0, first.get(uid, uid))) for uid in uids]
+    assert dedup.remove_duplicates(ass) == [uids[1], uids[4]]
+    assert ass.event_uid == [uids[0], uids[2], uids[3], uids[5]]
+
+
+def check_memory_phases(path):
+    """按阶段测量内存，与基准比较"""
+    sys.path.insert(0, os.path.join(os.path.dirname(TEST_DIR), "benchmarks"))
+    import memory_phases
+
+    phases, events = memory_phases.measure_phases(os.path.join(TEST_DIR, path))
+    assert events == load(path).event_line_num
+    assert sorted(phases) == sorted(memory_phases.PHASES)
+    assert all(peak >= 0 for peak, _ in phases.values())
+    result = {"phases": phases, "events": events}
+    assert not memory_phases.compare(path, result, {path: result}, memory_phases.TOLERANCE)
+    grown = {"phases": {phase: (peak * 2 + memory_phases.NOISE_BYTES + 1, retained)
+                        for phase, (peak, retained) in phases.items()}, "events": events}
+    assert len(memory_phases.compare(path, grown, {path: result}, memory_phases.TOLERANCE)) == len(phases)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scaled = load(memory_phases.make_scaled(os.path.join(TEST_DIR, path), 3, tmp))
+        assert scaled.event_line_num == events * 3
+
+
+def check_snapshot(path):
+    """快照只读，与原文档互不影响，并且可以在多个线程中同时读取"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from subtools.utils.offsets import RecordLayout
+
+    for zero_copy in (False, True):
+        ass = load(path, zero_copy=zero_copy)
+        text, data = ass.as_str(), json.loads(ass.as_json())
+        snapshot = ass.snapshot()
+        uid = ass.event_uid[0]
+        for func in (lambda: snapshot.event_[uid].__setitem__("Text", "x"),
+                     lambda: snapshot.event_uid.append("x"),
+                     lambda: snapshot.text_dict.__setitem__("furigana", 1)):
+            try:
+                func()
+            except (TypeError, AttributeError):
+                pass
+            else:
+                raise AssertionError("快照被修改")
+        ass.event_[uid]["Text"] = "edited"
+        assert snapshot.as_str() == text
+        assert json.loads(snapshot.as_json()) == data
+
+        thawed = snapshot.thaw()
+        thawed.event_[uid]["Text"] = "thawed"
+        assert snapshot.as_str() == text
+
+        # 快照（只读）与原文档之间比较
+        assert ass.diff(ass.snapshot()) == {"base": ass.diff(ass)["base"], "sections": {}, "ops": []}
+        assert not ass.snapshot().diff(ass)["ops"]
+
+        with ThreadPoolExecutor(4) as executor:
+            assert set(executor.map(lambda _: snapshot.as_str(), range(8))) == {text}
+
+    # 多个线程交替读取同一个RecordLayout中的不同记录
+    layout = RecordLayout("a,b\nc,d\n", re.compile(r"(?P<x>\w),(?P<y>\w)"))
+    errors = []
+
+    def read(start, expected):
+        for _ in range(20000):
+            if layout.values(start, start + 3) != expected:
+                errors.append(start)
+                return
+
+    threads = [threading.Thread(target=read, args=item) for item in ((0, {"x": "a", "y": "b"}),
+                                                                     (4, {"x": "c", "y": "d"}))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def check_fonts():
+    """按\\fn、\\b、\\i、\\r覆盖后的字体与字符，不包含绘图指令以及Comment"""
+    ass = from_str(sample(dialogue("0:00:01.00", "0:00:02.00", "{\\fnFoo}ab{\\b1}c{\\r}d{\\p1}m 0 0{\\p0}\\he\\N"),
+                          dialogue("0:00:01.00", "0:00:02.00", "x{\\rSign}y{\\i1}z", "Missing"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\fn@Bar}w", "Sign"),
+                          dialogue("0:00:01.00", "0:00:02.00", "comment", format="Comment")))
+    usage = ass.font_usage()
+    assert usage == {
+        "Foo": {(False, False): set(map(ord, "ab")), (True, False): {ord("c")}},
+        "Arial": {(False, False): set(map(ord, "d\u00a0ex"))},
+        "Times": {(True, False): {ord("y")}, (True, True): {ord("z")}},
+        "Bar": {(True, False): {ord("w")}},
+    }
+    assert set(ass.font_usage(formats=None)["Arial"][(False, False)]) >= set(map(ord, "coment"))
+
+
+def check_follower():
+    """追加的不完整行在写完后才解析，每条event只返回一次"""
+    from subtools.stream import AssFollower
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "live.ass")
+        received = []
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_HEADER[:SAMPLE_HEADER.rindex("Format:") + 10])
+        follower = AssFollower(path, callback=received.extend)
+        assert follower.poll() == [] and follower.ass is None
+
+        def append(text):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(text)
+            return [event["Text"] for _, event in follower.poll()]
+
+        first = dialogue("0:00:01.00", "0:00:02.00", "一")
+        second = dialogue("0:00:02.00", "0:00:03.00", "二")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_HEADER + first[:10])
+        assert follower.poll() == [] and follower.ass is not None
+        assert append(first[10:]) == []
+        assert append("\n" + second[:-1]) == ["一"]
+        assert append("") == []
+        assert append(second[-1:] + "\n\n") == ["二"]
+        assert append(dialogue("0:00:03.00", "0:00:04.00", "三") + "\n[Fonts]\n" + first + "\n") == ["三"]
+        assert [event["Text"] for _, event in received] == ["一", "二", "三"]
+        assert [follower.ass.event_[uid]["Text"] for uid in follower.ass.event_uid] == ["一", "二", "三"]
+
+
+def check_export(path):
+    """流式导出的json与as_json相同，分页以及按时间范围导出"""
+    from subtools.utils.times import str2cs
+
+    ass = load(path)
+    assert "".join(ass.iter_json(chunk_size=100)) == ass.as_json()
+    page = json.loads("".join(ass.iter_json_page(1, 10)))
+    assert page["Events"]["order"] == ass.event_uid[10:20]
+    assert list(page["Events"]["event"]) == ass.event_uid[10:20]
+    assert page["page"] == {"offset": 10, "count": 10, "total": ass.event_line_num}
+
+    start, end = 6000, 12000
+    page = json.loads("".join(ass.iter_json_page(start=start, end=end)))
+    assert page["Events"]["order"] == [uid for uid in ass.event_uid
+                                       if str2cs(ass.event_[uid]["Start"]) < end
+                                       and (str2cs(ass.event_[uid]["End"]) > start
+                                            or str2cs(ass.event_[uid]["Start"]) >= start)]
+    assert page["page"]["count"] == len(page["Events"]["order"]) > 0
+
+
+def check_compression(path):
+    """读写gzip、bz2、xz压缩的字幕，压缩格式在写入时根据扩展名、读取时根据文件内容判断"""
+    from subtools.stream import AssReader
+    from subtools.utils import data
+
+    src = load(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext, magic in ((".gz", b"\x1f\x8b"), (".bz2", b"BZh"), (".xz", b"\xfd7zXZ\x00")):
+            out_path = os.path.join(tmp, "out.ass" + ext)
+            src.save2file(out_path)
+            with open(out_path, "rb") as f:
+                assert f.read(len(magic)) == magic
+            renamed = os.path.join(tmp, "renamed.ass")
+            os.replace(out_path, renamed)
+            assert load(renamed).as_str() == src.as_str()
+            with AssReader(renamed) as reader:
+                assert sum(1 for _ in reader) == src.event_line_num
+
+            with data.atomic_open(out_path) as f:
+                f.write(src.as_str())
+            assert load(out_path).as_str() == src.as_str()
+        assert sorted(os.listdir(tmp)) == ["out.ass.bz2", "out.ass.gz", "out.ass.xz", "renamed.ass"]
+
+
+def check_layout():
+    """layout_tags与tokenizer.parse_tags的结果一致，以及已知event的定位点"""
+    from subtools.layout import layout_tags, LAYOUT_TAGS
+    from subtools.records import load_numpy
+    from subtools.utils import data, tokenizer
+
+    blocks = 0
+    for name in sorted(os.listdir(TEST_DIR)):
+        if not name.endswith(".ass"):
+            continue
+        text = data.from_file(os.path.join(TEST_DIR, name), "utf-8")
+        for re_res in tokenizer.BLOCK_RE.finditer(text):
+            block = re_res.group()[1:-1]
+            expected = [tag for tag in tokenizer.parse_tags(block) if tag[0] in LAYOUT_TAGS]
+            assert layout_tags(block) == expected, block
+            blocks += 1
+    assert blocks > 10000
+
+    ass = load("11.ass")
+    layout = ass.layout(numpy=False)
+    rows = {}
+    for num, uid in enumerate(layout.uids):
+        rows.setdefault(ass.event_[uid]["Text"], layout.row(num))
+    row = rows[next(text for text in rows if text.startswith("{\\pos(1177.144,110.329)"))]
+    assert (row["X"], row["Y"], row["Positioned"]) == (1177.144, 110.329, True)
+    row = rows["{\\k26}胸{\\k20}に{\\k33}残{\\k33}る{\\k18}言{\\k47}葉{\\k1} {\\k25}記{\\k28}憶{\\k27}も"]
+    # TEXT JP - OP：底部居中，垂直边距30
+    assert (row["Alignment"], row["X"], row["Y"], row["Positioned"]) == (2, 640, 690, False)
+    if load_numpy() is not None:
+        assert list(ass.layout(numpy=True)["Y"]) == list(layout["Y"])
+
+    ass = from_str(sample(dialogue("0:00:01.00", "0:00:02.00", "{\\an7\\an3\\fs10}a{\\fs99}b"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\t(\\pos(1,1))\\move(5,6,7,8)}a", "Sign"),
+                          dialogue("0:00:01.00", "0:00:02.00", "{\\a10\\rSign}a")))
+    rows = [ass.layout(numpy=False).row(num) for num in range(3)]
+    assert [(row["Alignment"], row["X"], row["Y"], row["Fontsize"]) for row in rows] == [
+        (7, 10, 20, 10.0), (8, 5, 6, 30.0), (5, 640, 360, 30.0)]
+
+
+CHECKS = [
+    (check_merge_split, ("11.ass",), {}),
+    (check_diff_patch, ("2.ass", "11.ass"), {}),
+    (check_async, ("2.ass",), {}),
+    (check_lazy_imports, ("requests", "xmltodict", "chardet", "urllib.request", "asyncio"), {}),
+    (check_tokenizer, (), {}),
+    (check_convert, (), {}),
+    (check_diagnostics, (), {}),
+    (check_diff_patch, ("2.ass", "11.ass"), {"zero_copy": True}),
+    (check_zero_copy, ("11.ass",), {}),
+    (check_intern, ("11.ass",), {}),
+    (check_parallel, ("11.ass",), {}),
+    (check_schema, (), {}),
+    (check_store, ("2.ass",), {}),
+    (check_records, ("11.ass",), {}),
+    (check_daemon, ("2.ass",), {}),
+    (check_cli, ("2.ass",), {}),
+    (check_atomic_open, (), {}),
+    (check_lazy_imports, ("tempfile", "shutil", "argparse"), {}),
+    (check_snap, (), {}),
+    (check_qc, (), {}),
+    (check_dedup, ("11.ass",), {}),
+    (check_memory_phases, ("2.ass",), {}),
+    (check_snapshot, ("2.ass",), {}),
+    (check_fonts, (), {}),
+    (check_follower, (), {}),
+    (check_export, ("11.ass",), {}),
+    (check_compression, ("2.ass",), {}),
+    (check_lazy_imports, ("gzip", "bz2", "lzma"), {}),
+    (check_layout, (), {}),
+]
+
+if "--check" in sys.argv:
+    for func, args, kwargs in CHECKS:
+        func(*args, **kwargs)
+        print("ok   %s%s%s" % (func.__name__, args, " %s" % kwargs if kwargs else ""))
+    sys.exit(0)
+
 appid = open("../appid.txt", 'r', encoding='utf-8').read()
 
 file_path0 = "./Macross Ai Oboete Imasu Ka.ass"